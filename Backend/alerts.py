@@ -0,0 +1,292 @@
+"""Alert rules evaluated incrementally as samples arrive.
+
+Three kinds of rule, each for one node or for every node (``node_id`` None):
+
+    threshold  metric op value, e.g. temperature > 35
+    rate       change of the metric over ``window_s`` seconds, e.g.
+               |humidity delta| > 20 per 600 s
+    silence    no sample from the node for ``value`` seconds
+
+A condition must hold for ``for_s`` seconds before the alert fires
+(debouncing), and a firing threshold/rate alert resolves only once the
+signal is back past the limit by ``hysteresis``, so a value hovering at the
+limit doesn't flap.  Only transitions produce events: one "firing", then
+one "resolved".
+
+Rules are indexed by (node_id, metric) and (None, metric), so a sample
+evaluates only the rules that apply to its node: the cost per sample does
+not grow with the number of rules for other nodes.  Silence rules are kept
+in a deadline heap that ``tick`` pops, instead of scanning every node.
+
+Events go to sinks, any object with ``send(event)``: ``LogSink``,
+``WebhookSink`` (POSTs JSON from a background thread, or just records the
+payloads when no URL is set) and ``StreamSink`` (``alert`` events on
+/stream).
+"""
+
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+import heapq
+import itertools
+import json
+import logging
+import math
+import queue
+import threading
+import urllib.request
+
+logger = logging.getLogger(__name__)
+
+KINDS = ("threshold", "rate", "silence")
+METRICS = ("temperature", "humidity")
+OPS = (">", "<")
+RECENT_EVENTS = 500
+
+
+class Rule:
+    __slots__ = ("id", "kind", "metric", "op", "value", "node_id", "for_s", "hysteresis", "window_s")
+
+    def __init__(self, id: str, kind: str, value: float, metric: Optional[str] = None, op: str = ">",
+                 node_id: Optional[str] = None, for_s: float = 0, hysteresis: float = 0,
+                 window_s: float = 600):
+        if kind not in KINDS:
+            raise ValueError(f"kind must be one of {', '.join(KINDS)}")
+        if kind != "silence" and metric not in METRICS:
+            raise ValueError(f"metric must be one of {', '.join(METRICS)}")
+        if op not in OPS:
+            raise ValueError(f"op must be one of {' '.join(OPS)}")
+        for name, number in (("value", value), ("for_s", for_s), ("hysteresis", hysteresis), ("window_s", window_s)):
+            if isinstance(number, bool) or not isinstance(number, (int, float)) or not math.isfinite(number):
+                raise ValueError(f"invalid {name}")
+        if for_s < 0 or hysteresis < 0 or window_s <= 0 or (kind == "silence" and value <= 0):
+            raise ValueError("for_s and hysteresis must be >= 0, window_s and silence value > 0")
+        self.id = str(id)
+        self.kind = kind
+        self.metric = metric if kind != "silence" else None
+        self.op = op
+        self.value = float(value)
+        self.node_id = None if node_id is None else str(node_id)
+        self.for_s = for_s
+        self.hysteresis = hysteresis
+        self.window_s = window_s
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Rule":
+        if not isinstance(data, dict):
+            raise ValueError("rule must be an object")
+        unknown = set(data) - set(cls.__slots__)
+        if unknown:
+            raise ValueError(f"unknown rule fields: {', '.join(sorted(unknown))}")
+        try:
+            return cls(**data)
+        except TypeError:
+            raise ValueError("rule needs at least id, kind and value")
+
+    def to_dict(self) -> Dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def breached(self, signal: float) -> bool:
+        return signal > self.value if self.op == ">" else signal < self.value
+
+    def cleared(self, signal: float) -> bool:
+        # Hysteresis: resolve only once the signal is back past the limit by that much
+        if self.op == ">":
+            return signal <= self.value - self.hysteresis
+        return signal >= self.value + self.hysteresis
+
+
+class RuleState:
+    """Per (rule, node) evaluation state."""
+
+    __slots__ = ("active", "pending_since", "window", "deadline")
+
+    def __init__(self):
+        self.active = False
+        self.pending_since: Optional[int] = None
+        self.window: Optional[Deque[Tuple[int, float]]] = None  # rate rules: (ts, value)
+        self.deadline: Optional[int] = None                    # silence rules: ms
+
+
+class AlertEngine:
+    """Rule index and per-node state; not thread-safe (the backend calls it
+    under its store lock and dispatches the returned events outside it)."""
+
+    def __init__(self, sinks: Iterable = (), recent: int = RECENT_EVENTS):
+        self.sinks = list(sinks)
+        self.rules: Dict[str, Rule] = {}
+        # (node_id or None, metric or "silence") -> rules
+        self._index: Dict[Tuple[Optional[str], str], List[Rule]] = {}
+        self._states: Dict[Tuple[str, str], RuleState] = {}
+        # (deadline ms, tiebreak, rule id, node id); stale entries are skipped on pop
+        self._deadlines: List[Tuple[int, int, str, str]] = []
+        self._counter = itertools.count()
+        self.recent: Deque[Dict] = deque(maxlen=recent)
+
+    def add_rule(self, rule: Rule) -> None:
+        self.remove_rule(rule.id)
+        self.rules[rule.id] = rule
+        self._index.setdefault((rule.node_id, rule.metric or "silence"), []).append(rule)
+
+    def remove_rule(self, rule_id: str) -> Optional[Rule]:
+        rule = self.rules.pop(rule_id, None)
+        if rule is None:
+            return None
+        key = (rule.node_id, rule.metric or "silence")
+        self._index[key].remove(rule)
+        if not self._index[key]:
+            del self._index[key]
+        for state_key in [k for k in self._states if k[0] == rule_id]:
+            del self._states[state_key]
+        return rule
+
+    def _rules_for(self, node_id: str, metric: str) -> List[Rule]:
+        return self._index.get((node_id, metric), []) + self._index.get((None, metric), [])
+
+    def _state(self, rule: Rule, node_id: str) -> RuleState:
+        key = (rule.id, node_id)
+        state = self._states.get(key)
+        if state is None:
+            state = self._states[key] = RuleState()
+        return state
+
+    def _event(self, rule: Rule, node_id: str, state: str, ts: int, signal: Optional[float]) -> Dict:
+        event = {"rule": rule.id, "kind": rule.kind, "node_id": node_id, "state": state,
+                 "ts": ts, "metric": rule.metric, "value": signal, "limit": rule.value}
+        self.recent.append(event)
+        return event
+
+    def _evaluate(self, rule: Rule, node_id: str, state: RuleState, ts: int,
+                  signal: float, events: List[Dict]) -> None:
+        if state.active:
+            if rule.cleared(signal):
+                state.active = False
+                state.pending_since = None
+                events.append(self._event(rule, node_id, "resolved", ts, signal))
+            return
+        if not rule.breached(signal):
+            state.pending_since = None
+            return
+        if state.pending_since is None:
+            state.pending_since = ts
+        if ts - state.pending_since >= rule.for_s * 1000:
+            state.active = True
+            events.append(self._event(rule, node_id, "firing", ts, signal))
+
+    def observe(self, node_id: str, ts: int, temperature: float, humidity: float) -> List[Dict]:
+        """Evaluate the rules that apply to one sample; returns alert events."""
+        events: List[Dict] = []
+        for metric, value in (("temperature", temperature), ("humidity", humidity)):
+            if not math.isfinite(value):
+                continue  # dropouts are the anomaly detector's business
+            for rule in self._rules_for(node_id, metric):
+                state = self._state(rule, node_id)
+                signal = value
+                if rule.kind == "rate":
+                    if state.window is None:
+                        state.window = deque()
+                    window = state.window
+                    window.append((ts, value))
+                    while ts - window[0][0] > rule.window_s * 1000:
+                        window.popleft()
+                    signal = abs(value - window[0][1])
+                self._evaluate(rule, node_id, state, ts, signal, events)
+        for rule in self._rules_for(node_id, "silence"):
+            state = self._state(rule, node_id)
+            if state.active:
+                state.active = False
+                events.append(self._event(rule, node_id, "resolved", ts, None))
+            if state.deadline is None:
+                heapq.heappush(self._deadlines, (ts + int(rule.value * 1000), next(self._counter), rule.id, node_id))
+            state.deadline = ts + int(rule.value * 1000)
+        return events
+
+    def tick(self, now: int) -> List[Dict]:
+        """Fire silence rules whose deadline has passed."""
+        events: List[Dict] = []
+        while self._deadlines and self._deadlines[0][0] <= now:
+            deadline, _, rule_id, node_id = heapq.heappop(self._deadlines)
+            state = self._states.get((rule_id, node_id))
+            if state is None or state.deadline is None:
+                continue  # rule removed
+            if state.deadline > deadline:
+                # A sample arrived since this entry was pushed: requeue at the new deadline
+                heapq.heappush(self._deadlines, (state.deadline, next(self._counter), rule_id, node_id))
+                continue
+            state.deadline = None
+            rule = self.rules[rule_id]
+            # Silence has no "for" period of its own: the deadline already is one
+            state.active = True
+            events.append(self._event(rule, node_id, "firing", now, None))
+        return events
+
+    def active(self) -> List[Dict]:
+        return [{"rule": rule_id, "node_id": node_id} for (rule_id, node_id), state in self._states.items()
+                if state.active]
+
+    def forget_node(self, node_id: str) -> None:
+        for key in [k for k in self._states if k[1] == node_id]:
+            del self._states[key]
+
+    def dispatch(self, events: List[Dict]) -> None:
+        for event in events:
+            for sink in self.sinks:
+                try:
+                    sink.send(event)
+                except Exception:
+                    logger.exception("alert sink %r failed", sink)
+
+
+class LogSink:
+    def send(self, event: Dict) -> None:
+        level = logging.WARNING if event["state"] == "firing" else logging.INFO
+        logger.log(level, "alert %s %s for node %s (value %s, limit %s)", event["rule"], event["state"],
+                   event["node_id"], event["value"], event["limit"])
+
+
+class WebhookSink:
+    """POSTs each event as JSON to ``url`` from a background thread.
+
+    Without a URL it is a stand-in that only keeps the last payloads in
+    ``sent``, for development and tests.
+    """
+
+    def __init__(self, url: Optional[str] = None, timeout: float = 5.0, queue_size: int = 1000):
+        self.url = url
+        self.timeout = timeout
+        self.sent: Deque[bytes] = deque(maxlen=100)
+        self.dropped = 0
+        self._queue: "queue.Queue[bytes]" = queue.Queue(maxsize=queue_size)
+        if url:
+            threading.Thread(target=self._worker, name="alert-webhook", daemon=True).start()
+
+    def send(self, event: Dict) -> None:
+        payload = json.dumps(event, separators=(",", ":")).encode()
+        if not self.url:
+            self.sent.append(payload)
+            return
+        try:
+            self._queue.put_nowait(payload)
+        except queue.Full:
+            self.dropped += 1
+
+    def _worker(self) -> None:
+        while True:
+            payload = self._queue.get()
+            request = urllib.request.Request(self.url, data=payload, method="POST",
+                                             headers={"Content-Type": "application/json"})
+            try:
+                with urllib.request.urlopen(request, timeout=self.timeout):
+                    pass
+                self.sent.append(payload)
+            except OSError as e:
+                logger.warning("alert webhook %s failed: %s", self.url, e)
+
+
+class StreamSink:
+    """Publishes events to /stream subscribers of the node as ``alert`` events."""
+
+    def __init__(self, hub):
+        self.hub = hub
+
+    def send(self, event: Dict) -> None:
+        self.hub.publish({event["node_id"]: {k: v for k, v in event.items() if k != "node_id"}}, event="alert")
@@ -0,0 +1,307 @@
+"""Streaming anomaly detection for incoming sensor samples.
+
+Every sample that becomes a node's latest value is scored in O(1) against
+that node's state and gets a bitmask of flags:
+
+    *_dropout    NaN/inf or a value the sensor cannot report (a failed DHT
+                 read often comes through as NaN, or as 0 % humidity)
+    *_jump       change since the previous sample larger than
+                 ``max_step + max_rate * dt`` -- physically implausible
+    *_deviation  more than ``z_limit`` standard deviations from the mean of
+                 the node's previous ``window`` samples (rolling z-score)
+    stuck        temperature and humidity both unchanged for ``stuck_run``
+                 samples spanning at least ``stuck_ms``
+
+Samples with a dropout are flagged but don't enter the model, so one bad
+read doesn't also show up as a jump or shift the rolling statistics.
+
+Per-node state lives in flat ``array.array`` columns indexed by a node slot
+(two values per node for per-metric columns, ``window`` per metric for the
+rolling window), about 600 bytes per node with the default window.
+
+``score_columns`` scores a whole history at once with the same rules; it is
+vectorized with NumPy when that is installed and otherwise replays the
+samples through a fresh detector.
+"""
+
+from array import array
+from collections import deque
+from typing import Deque, Dict, List, Optional, Sequence, Tuple
+import math
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency
+    np = None
+
+METRICS = ("temperature", "humidity")
+
+# Flag bits: (dropout, jump, deviation) per metric, then stuck
+DROPOUT = (1, 2)
+JUMP = (4, 8)
+DEVIATION = (16, 32)
+STUCK = 64
+FLAG_NAMES = (
+    (DROPOUT[0], "temperature_dropout"), (DROPOUT[1], "humidity_dropout"),
+    (JUMP[0], "temperature_jump"), (JUMP[1], "humidity_jump"),
+    (DEVIATION[0], "temperature_deviation"), (DEVIATION[1], "humidity_deviation"),
+    (STUCK, "stuck"),
+)
+KINDS = len(FLAG_NAMES)
+
+# Values the DHT11/DHT22 can report; humidity 0 is a failed read
+VALID_RANGE = ((-40.0, 80.0), (0.0, 100.0))
+# Largest plausible change between samples: fixed step + rate per second
+MAX_STEP = (5.0, 15.0)
+MAX_RATE = (0.05, 0.2)
+# Floor for the rolling standard deviation (sensor resolution), per metric
+MIN_STD = (0.5, 1.0)
+
+WINDOW = 30
+Z_LIMIT = 4.0
+STUCK_RUN = 120
+STUCK_MS = 30 * 60 * 1000
+RECENT_EVENTS = 1000
+
+
+def flag_names(flags: int) -> List[str]:
+    return [name for bit, name in FLAG_NAMES if flags & bit]
+
+
+def _zeros(typecode: str, n: int) -> array:
+    return array(typecode, bytes(array(typecode).itemsize * n))
+
+
+def _is_valid(metric: int, value: float) -> bool:
+    low, high = VALID_RANGE[metric]
+    # NaN fails both comparisons; humidity exactly 0 is a failed read
+    return low <= value <= high and not (metric == 1 and value == 0.0)
+
+
+class AnomalyDetector:
+    """Per-node rolling state and anomaly counters.
+
+    Not thread-safe: the backend calls ``observe`` and the readers under
+    its store lock.
+    """
+
+    def __init__(self, window: int = WINDOW, z_limit: float = Z_LIMIT,
+                 stuck_run: int = STUCK_RUN, stuck_ms: int = STUCK_MS,
+                 recent: int = RECENT_EVENTS):
+        self.window = window
+        self.z_limit = z_limit
+        self.stuck_run = stuck_run
+        self.stuck_ms = stuck_ms
+        self.slots: Dict[str, int] = {}
+        self._free: List[int] = []  # slots of forgotten nodes, reused first
+        # One entry per node
+        self.count = array("l")       # valid samples seen
+        self.last_ts = array("q")     # ts of the last valid sample
+        self.run = array("l")         # length of the current unchanged run
+        self.run_start = array("q")   # ts where that run started
+        self.flags = array("H")       # flags of the node's latest sample
+        self.last_anomaly = array("q")
+        # Two entries per node (temperature, humidity)
+        self.last = array("d")
+        self.wsum = array("d")
+        self.wsq = array("d")
+        # KINDS entries per node, 2 * window per node
+        self.counts = array("l")
+        self.values = array("d")
+        # (ts, node_id, flags, temperature, humidity), newest last
+        self.recent: Deque[Tuple[int, str, int, float, float]] = deque(maxlen=recent)
+
+    def _slot(self, node_id: str) -> int:
+        slot = self.slots.get(node_id)
+        if slot is None and self._free:
+            slot = self.slots[node_id] = self._free.pop()
+        elif slot is None:
+            slot = self.slots[node_id] = len(self.count)
+            for column in (self.count, self.last_ts, self.run, self.run_start, self.flags, self.last_anomaly):
+                column.append(0)
+            for column in (self.last, self.wsum, self.wsq):
+                column.extend(_zeros("d", 2))
+            self.counts.extend(_zeros("l", KINDS))
+            self.values.extend(_zeros("d", 2 * self.window))
+        return slot
+
+    def observe(self, node_id: str, ts: int, temperature: float, humidity: float) -> int:
+        """Score one sample, update the node's state and return its flags."""
+        slot = self._slot(node_id)
+        sample = (temperature, humidity)
+        flags = 0
+        for m in (0, 1):
+            if not _is_valid(m, sample[m]):
+                flags |= DROPOUT[m]
+        if not flags:
+            flags = self._update(slot, ts, sample)
+        self.flags[slot] = flags
+        if flags:
+            self.last_anomaly[slot] = ts
+            base = slot * KINDS
+            for k, (bit, _) in enumerate(FLAG_NAMES):
+                if flags & bit:
+                    self.counts[base + k] += 1
+            self.recent.append((ts, node_id, flags, temperature, humidity))
+        return flags
+
+    def _update(self, slot: int, ts: int, sample: Tuple[float, float]) -> int:
+        flags = 0
+        n = self.count[slot]
+        w = self.window
+        if n:
+            dt = max(ts - self.last_ts[slot], 0) / 1000
+            unchanged = True
+            for m in (0, 1):
+                i = 2 * slot + m
+                delta = abs(sample[m] - self.last[i])
+                if delta > MAX_STEP[m] + MAX_RATE[m] * dt:
+                    flags |= JUMP[m]
+                unchanged = unchanged and delta == 0.0
+            if unchanged:
+                self.run[slot] += 1
+            else:
+                self.run[slot] = 1
+                self.run_start[slot] = ts
+        else:
+            self.run[slot] = 1
+            self.run_start[slot] = ts
+        if self.run[slot] >= self.stuck_run and ts - self.run_start[slot] >= self.stuck_ms:
+            flags |= STUCK
+
+        pos = n % w
+        for m in (0, 1):
+            i = 2 * slot + m
+            x = sample[m]
+            if n >= w:
+                # Score against the previous `window` samples, then slide
+                mean = self.wsum[i] / w
+                std = math.sqrt(max(self.wsq[i] / w - mean * mean, 0.0))
+                if abs(x - mean) > self.z_limit * max(std, MIN_STD[m]):
+                    flags |= DEVIATION[m]
+                old = self.values[(slot * 2 + m) * w + pos]
+                self.wsum[i] -= old
+                self.wsq[i] -= old * old
+            self.values[(slot * 2 + m) * w + pos] = x
+            self.wsum[i] += x
+            self.wsq[i] += x * x
+            self.last[i] = x
+        self.count[slot] = n + 1
+        self.last_ts[slot] = ts
+        return flags
+
+    def node_flags(self, node_id: str) -> int:
+        slot = self.slots.get(node_id)
+        return self.flags[slot] if slot is not None else 0
+
+    def summary(self, node_id: str) -> Optional[Dict]:
+        """Current flags, per-kind counts and last anomaly ts of one node."""
+        slot = self.slots.get(node_id)
+        if slot is None:
+            return None
+        base = slot * KINDS
+        return {
+            "flags": flag_names(self.flags[slot]),
+            "counts": {name: self.counts[base + k] for k, (_, name) in enumerate(FLAG_NAMES)
+                       if self.counts[base + k]},
+            "last_anomaly": self.last_anomaly[slot] or None,
+        }
+
+    def anomalous_nodes(self) -> List[str]:
+        """Nodes with at least one anomaly so far."""
+        return [node_id for node_id, slot in self.slots.items() if self.last_anomaly[slot]]
+
+    def forget(self, node_id: str) -> None:
+        """Drop a node; its zeroed slot is handed to the next new node."""
+        slot = self.slots.pop(node_id, None)
+        if slot is None:
+            return
+        self._free.append(slot)
+        for column in (self.count, self.last_ts, self.run, self.run_start, self.flags, self.last_anomaly):
+            column[slot] = 0
+        for m in (0, 1):
+            self.wsum[2 * slot + m] = self.wsq[2 * slot + m] = 0.0
+        for k in range(KINDS):
+            self.counts[slot * KINDS + k] = 0
+
+
+def score_columns(ts: Sequence[int], temperature: Sequence[float], humidity: Sequence[float],
+                  window: int = WINDOW, z_limit: float = Z_LIMIT,
+                  stuck_run: int = STUCK_RUN, stuck_ms: int = STUCK_MS) -> List[int]:
+    """Flags for every sample of one node's history (oldest first)."""
+    if np is None:
+        detector = AnomalyDetector(window, z_limit, stuck_run, stuck_ms, recent=0)
+        return [detector.observe("", t, tv, hv) for t, tv, hv in zip(ts, temperature, humidity)]
+
+    ts = np.asarray(ts, dtype=np.int64)
+    columns = (np.asarray(temperature, dtype=np.float64), np.asarray(humidity, dtype=np.float64))
+    flags = np.zeros(len(ts), dtype=np.int64)
+    valid = np.ones(len(ts), dtype=bool)
+    with np.errstate(invalid="ignore"):
+        for m, x in enumerate(columns):
+            low, high = VALID_RANGE[m]
+            ok = np.isfinite(x) & (x >= low) & (x <= high)
+            if m == 1:
+                ok &= x != 0.0
+            flags[~ok] |= DROPOUT[m]
+            valid &= ok
+
+    # The model only sees valid samples, in order
+    idx = np.flatnonzero(valid)
+    if len(idx) == 0:
+        return flags.tolist()
+    vts = ts[idx]
+    vals = [x[idx] for x in columns]
+    vflags = np.zeros(len(idx), dtype=np.int64)
+
+    dt = np.maximum(np.diff(vts), 0) / 1000
+    changed = np.ones(len(idx), dtype=bool)
+    changed[1:] = False
+    for m, v in enumerate(vals):
+        delta = np.abs(np.diff(v))
+        vflags[1:][delta > MAX_STEP[m] + MAX_RATE[m] * dt] |= JUMP[m]
+        changed[1:] |= delta != 0.0
+
+        if len(v) > window:
+            csum = np.concatenate(([0.0], np.cumsum(v)))
+            csq = np.concatenate(([0.0], np.cumsum(v * v)))
+            mean = (csum[window:-1] - csum[:-window - 1]) / window
+            var = (csq[window:-1] - csq[:-window - 1]) / window - mean * mean
+            std = np.maximum(np.sqrt(np.maximum(var, 0.0)), MIN_STD[m])
+            vflags[window:][np.abs(v[window:] - mean) > z_limit * std] |= DEVIATION[m]
+
+    # Unchanged runs: position within the run and the ts where it started
+    starts = np.flatnonzero(changed)
+    group = np.cumsum(changed) - 1
+    run = np.arange(len(idx)) - starts[group] + 1
+    vflags[(run >= stuck_run) & (vts - vts[starts[group]] >= stuck_ms)] |= STUCK
+
+    flags[idx] = vflags
+    return flags.tolist()
+
+
+if __name__ == "__main__":
+    import random
+    import time
+
+    random.seed(1)
+    n = 20000
+    ts = [i * 2000 for i in range(n)]
+    temp = [25 + random.gauss(0, 0.3) for _ in range(n)]
+    hum = [60 + random.gauss(0, 1.0) for _ in range(n)]
+    temp[5000] = float("nan")
+    temp[8000] += 12
+    hum[12000:12000 + STUCK_RUN + 900] = [55.0] * (STUCK_RUN + 900)
+    temp[12000:12000 + STUCK_RUN + 900] = [24.0] * (STUCK_RUN + 900)
+
+    start = time.perf_counter()
+    detector = AnomalyDetector()
+    streamed = [detector.observe("1", t, tv, hv) for t, tv, hv in zip(ts, temp, hum)]
+    stream_s = time.perf_counter() - start
+    start = time.perf_counter()
+    batch = score_columns(ts, temp, hum)
+    batch_s = time.perf_counter() - start
+
+    print(f"streaming: {stream_s * 1e6 / n:.2f} us/sample, batch ({'numpy' if np else 'python'}): "
+          f"{batch_s * 1e6 / n:.2f} us/sample, same flags: {streamed == batch}")
+    print(detector.summary("1"))
@@ -1,8 +1,11 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
-from typing import Dict
-import time
+from typing import Dict, Optional, Tuple
+import os
+
+from persistence import Persistence
+from timebase import format_ts, now_ms, parse_time_format
 
 app = FastAPI()
 
@@ -15,8 +18,31 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Simple in-memory data store
-sensor_data: Dict[str, Dict] = {}
+# Simple in-memory data store: node -> (epoch ms, temperature, humidity);
+# timestamps are formatted when /data is requested
+sensor_data: Dict[str, Tuple[int, float, float]] = {}
+
+# Set WEATHER_DATA_DIR to keep the latest readings across restarts
+DATA_DIR = os.environ.get("WEATHER_DATA_DIR")
+persistence = Persistence(DATA_DIR) if DATA_DIR else None
+
+
+def restore_reading(node_id, ts, temperature, humidity):
+    sensor_data[node_id] = (int(round(ts * 1000)), temperature, humidity)
+
+
+@app.on_event("startup")
+def load_persisted_data():
+    if persistence is not None:
+        persistence.recover(restore_reading, history_limit=1)
+        persistence.start()
+
+
+@app.on_event("shutdown")
+def close_persistence():
+    if persistence is not None:
+        persistence.close()
+
 
 @app.post("/update")
 async def update_data(request: Request):
@@ -28,17 +54,25 @@ async def update_data(request: Request):
     if not node_id or temperature is None or humidity is None:
         return {"status": "error", "message": "Invalid data"}
 
-    sensor_data[node_id] = {
-        "temperature": temperature,
-        "humidity": humidity,
-        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
-    }
+    now = now_ms()
+    sensor_data[node_id] = (now, temperature, humidity)
+
+    if persistence is not None:
+        persistence.append(node_id, now / 1000, float(temperature), float(humidity))
 
     return {"status": "success", "node": node_id}
 
 @app.get("/data")
-def get_data():
-    return sensor_data
+def get_data(time_format: Optional[str] = None):
+    # ?time_format=local|iso|epoch picks how timestamps are rendered
+    try:
+        time_format = parse_time_format(time_format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        node_id: {"temperature": temp, "humidity": hum, "timestamp": format_ts(ts, time_format)}
+        for node_id, (ts, temp, hum) in list(sensor_data.items())
+    }
 
 
 if __name__ == "__main__":
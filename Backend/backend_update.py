@@ -1,11 +1,46 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
 import uvicorn
-from typing import Dict, List
-from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+import asyncio
+import csv
+import json
+import logging
+import math
+import os
+from collections import OrderedDict
+from itertools import groupby
+from operator import itemgetter
+import threading
+import time
+
+from alerts import AlertEngine, LogSink, Rule, StreamSink, WebhookSink
+from anomaly import AnomalyDetector, flag_names, score_columns
+from binary_protocol import RECORD_SIZE, decode_readings
+from exporter import FORMATS, check_format, iter_export, ms_column
+from fast_json import MEDIA_TYPE, dumps, loads
+from history_encoding import SegmentCache, iter_history_json
+from history_store import HistoryStore
+from metrics import MetricsMiddleware, Registry
+from node_registry import DEFAULT_INTERVAL, OFFLINE, ONLINE, RECLAIM_AFTER, STALE, STATES, NodeRegistry
+from mqtt_bridge import INPUT_TOPIC, OUTPUT_PREFIX, LocalBroker, MqttBridge, PahoBroker
+from history_query import AGGREGATES, aggregate, aligned_series, bucket_axis, bucket_start, select_range
+from rollups import RollupStore, merge_buckets
+from shared_store import DEFAULT_SLOTS, MAX_NODE_ID, SharedStore, SharedStoreFull
+from stream_hub import KEEPALIVE_FRAME, KEEPALIVE_INTERVAL, StreamHub, encode_event
+from timebase import DEFAULT_TIME_FORMAT, ClockSkew, format_ts, now_ms, parse_time_format, to_epoch_ms
+from udp_ingest import UdpIngest, start_udp_ingest
+from persistence import Persistence
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
+# Request latency/status per route, ingest counters and loop lag for /metrics
+metrics = Registry()
+app.add_middleware(MetricsMiddleware, registry=metrics)
+
 # Allow Streamlit frontend
 app.add_middleware(
     CORSMiddleware,
@@ -15,45 +50,967 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-data_store: Dict[str, Dict[str, float]] = {}
-history_log: Dict[str, List[Dict[str, float]]] = {}
+# Samples kept per node in the history ring buffer (WEATHER_HISTORY_CAPACITY, or
+# per node via PUT /nodes/{id}), and their maximum age (s)
+HISTORY_CAPACITY = int(os.environ.get("WEATHER_HISTORY_CAPACITY", "100"))
+MAX_HISTORY_CAPACITY = 1_000_000
+HISTORY_MAX_AGE = 6 * 3600
+
+# Latest (ts in epoch ms, temperature, humidity, anomaly flags) per node;
+# timestamps are formatted only when a response is built (present_record)
+data_store: Dict[str, Tuple[int, float, float, int]] = {}
+
+# Global write counter, and the counter value of each node's last write,
+# ordered oldest -> newest so /data?since= only walks the changed tail
+store_version = 0
+node_versions: "OrderedDict[str, int]" = OrderedDict()
+
+# Store version at which each reclaimed node was dropped, so /data?since=
+# can report it (as null); bounded, oldest entries are forgotten first
+removed_versions: "OrderedDict[str, int]" = OrderedDict()
+MAX_REMOVED_VERSIONS = 10000
+
+# Encoded /data body per time format, and the store_version it was built for
+_snapshot_cache: Dict[str, Tuple[int, bytes]] = {}
+history_log = HistoryStore(default_capacity=HISTORY_CAPACITY, max_age=HISTORY_MAX_AGE * 1000)
+
+# Encoded bytes of settled raw-history segments, reused across /history requests
+history_segments = SegmentCache()
+
+# 1m/1h/1d min/max/sum/count buckets, updated on every sample
+rollup_store = RollupStore()
+store_lock = threading.Lock()
+
+# Pushes changed node records to /stream subscribers
+stream_hub = StreamHub()
+
+# Per-node rolling state for dropout/jump/deviation/stuck detection
+anomaly_detector = AnomalyDetector()
+
+# Threshold/rate/silence alert rules, evaluated on every new latest value.
+# WEATHER_ALERT_RULES names a JSON file with a list of rules to load at startup;
+# WEATHER_ALERT_WEBHOOK is a URL that receives every alert event as a JSON POST
+ALERT_RULES_PATH = os.environ.get("WEATHER_ALERT_RULES")
+ALERT_WEBHOOK = os.environ.get("WEATHER_ALERT_WEBHOOK")
+ALERT_TICK_INTERVAL = 1.0  # seconds between checks for silent nodes
+alert_engine = AlertEngine([LogSink(), StreamSink(stream_hub)] + ([WebhookSink(ALERT_WEBHOOK)] if ALERT_WEBHOOK else []))
+
+# Node liveness (online/stale/offline). WEATHER_NODE_INTERVAL is the expected
+# report interval in seconds (per node via PUT /nodes/{id}); after
+# WEATHER_NODE_RECLAIM seconds of silence a node is dropped from memory
+NODE_INTERVAL = float(os.environ.get("WEATHER_NODE_INTERVAL", DEFAULT_INTERVAL))
+NODE_RECLAIM_AFTER = float(os.environ.get("WEATHER_NODE_RECLAIM", RECLAIM_AFTER))
+NODE_TICK_INTERVAL = 1.0  # seconds between liveness checks
+node_registry = NodeRegistry(NODE_INTERVAL, reclaim_s=NODE_RECLAIM_AFTER)
+
+# Per-node clock offsets, to put node-supplied timestamps on the server clock
+clock_skew = ClockSkew()
+
+# Largest number of records accepted by one /update/batch request
+MAX_BATCH_RECORDS = 10000
+
+# Imported rows parsed before they are sorted and applied in one pass
+IMPORT_CHUNK_ROWS = 50000
+# How far past the server clock an imported timestamp may be (clock skew)
+IMPORT_MAX_AHEAD_MS = 60_000
+
+# Largest epoch-seconds value accepted in a query (the last second of year 9999)
+MAX_QUERY_SECONDS = 253402300799
+
+# Default window for multi-node /history queries without 'from'
+HISTORY_QUERY_WINDOW = 24 * 3600
+
+# Set WEATHER_DATA_DIR to keep samples across restarts (WAL + compacted files)
+DATA_DIR = os.environ.get("WEATHER_DATA_DIR")
+persistence = Persistence(DATA_DIR) if DATA_DIR else None
+
+# Set WEATHER_SHARED_STORE to an mmap file path (e.g. /dev/shm/weather-sensors.tbl)
+# so /data and /stream see the writes of every uvicorn worker; WEATHER_SHARED_SLOTS
+# is the table size for a new file (an existing one keeps its own)
+SHARED_STORE_PATH = os.environ.get("WEATHER_SHARED_STORE")
+SHARED_SLOTS = int(os.environ.get("WEATHER_SHARED_SLOTS", DEFAULT_SLOTS))
+shared_store = SharedStore(SHARED_STORE_PATH, SHARED_SLOTS) if SHARED_STORE_PATH else None
+SHARED_POLL_INTERVAL = 0.1  # seconds between checks for other workers' writes
+
+# Number of uvicorn worker processes (more than 1 needs the shared store). Only the
+# latest value per node is shared: history, rollups, alerts, anomaly state, the node
+# registry and UDP sequence windows stay per process, so those endpoints answer from
+# whichever worker took the request and see only the samples it ingested
+WORKERS = int(os.environ.get("WEATHER_WORKERS", "1"))
+
+# Set WEATHER_UDP_PORT to also accept binary readings as UDP datagrams
+UDP_PORT = int(os.environ.get("WEATHER_UDP_PORT", "0"))
+UDP_HOST = os.environ.get("WEATHER_UDP_HOST", "0.0.0.0")
+udp_ingest: Optional[UdpIngest] = None
+
+# Set WEATHER_MQTT_HOST to a broker host (or "local" for the in-process stand-in)
+# to ingest from sensors/<node_id>/reading and republish to weather/nodes/<node_id>
+MQTT_HOST = os.environ.get("WEATHER_MQTT_HOST")
+MQTT_PORT = int(os.environ.get("WEATHER_MQTT_PORT", "1883"))
+MQTT_INPUT_TOPIC = os.environ.get("WEATHER_MQTT_TOPIC", INPUT_TOPIC)
+MQTT_OUTPUT_PREFIX = os.environ.get("WEATHER_MQTT_OUTPUT", OUTPUT_PREFIX)
+mqtt_bridge: Optional[MqttBridge] = None
+
+
+def present_record(record: Tuple[int, float, float, int], time_format: str = DEFAULT_TIME_FORMAT) -> Dict:
+    ts, temp, hum, flags = record
+    return {"temperature": temp, "humidity": hum, "timestamp": format_ts(ts, time_format),
+            "anomaly": flag_names(flags)}
+
+
+def record_sample(node_id: str, ts: int, temp: float, hum: float, durable: bool = True):
+    record_samples([(node_id, ts, temp, hum)], durable)
+
+
+def record_samples(samples: Iterable[Tuple[str, int, float, float]], durable: bool = True):
+    global store_version
+    # Apply many (node_id, ts in epoch ms, temp, hum) samples with a single lock
+    # acquisition, oldest first so buffered readings land in history order and
+    # don't hide newer values
+    samples = sorted(samples, key=itemgetter(1))
+    changed = {}
+    latest = {}
+    alerts = []
+    revived = []
+    received_at = time.time()
+    received_ms = now_ms()
+    with store_lock:
+        for node_id, ts, temp, hum in samples:
+            if durable:
+                metrics.node_seen(node_id, received_at)
+            # Recovered samples count as reports made at their own time
+            if node_registry.seen(node_id, received_ms if durable else ts) in (STALE, OFFLINE):
+                revived.append(node_id)
+            current = data_store.get(node_id)
+            if current is not None and ts < current[0]:
+                # Late reading: goes into history but doesn't replace the latest value
+                # (and isn't scored, the detector follows each node in time order).
+                # Compared with the live value, not history, which also holds imports
+                history_log.append(node_id, ts, temp, hum)
+                rollup_store.add(node_id, ts, temp, hum)
+                continue
+            flags = anomaly_detector.observe(node_id, ts, temp, hum)
+            alerts.extend(alert_engine.observe(node_id, ts, temp, hum))
+            record = data_store[node_id] = (ts, temp, hum, flags)
+            changed[node_id] = record
+            latest[node_id] = (node_id, ts, temp, hum, flags)
+            store_version += 1
+            node_versions[node_id] = store_version
+            node_versions.move_to_end(node_id)
+            removed_versions.pop(node_id, None)
+
+            # Save to history (for plotting); the ring drops the oldest sample when full
+            history_log.append(node_id, ts, temp, hum)
+            rollup_store.add(node_id, ts, temp, hum)
+
+    if durable and persistence is not None:
+        # The on-disk format keeps float epoch seconds
+        for node_id, ts, temp, hum in samples:
+            persistence.append(node_id, ts / 1000, temp, hum)
+
+    if alerts and durable:
+        # Replayed samples only rebuild rule state; their events went out before the restart
+        alert_engine.dispatch(alerts)
+    if revived:
+        stream_hub.publish({node_id: {"state": ONLINE} for node_id in revived}, event="state")
+    if not changed:
+        return
+    if shared_store is not None:
+        # Other workers' streams pick this up from the table (follow_shared_store)
+        try:
+            shared_store.write_many(latest.values())
+        except SharedStoreFull as e:
+            # The samples are stored; only other workers' views miss them
+            logger.error("shared store: %s (raise WEATHER_SHARED_SLOTS)", e)
+    if shared_store is None or mqtt_bridge is not None:
+        updates = {node_id: present_record(record) for node_id, record in changed.items()}
+        if shared_store is None:
+            stream_hub.publish(updates)
+        if mqtt_bridge is not None:
+            mqtt_bridge.publish_updates(updates)
+
+
+def check_node_id(node_id: str) -> str:
+    # Node ids must fit a shared-store slot, whichever store is in use
+    if len(node_id.encode("utf-8")) > MAX_NODE_ID:
+        raise ValueError(f"node_id longer than {MAX_NODE_ID} bytes")
+    return node_id
+
+
+def parse_ts(ts) -> Optional[float]:
+    # Optional node timestamp, epoch seconds or milliseconds
+    if ts is not None and (isinstance(ts, bool) or not isinstance(ts, (int, float))
+                           or not math.isfinite(ts) or ts < 0):
+        raise ValueError("invalid ts")
+    return ts
+
+
+def parse_reading(record) -> Tuple[str, Optional[float], float, float]:
+    # (node_id, node ts or None, temperature, humidity); the caller stamps the
+    # readings of one request together (clock_skew.stamp_many)
+    if not isinstance(record, dict):
+        raise ValueError("record must be an object")
+    node_id = record.get("node_id")
+    if node_id is None or node_id == "":
+        raise ValueError("missing node_id")
+    values = []
+    for key in ("temperature", "humidity"):
+        value = record.get(key)
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+            raise ValueError(f"invalid {key}")
+        values.append(float(value))
+    return check_node_id(str(node_id)), parse_ts(record.get("ts")), values[0], values[1]
+
+
+@app.on_event("startup")
+async def bind_stream_hub():
+    stream_hub.bind(asyncio.get_running_loop())
+    asyncio.get_running_loop().create_task(metrics.monitor_loop_lag())
+    if shared_store is not None:
+        asyncio.get_running_loop().create_task(follow_shared_store())
+
+
+def shared_records(rows, time_format: str = DEFAULT_TIME_FORMAT) -> Dict[str, Optional[Dict]]:
+    # Removed rows (None) stay None
+    return {
+        node_id: present_record(row[1:], time_format) if row is not None else None
+        for node_id, row in rows.items()
+    }
+
+
+async def follow_shared_store():
+    # Count writes made by any worker as reports in this worker's node registry
+    # (starting with every row already in the table) and publish them to this
+    # worker's /stream subscribers
+    seen = 0
+    while True:
+        if shared_store.version != seen:
+            version, rows = await asyncio.to_thread(shared_store.read_since, seen)
+            # Removals are published by each worker's own expire_nodes
+            rows = {node_id: row for node_id, row in rows.items() if row is not None}
+            seen = max([version] + [row[0] for row in rows.values()])
+            with store_lock:
+                for node_id, row in rows.items():
+                    node_registry.seen(node_id, row[1])
+            if stream_hub.subscribers:
+                stream_hub.publish(shared_records(rows))
+        await asyncio.sleep(SHARED_POLL_INTERVAL)
+
+
+def reclaim_node(node_id: str):
+    # Free everything held for a node the registry gave up on; call under store_lock
+    global store_version
+    data_store.pop(node_id, None)
+    node_versions.pop(node_id, None)
+    history_log.remove(node_id)
+    rollup_store.remove(node_id)
+    anomaly_detector.forget(node_id)
+    alert_engine.forget_node(node_id)
+    metrics.forget_node(node_id)
+    clock_skew.forget(node_id)
+    history_segments.forget(node_id)
+    store_version += 1
+    removed_versions[node_id] = store_version
+    removed_versions.move_to_end(node_id)
+    if len(removed_versions) > MAX_REMOVED_VERSIONS:
+        removed_versions.popitem(last=False)
+
+
+@app.on_event("startup")
+async def start_node_expiry():
+    asyncio.get_running_loop().create_task(expire_nodes())
+
+
+async def expire_nodes():
+    while True:
+        await asyncio.sleep(NODE_TICK_INTERVAL)
+        with store_lock:
+            transitions, reclaimed = node_registry.advance(now_ms())
+            for node_id in reclaimed:
+                reclaim_node(node_id)
+        if reclaimed:
+            for node_id in reclaimed:
+                if udp_ingest is not None:
+                    udp_ingest.forget(node_id)
+                if mqtt_bridge is not None:
+                    mqtt_bridge.forget_node(node_id)
+            if shared_store is not None:
+                # Every worker reclaims the node; the first removal frees its slot
+                await asyncio.to_thread(shared_store.remove, reclaimed)
+            # The shared-store snapshot is keyed by the table version, which moves only
+            # in the worker that freed the slot
+            _snapshot_cache.clear()
+            stream_hub.publish({node_id: {} for node_id in reclaimed}, event="remove")
+        if transitions:
+            stream_hub.publish({node_id: {"state": state} for node_id, state in transitions}, event="state")
+
+
+@app.on_event("startup")
+async def start_alerts():
+    if ALERT_RULES_PATH:
+        with open(ALERT_RULES_PATH) as f:
+            for rule in json.load(f):
+                alert_engine.add_rule(Rule.from_dict(rule))
+    asyncio.get_running_loop().create_task(check_silent_nodes())
+
+
+async def check_silent_nodes():
+    while True:
+        await asyncio.sleep(ALERT_TICK_INTERVAL)
+        with store_lock:
+            events = alert_engine.tick(now_ms())
+        alert_engine.dispatch(events)
+
+
+@app.on_event("startup")
+def load_persisted_data():
+    if persistence is None:
+        return
+    # Samples older than the raw history only rebuild the rollup tiers, as far
+    # back as the longest tier keeps buckets
+    persistence.recover(
+        lambda node_id, ts, temp, hum: record_sample(node_id, int(round(ts * 1000)), temp, hum, durable=False),
+        history_limit=HISTORY_CAPACITY,
+        backfill=lambda node_id, ts, temp, hum: rollup_store.add(node_id, int(round(ts * 1000)), temp, hum),
+        backfill_since=time.time() - rollup_store.horizon(),
+        imported=lambda node_id, ts, temp, hum: restore_imported(node_id, int(round(ts * 1000)), temp, hum),
+    )
+    persistence.start()
+
+
+@app.on_event("startup")
+async def start_udp_listener():
+    global udp_ingest
+    if UDP_PORT:
+        # Workers share the port (SO_REUSEPORT); each keeps its own sequence windows
+        udp_ingest = await start_udp_ingest(record_samples, clock_skew.stamp_many, UDP_HOST, UDP_PORT,
+                                            reuse_port=WORKERS > 1)
+
+
+@app.on_event("startup")
+def start_mqtt_bridge():
+    global mqtt_bridge
+    if not MQTT_HOST:
+        return
+    if MQTT_HOST == "local":
+        broker = LocalBroker()
+    else:
+        broker = PahoBroker(MQTT_HOST, MQTT_PORT, client_id=f"weather-backend-{os.getpid()}")
+    mqtt_bridge = MqttBridge(broker, record_samples, parse_reading, clock_skew.stamp_many,
+                             MQTT_INPUT_TOPIC, MQTT_OUTPUT_PREFIX)
+    mqtt_bridge.start()
+
+
+@app.on_event("shutdown")
+def close_mqtt_bridge():
+    if mqtt_bridge is not None:
+        mqtt_bridge.close()
+
+
+@app.on_event("shutdown")
+async def close_udp_listener():
+    if udp_ingest is not None:
+        await udp_ingest.close()
+
+
+@app.on_event("shutdown")
+def close_persistence():
+    if persistence is not None:
+        persistence.close()
+
 
 @app.post("/update")
 def update_data(payload: Dict):
     node_id = str(payload["node_id"])
-    temp = payload["temperature"]
-    hum = payload["humidity"]
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-    data_store[node_id] = {
-        "temperature": temp,
-        "humidity": hum,
-        "timestamp": timestamp,
-    }
+    temp = float(payload["temperature"])
+    hum = float(payload["humidity"])
+    try:
+        check_node_id(node_id)
+        ts = parse_ts(payload.get("ts"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    # Save to history (for plotting)
-    if node_id not in history_log:
-        history_log[node_id] = []
-    history_log[node_id].append({
-        "time": timestamp,
-        "temperature": temp,
-        "humidity": hum
-    })
-
-    # Limit history length
-    if len(history_log[node_id]) > 100:
-        history_log[node_id].pop(0)
+    record_sample(node_id, clock_skew.stamp(node_id, ts, now_ms()), temp, hum)
 
     return {"status": "success", "node_id": node_id}
 
+@app.post("/update/batch")
+async def update_batch(request: Request):
+    # Accepts a JSON array of readings, or NDJSON (one reading per line)
+    body = await request.body()
+    try:
+        if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+            records = [loads(line) for line in body.splitlines() if line.strip()]
+        else:
+            records = loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Malformed JSON")
+    if not isinstance(records, list):
+        raise HTTPException(status_code=400, detail="Expected a list of readings")
+    if len(records) > MAX_BATCH_RECORDS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_RECORDS} readings per batch")
+
+    readings = []
+    results: List[Dict] = []
+    for record in records:
+        try:
+            reading = parse_reading(record)
+        except ValueError as e:
+            results.append({"status": "error", "message": str(e)})
+            continue
+        readings.append(reading)
+        results.append({"status": "success", "node_id": reading[0]})
+
+    samples = clock_skew.stamp_many(readings, now_ms())
+    record_samples(samples)
+
+    return {"accepted": len(samples), "rejected": len(records) - len(samples), "results": results}
+
+@app.post("/update/binary")
+async def update_binary(request: Request):
+    # Fixed 13-byte readings back to back (see binary_protocol.py); ts 0 means "now"
+    body = await request.body()
+    if not body or len(body) % RECORD_SIZE:
+        raise HTTPException(status_code=400, detail=f"Body must be a non-empty multiple of {RECORD_SIZE} bytes")
+    if len(body) // RECORD_SIZE > MAX_BATCH_RECORDS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_RECORDS} readings per request")
+
+    readings, rejected = decode_readings(body)
+    record_samples(clock_skew.stamp_many([(node_id, ts, temp, hum) for node_id, _, ts, temp, hum in readings],
+                                         now_ms()))
+
+    return {"accepted": len(readings), "rejected": rejected}
+
+def parse_import_line(line: bytes, ndjson: bool, now: int) -> Tuple[str, int, float, float]:
+    # One backfill row: an NDJSON object, or CSV node_id,ts,temperature,humidity;
+    # ts may not be later than ``now`` (epoch ms) plus IMPORT_MAX_AHEAD_MS
+    if ndjson:
+        record = loads(line)
+        if not isinstance(record, dict):
+            raise ValueError("record must be an object")
+        fields = [record.get(key) for key in ("node_id", "ts", "temperature", "humidity")]
+    else:
+        text = line.decode("utf-8").strip()
+        fields = next(csv.reader([text])) if '"' in text else text.split(",")
+        if len(fields) != 4:
+            raise ValueError("expected node_id,ts,temperature,humidity")
+    node_id = fields[0]
+    if node_id is None or node_id == "":
+        raise ValueError("missing node_id")
+    try:
+        ts, temp, hum = (float(v) for v in fields[1:])
+    except (TypeError, ValueError):
+        raise ValueError("ts, temperature and humidity must be numbers")
+    if not (math.isfinite(ts) and math.isfinite(temp) and math.isfinite(hum)) or ts <= 0:
+        raise ValueError("invalid value")
+    # Also catches microsecond timestamps, and values too large for the ms columns
+    ts = to_epoch_ms(ts)
+    if ts > now + IMPORT_MAX_AHEAD_MS:
+        raise ValueError("ts is in the future")
+    return str(node_id), ts, temp, hum
+
+
+def import_samples(samples: List[Tuple[str, int, float, float]]):
+    # Backfill: one pass over the rows sorted by (node, ts) feeds every rollup tier;
+    # only the newest rows of a node that fit its raw ring can survive there,
+    # so only those are appended. The live view (/data, liveness, anomalies,
+    # alerts) is left alone: these readings are history, not news.
+    samples.sort(key=itemgetter(0, 1))
+    for node_id, rows in groupby(samples, key=itemgetter(0)):
+        rows = list(rows)
+        with store_lock:
+            for _, ts, temp, hum in rows:
+                rollup_store.add(node_id, ts, temp, hum)
+            for _, ts, temp, hum in rows[-history_log.capacity(node_id):]:
+                history_log.append(node_id, ts, temp, hum)
+        if persistence is not None:
+            # Kept apart from the WAL, so a restart doesn't replay them as live readings
+            persistence.write_imported(node_id, [(ts / 1000, temp, hum) for _, ts, temp, hum in rows])
+
+
+def restore_imported(node_id: str, ts: int, temp: float, hum: float):
+    # Recovery of an imported sample: history only, like import_samples
+    with store_lock:
+        history_log.append(node_id, ts, temp, hum)
+        rollup_store.add(node_id, ts, temp, hum)
+
+
+def to_ms(seconds: Optional[float], name: str = "time") -> Optional[int]:
+    # Query parameters are epoch seconds; the stores use epoch milliseconds.
+    # NaN, infinities and values past MAX_QUERY_SECONDS are a 400, not a 500
+    if seconds is None:
+        return None
+    if not (math.isfinite(seconds) and 0 <= seconds <= MAX_QUERY_SECONDS):
+        raise HTTPException(status_code=400, detail=f"{name} must be between 0 and {MAX_QUERY_SECONDS} seconds")
+    return int(round(seconds * 1000))
+
+
+def query_time_format(time_format: Optional[str]) -> str:
+    try:
+        return parse_time_format(time_format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.post("/import")
+async def import_history(request: Request):
+    # Bulk backfill of past readings, streamed: NDJSON (Content-Type:
+    # application/x-ndjson) or CSV rows node_id,ts,temperature,humidity with an
+    # optional header. ts (epoch s or ms) is required and kept as given
+    ndjson = request.headers.get("content-type", "").startswith("application/x-ndjson")
+    imported = rejected = 0
+    errors: List[str] = []
+    pending: List[Tuple[str, int, float, float]] = []
+    tail = b""
+
+    def parse(lines):
+        # Runs in a worker thread, one body chunk at a time, to keep the loop free
+        nonlocal rejected
+        now = now_ms()
+        for number, line in lines:
+            if not line.strip() or (not ndjson and line.startswith(b"node_id")):
+                continue
+            try:
+                pending.append(parse_import_line(line, ndjson, now))
+            except ValueError as e:
+                rejected += 1
+                if len(errors) < 10:
+                    errors.append(f"line {number}: {e}")
+
+    line_no = 0
+    async for chunk in request.stream():
+        lines = (tail + chunk).split(b"\n")
+        tail = lines.pop()
+        await asyncio.to_thread(parse, enumerate(lines, line_no + 1))
+        line_no += len(lines)
+        if len(pending) >= IMPORT_CHUNK_ROWS:
+            batch, pending = pending, []
+            await asyncio.to_thread(import_samples, batch)
+            imported += len(batch)
+    await asyncio.to_thread(parse, [(line_no + 1, tail)])
+    if pending:
+        await asyncio.to_thread(import_samples, pending)
+        imported += len(pending)
+    return {"imported": imported, "rejected": rejected, "errors": errors}
+
+def query_states(state: Optional[str]) -> Optional[set]:
+    if state is None:
+        return None
+    states = {s for s in state.split(",") if s}
+    if not states or not states <= set(STATES):
+        raise HTTPException(status_code=400, detail=f"state must be one or more of {', '.join(STATES)}")
+    return states
+
+
+def read_nodes(since: Optional[int], time_format: str = DEFAULT_TIME_FORMAT, states: Optional[set] = None):
+    """Return (version, nodes, cached body) for /data.
+
+    ``nodes`` is None when the cached encoded snapshot is still current.
+    Nodes reclaimed after ``since`` map to None.  With ``states`` only nodes
+    in those liveness states are returned (never from the cache).
+    """
+    cached_version, body = _snapshot_cache.get(time_format, (-1, b""))
+    if states is not None:
+        cached_version = -1
+    if shared_store is not None:
+        version = shared_store.version
+        if since is None and cached_version == version:
+            return version, None, body
+        version, rows = shared_store.read_since(since or 0)
+        with store_lock:
+            # Removed rows are reported to ?since= clients only; a row this worker
+            # reclaimed but hasn't freed yet is hidden by the registry
+            rows = {n: row for n, row in rows.items()
+                    if (row is None and since is not None) or
+                    (row is not None and node_registry.state(n) in (states if states is not None else STATES))}
+        return version, shared_records(rows, time_format), None
+
+    with store_lock:
+        version = store_version
+        if since is not None:
+            delta = {}
+            for node_id in reversed(node_versions):
+                if node_versions[node_id] <= since:
+                    break
+                delta[node_id] = data_store[node_id]
+            for node_id in reversed(removed_versions):
+                if removed_versions[node_id] <= since:
+                    break
+                delta[node_id] = None
+        elif cached_version == version:
+            return version, None, body
+        else:
+            delta = dict(data_store)
+        if states is not None:
+            delta = {n: r for n, r in delta.items() if r is None or node_registry.state(n) in states}
+    # Format outside the lock
+    return version, {n: present_record(r, time_format) if r is not None else None
+                     for n, r in delta.items()}, None
+
+
 @app.get("/data")
-def get_data():
-    return data_store
+def get_data(request: Request, since: Optional[int] = None, time_format: Optional[str] = None,
+             state: Optional[str] = None):
+    # ETag is the store version: unchanged data answers If-None-Match with 304,
+    # and ?since=<version> returns only the nodes written (or, as null, removed)
+    # after that version. ?time_format=local|iso|epoch picks how timestamps are
+    # rendered, ?state=online,stale keeps only nodes in those liveness states
+    time_format = query_time_format(time_format)
+    states = query_states(state)
+    # Read before the data: a transition in between makes the next tag differ
+    changes = node_registry.changes
+    version, nodes, body = read_nodes(since, time_format, states)
+
+    etag = f'"{version}"'
+    if states is not None:
+        # Liveness transitions don't move the store version, so they go in the tag
+        etag = f'"{version}.{changes}"'
+    headers = {"ETag": etag, "X-Data-Version": str(version)}
+    if_none_match = request.headers.get("if-none-match", "")
+    if headers["ETag"] in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+
+    if nodes is not None:
+        body = dumps(nodes)
+        if since is None and states is None:
+            _snapshot_cache[time_format] = (version, body)
+    return Response(content=body, media_type=MEDIA_TYPE, headers=headers)
+
+@app.get("/metrics")
+def get_metrics():
+    # Prometheus text format
+    with store_lock:
+        samples = history_log.sample_count()
+        history_bytes = history_log.memory_bytes()
+        rollup_bytes = rollup_store.memory_bytes()
+        nodes = len(data_store)
+        anomalous = sum(1 for record in data_store.values() if record[3])
+        liveness = node_registry.counts()
+        node_samples = dict(metrics.node_samples)
+        node_last_seen = dict(metrics.node_last_seen)
+    gauges = {
+        "weather_nodes": ("Nodes with a latest value.", nodes),
+        "weather_store_samples": ("Raw samples held in history.", samples),
+        "weather_store_history_bytes": ("Bytes preallocated for raw history.", history_bytes),
+        "weather_store_rollup_bytes": ("Bytes preallocated for rollup tiers.", rollup_bytes),
+        "weather_stream_subscribers": ("Connected /stream clients.", len(stream_hub.subscribers)),
+        "weather_anomalous_nodes": ("Nodes whose latest sample is flagged as anomalous.", anomalous),
+        "weather_nodes_online": ("Nodes reporting within their expected interval.", liveness[ONLINE]),
+        "weather_nodes_stale": ("Nodes that missed a few expected reports.", liveness[STALE]),
+        "weather_nodes_offline": ("Nodes silent long enough to count as offline.", liveness[OFFLINE]),
+    }
+    if mqtt_bridge is not None:
+        bridge = mqtt_bridge.stats()
+        gauges.update({
+            "weather_mqtt_messages": ("MQTT messages received by the bridge.", bridge["received"]),
+            "weather_mqtt_rejected": ("MQTT messages dropped as malformed.", bridge["rejected"]),
+        })
+    if udp_ingest is not None:
+        udp = udp_ingest.stats()
+        windows = udp["nodes"].values()
+        gauges.update({
+            "weather_udp_datagrams": ("UDP datagrams received.", udp["datagrams"]),
+            "weather_udp_malformed": ("UDP datagrams with a bad length.", udp["malformed"]),
+            "weather_udp_dropped": ("UDP readings dropped while the store was behind.", udp["dropped"]),
+            "weather_udp_duplicates": ("UDP readings dropped as duplicates.", sum(w["duplicates"] for w in windows)),
+            "weather_udp_missing": ("UDP readings missing from sequence gaps.", sum(w["missing"] for w in windows)),
+        })
+    body = metrics.render(gauges, node_samples, node_last_seen)
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+@app.get("/nodes")
+def get_nodes(state: Optional[str] = None, time_format: Optional[str] = None):
+    # Liveness of every known node; ?state=stale,offline lists the ones in trouble
+    states = query_states(state)
+    time_format = query_time_format(time_format)
+    with store_lock:
+        nodes = [(node_id, info.state, info.first_seen, info.last_seen, node_registry.interval(node_id))
+                 for node_id, info in node_registry.nodes.items()
+                 if states is None or info.state in states]
+    return Response(dumps({
+        node_id: {"state": node_state, "first_seen": format_ts(first, time_format),
+                  "last_seen": format_ts(last, time_format), "interval_s": interval}
+        for node_id, node_state, first, last, interval in nodes
+    }), media_type=MEDIA_TYPE)
+
+@app.put("/nodes/{node_id}")
+def configure_node(node_id: str, payload: Dict):
+    # Expected report interval and/or raw history size of one node:
+    # {"interval_s": 60, "history_capacity": 1000}
+    interval = payload.get("interval_s")
+    capacity = payload.get("history_capacity")
+    if interval is None and capacity is None:
+        raise HTTPException(status_code=400, detail="expected interval_s and/or history_capacity")
+    if interval is not None and (isinstance(interval, bool) or not isinstance(interval, (int, float))
+                                 or not math.isfinite(interval) or interval <= 0):
+        raise HTTPException(status_code=400, detail="interval_s must be a positive number")
+    if capacity is not None and (isinstance(capacity, bool) or not isinstance(capacity, int)
+                                 or not 0 < capacity <= MAX_HISTORY_CAPACITY):
+        raise HTTPException(status_code=400,
+                            detail=f"history_capacity must be an integer from 1 to {MAX_HISTORY_CAPACITY}")
+    with store_lock:
+        if interval is not None:
+            node_registry.set_interval(node_id, float(interval))
+        if capacity is not None:
+            history_log.set_capacity(node_id, capacity)
+        return {"node_id": node_id, "interval_s": node_registry.interval(node_id),
+                "history_capacity": history_log.capacity(node_id)}
+
+@app.get("/udp/stats")
+def get_udp_stats():
+    # Per-node received/duplicate/missing counts of the UDP listener
+    if udp_ingest is None:
+        raise HTTPException(status_code=404, detail="UDP ingest is disabled (set WEATHER_UDP_PORT)")
+    return udp_ingest.stats()
+
+@app.get("/stream")
+async def stream(nodes: Optional[str] = None):
+    # Server-sent events: one "snapshot" of current values, then an "update"
+    # event per changed node.  ?nodes=1,2 limits the stream to those nodes.
+    node_filter = {n for n in nodes.split(",") if n} if nodes else None
+    sub = stream_hub.subscribe(node_filter)
+
+    if shared_store is not None:
+        current = {node_id: row[1:] for node_id, row in shared_store.read_since(0)[1].items()
+                   if row is not None and node_id in node_registry}
+    else:
+        with store_lock:
+            current = dict(data_store)
+    snapshot = {
+        node_id: present_record(record) for node_id, record in current.items()
+        if node_filter is None or node_id in node_filter
+    }
+
+    async def events():
+        try:
+            yield encode_event("snapshot", snapshot)
+            while True:
+                try:
+                    yield await asyncio.wait_for(sub.queue.get(), KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield KEEPALIVE_FRAME
+        finally:
+            stream_hub.unsubscribe(sub)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/history")
+def get_history_multi(nodes: str, step: float,
+                      start: Optional[float] = Query(None, alias="from"),
+                      end: Optional[float] = Query(None, alias="to"),
+                      agg: str = "mean",
+                      time_format: Optional[str] = None):
+    # Aligned buckets for several nodes: /history?nodes=1,2,3&step=60&agg=max
+    if agg not in AGGREGATES:
+        raise HTTPException(status_code=400, detail=f"agg must be one of {sorted(AGGREGATES)}")
+    time_format = query_time_format(time_format)
+    now = now_ms()
+    end_ms = to_ms(end, "to") if end is not None else now
+    start_ms = to_ms(start, "from") if start is not None else end_ms - HISTORY_QUERY_WINDOW * 1000
+    step_ms = to_ms(step, "step")
+    try:
+        buckets = bucket_axis(start_ms, end_ms, step_ms)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    node_ids = [n for n in nodes.split(",") if n]
+    tier = rollup_store.tier_for(step_ms, start_ms, now)
+    with store_lock:
+        series = {}
+        for node_id in node_ids:
+            if tier is not None:
+                ring = rollup_store.ring(node_id, tier)
+                series[node_id] = list(merge_buckets(ring, step_ms, agg, buckets[0], end_ms)) if ring else None
+            else:
+                history = history_log.get(node_id)
+                series[node_id] = select_range(history, buckets[0], end_ms) if history is not None else None
+
+    if tier is None:
+        series = {n: aggregate(c[0], c[1:], step_ms, agg) if c else None for n, c in series.items()}
+    return Response(dumps({
+        "step": step,
+        "agg": agg,
+        "buckets": [format_ts(b, time_format) for b in buckets],
+        "nodes": aligned_series(series, buckets, step_ms),
+    }), media_type=MEDIA_TYPE)
 
 @app.get("/history/{node_id}")
-def get_history(node_id: str):
-    return history_log.get(node_id, [])
+def get_history(node_id: str,
+                start: Optional[float] = Query(None, alias="from"),
+                end: Optional[float] = Query(None, alias="to"),
+                step: Optional[float] = None,
+                agg: str = "mean",
+                time_format: Optional[str] = None):
+    if agg not in AGGREGATES:
+        raise HTTPException(status_code=400, detail=f"agg must be one of {sorted(AGGREGATES)}")
+    # Buckets are whole milliseconds: a step that rounds to 0 ms is as invalid as 0
+    start_ms, end_ms, step_ms = to_ms(start, "from"), to_ms(end, "to"), to_ms(step, "step")
+    if step_ms is not None and step_ms < 1:
+        raise HTTPException(status_code=400, detail="step must be at least 0.001 seconds")
+    time_format = query_time_format(time_format)
+
+    tier = rollup_store.tier_for(step_ms, start_ms, now_ms()) if step is not None else None
+    with store_lock:
+        if tier is not None:
+            # Coarse query: read the pre-aggregated tier instead of raw samples
+            ring = rollup_store.ring(node_id, tier)
+            if ring is None:
+                return []
+            first = bucket_start(start_ms, step_ms) if start is not None else None
+            buckets = list(merge_buckets(ring, step_ms, agg, first, end_ms))
+        else:
+            history = history_log.get(node_id)
+            if history is None:
+                return []
+            # Only the columns are copied under the lock; encoding happens outside it
+            ts, temp, hum = select_range(history, start_ms, end_ms)
+
+    if step is None:
+        # Raw samples: streamed segment by segment, settled segments from the cache
+        return StreamingResponse(iter_history_json(node_id, ts, temp, hum, time_format, history_segments),
+                                 media_type=MEDIA_TYPE)
+    if tier is None:
+        buckets = aggregate(ts, (temp, hum), step_ms, agg)
+    return Response(dumps([
+        {"time": format_ts(bucket, time_format), "count": count, "temperature": values[0], "humidity": values[1]}
+        for bucket, count, values in buckets
+    ]), media_type=MEDIA_TYPE)
+
+def present_alert(event: Dict, time_format: str) -> Dict:
+    return {**event, "ts": format_ts(event["ts"], time_format)}
+
+
+@app.get("/alerts")
+def get_alerts(limit: int = 100, time_format: Optional[str] = None):
+    # Currently firing alerts and the latest firing/resolved events (newest first)
+    time_format = query_time_format(time_format)
+    with store_lock:
+        active = alert_engine.active()
+        recent = list(alert_engine.recent)[::-1][:max(limit, 0)]
+    return {"active": active, "recent": [present_alert(e, time_format) for e in recent]}
+
+@app.get("/alerts/rules")
+def get_alert_rules():
+    with store_lock:
+        return [rule.to_dict() for rule in alert_engine.rules.values()]
+
+@app.post("/alerts/rules")
+def add_alert_rule(payload: Dict):
+    # e.g. {"id": "hot", "kind": "threshold", "metric": "temperature", "op": ">",
+    #       "value": 35, "for_s": 300, "hysteresis": 1}; an existing id is replaced
+    try:
+        rule = Rule.from_dict(payload)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    with store_lock:
+        alert_engine.add_rule(rule)
+    return rule.to_dict()
+
+@app.delete("/alerts/rules/{rule_id}")
+def delete_alert_rule(rule_id: str):
+    with store_lock:
+        rule = alert_engine.remove_rule(rule_id)
+    if rule is None:
+        raise HTTPException(status_code=404, detail="No such rule")
+    return {"status": "deleted", "id": rule_id}
+
+def export_chunks(node_ids: Optional[set], start_ms: Optional[int], end_ms: Optional[int]):
+    # Column chunks for /export: the persisted partitions when persistence is on
+    # (full retention), otherwise the in-memory history, one node at a time
+    if persistence is not None:
+        persistence.flush()
+        for node_id, ts, temp, hum in persistence.read_range(
+                node_ids, None if start_ms is None else start_ms / 1000, None if end_ms is None else end_ms / 1000):
+            yield node_id, ms_column(ts), temp, hum
+        return
+    with store_lock:
+        node_list = sorted(history_log.nodes if node_ids is None else node_ids)
+    for node_id in node_list:
+        with store_lock:
+            history = history_log.get(node_id)
+            if history is None:
+                continue
+            columns = select_range(history, start_ms, end_ms)
+        yield (node_id,) + columns
+
+@app.get("/export")
+def export_history(nodes: Optional[str] = None,
+                   start: Optional[float] = Query(None, alias="from"),
+                   end: Optional[float] = Query(None, alias="to"),
+                   fmt: str = Query("csv", alias="format"),
+                   time_format: Optional[str] = None):
+    # Raw history of many nodes as a streamed download: ?format=csv|arrow|parquet
+    # (arrow/parquet need pyarrow). CSV timestamps are epoch ms unless time_format is given
+    try:
+        check_format(fmt)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    time_format = query_time_format(time_format) if time_format is not None else "epoch"
+    node_ids = {n for n in nodes.split(",") if n} if nodes else None
+    media_type, extension = FORMATS[fmt]
+    return StreamingResponse(
+        iter_export(export_chunks(node_ids, to_ms(start, "from"), to_ms(end, "to")), fmt, time_format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="weather-history.{extension}"'},
+    )
+
+@app.get("/anomalies")
+def get_anomalies(node: Optional[str] = None, limit: int = 100, time_format: Optional[str] = None):
+    # Per-node anomaly counters and the most recent flagged samples (newest first)
+    time_format = query_time_format(time_format)
+    with store_lock:
+        node_ids = [node] if node is not None else anomaly_detector.anomalous_nodes()
+        summaries = {n: anomaly_detector.summary(n) for n in node_ids}
+        recent = [e for e in reversed(anomaly_detector.recent) if node is None or e[1] == node][:max(limit, 0)]
+    nodes = {}
+    for node_id, summary in summaries.items():
+        if summary is None:
+            continue
+        if summary["last_anomaly"] is not None:
+            summary["last_anomaly"] = format_ts(summary["last_anomaly"], time_format)
+        nodes[node_id] = summary
+    return Response(dumps({
+        "nodes": nodes,
+        "recent": [
+            {"node_id": node_id, "time": format_ts(ts, time_format), "temperature": temp,
+             "humidity": hum, "anomaly": flag_names(flags)}
+            for ts, node_id, flags, temp, hum in recent
+        ],
+    }), media_type=MEDIA_TYPE)
 
+@app.get("/anomalies/{node_id}")
+def get_node_anomalies(node_id: str,
+                       start: Optional[float] = Query(None, alias="from"),
+                       end: Optional[float] = Query(None, alias="to"),
+                       time_format: Optional[str] = None):
+    # Re-score the node's stored history in one batch (NumPy when installed) and
+    # return the flagged samples; the rolling state warms up from the first sample
+    time_format = query_time_format(time_format)
+    start_ms, end_ms = to_ms(start, "from"), to_ms(end, "to")
+    with store_lock:
+        history = history_log.get(node_id)
+        if history is None:
+            return []
+        ts, temp, hum = select_range(history, start_ms, end_ms)
+    flags = score_columns(ts, temp, hum)
+    return Response(dumps([
+        {"time": format_ts(ts[i], time_format), "temperature": temp[i], "humidity": hum[i],
+         "anomaly": flag_names(f)}
+        for i, f in enumerate(flags) if f
+    ]), media_type=MEDIA_TYPE)
 
 if __name__ == "__main__":
-    uvicorn.run("backend:app", host="0.0.0.0", port=8000, reload=True)
+    if WORKERS > 1:
+        if DATA_DIR:
+            raise SystemExit("WEATHER_DATA_DIR persistence supports a single worker only")
+        logger.warning("%d workers: only /data and /stream are shared; history, rollups, "
+                       "alerts, anomalies and the node registry are per worker", WORKERS)
+        # Workers inherit the environment, so they all open the same table
+        os.environ.setdefault("WEATHER_SHARED_STORE", "/dev/shm/weather-sensors.tbl")
+        uvicorn.run("backend_update:app", host="0.0.0.0", port=8000, workers=WORKERS)
+    else:
+        uvicorn.run("backend_update:app", host="0.0.0.0", port=8000, reload=True)
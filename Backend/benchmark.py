@@ -0,0 +1,227 @@
+"""Load generator and benchmark for the backend ingest and read paths.
+
+Simulates ``--nodes`` virtual ESP nodes, each posting a reading every
+``1 / --rate`` seconds (open loop, so a slow backend shows up as latency,
+not as a lower offered load), plus ``--readers`` clients polling ``/data``
+and ``/history/{node_id}``.  Reports throughput, p50/p95/p99 latency per
+route and backend RSS.
+
+Examples::
+
+    # against a running backend (pass its pid to report RSS)
+    python benchmark.py --url http://localhost:8000 --nodes 500 --rate 1 --pid 12345
+
+    # reproducible offline run, backend app in this process via ASGI
+    python benchmark.py --in-process --nodes 1000 --rate 2 --batch-size 50 --readers 20
+"""
+
+from typing import Dict, List, Optional
+import argparse
+import asyncio
+import json
+import math
+import random
+import resource
+import time
+
+import httpx
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    # Nearest-rank percentile
+    k = max(0, math.ceil(pct / 100.0 * len(sorted_values)) - 1)
+    return sorted_values[k]
+
+
+def rss_bytes(pid: Optional[int]) -> Optional[int]:
+    # Current resident set size from /proc (Linux); None if unavailable
+    path = f"/proc/{pid or 'self'}/status"
+    try:
+        with open(path) as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if pid is None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return None
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.samples = 0
+
+    def record(self, route: str, seconds: float, ok: bool) -> None:
+        self.latencies.setdefault(route, []).append(seconds)
+        if not ok:
+            self.errors[route] = self.errors.get(route, 0) + 1
+
+    def report(self, elapsed: float) -> Dict:
+        routes = {}
+        for route, values in sorted(self.latencies.items()):
+            values.sort()
+            routes[route] = {
+                "requests": len(values),
+                "errors": self.errors.get(route, 0),
+                "req_per_s": len(values) / elapsed,
+                "p50_ms": percentile(values, 50) * 1000,
+                "p95_ms": percentile(values, 95) * 1000,
+                "p99_ms": percentile(values, 99) * 1000,
+            }
+        return {"elapsed_s": elapsed, "samples_per_s": self.samples / elapsed, "routes": routes}
+
+
+async def timed(client: httpx.AsyncClient, recorder: Recorder, route: str, method: str, url: str, **kwargs):
+    start = time.perf_counter()
+    try:
+        response = await client.request(method, url, **kwargs)
+        ok = response.status_code < 400
+    except httpx.HTTPError:
+        ok = False
+    recorder.record(route, time.perf_counter() - start, ok)
+    return ok
+
+
+async def node_writer(client, recorder, args, node_ids, rng, deadline, limit):
+    # One task drives a group of nodes so thousands of nodes don't need thousands of tasks
+    interval = 1.0 / args.rate
+    next_at = {node_id: time.monotonic() + rng.random() * interval for node_id in node_ids}
+    pending = []
+    pending_since = 0.0
+    in_flight = set()
+    while True:
+        now = time.monotonic()
+        if now >= deadline:
+            break
+        for node_id, t in next_at.items():
+            if t <= now:
+                next_at[node_id] = t + interval
+                if not pending:
+                    pending_since = now
+                pending.append({
+                    "node_id": node_id,
+                    "temperature": round(rng.uniform(18, 35), 2),
+                    "humidity": round(rng.uniform(30, 90), 2),
+                })
+        # Like a gateway: send a batch when it is full or has waited --batch-delay
+        while pending and (args.batch_size <= 1 or len(pending) >= args.batch_size
+                           or now - pending_since >= args.batch_delay):
+            if args.batch_size > 1:
+                chunk, pending = pending[:args.batch_size], pending[args.batch_size:]
+                coro = timed(client, recorder, "POST /update/batch", "POST", "/update/batch", json=chunk)
+            else:
+                chunk, pending = pending[:1], pending[1:]
+                coro = timed(client, recorder, "POST /update", "POST", "/update", json=chunk[0])
+            recorder.samples += len(chunk)
+            await limit.acquire()
+            task = asyncio.ensure_future(coro)
+            in_flight.add(task)
+            task.add_done_callback(lambda t: (in_flight.discard(t), limit.release()))
+        wake = min(next_at.values())
+        if pending:
+            wake = min(wake, pending_since + args.batch_delay)
+        await asyncio.sleep(max(0.0, min(wake, deadline) - time.monotonic()))
+    if in_flight:
+        await asyncio.gather(*in_flight)
+
+
+async def reader(client, recorder, args, node_ids, rng, deadline):
+    while time.monotonic() < deadline:
+        if rng.random() < 0.5:
+            await timed(client, recorder, "GET /data", "GET", "/data")
+        else:
+            node_id = rng.choice(node_ids)
+            await timed(client, recorder, "GET /history/{node_id}", "GET", f"/history/{node_id}")
+        await asyncio.sleep(args.reader_interval)
+
+
+async def run(args) -> Dict:
+    rng = random.Random(args.seed)
+    node_ids = [str(i) for i in range(1, args.nodes + 1)]
+
+    if args.in_process:
+        from backend_update import app
+        transport = httpx.ASGITransport(app=app)
+        client = httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=args.timeout)
+        lifespan = app.router.lifespan_context(app)
+        pid = None
+    else:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits)
+        lifespan = None
+        pid = args.pid
+
+    recorder = Recorder()
+    limit = asyncio.Semaphore(args.concurrency)
+    if lifespan is not None:
+        await lifespan.__aenter__()
+    try:
+        rss_before = rss_bytes(pid)
+        start = time.monotonic()
+        deadline = start + args.duration
+        groups = [node_ids[i::args.writer_tasks] for i in range(args.writer_tasks)]
+        tasks = [node_writer(client, recorder, args, g, random.Random(rng.random()), deadline, limit)
+                 for g in groups if g]
+        tasks += [reader(client, recorder, args, node_ids, random.Random(rng.random()), deadline)
+                  for _ in range(args.readers)]
+        await asyncio.gather(*tasks)
+        elapsed = time.monotonic() - start
+        rss_after = rss_bytes(pid)
+    finally:
+        await client.aclose()
+        if lifespan is not None:
+            await lifespan.__aexit__(None, None, None)
+
+    result = recorder.report(elapsed)
+    result["config"] = {k: v for k, v in vars(args).items() if k != "json"}
+    result["rss_bytes_before"] = rss_before
+    result["rss_bytes_after"] = rss_after
+    return result
+
+
+def print_report(result: Dict) -> None:
+    print(f"elapsed {result['elapsed_s']:.1f}s, offered {result['samples_per_s']:.0f} samples/s")
+    print(f"{'route':<24}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for route, r in result["routes"].items():
+        print(f"{route:<24}{r['requests']:>10}{r['errors']:>8}{r['req_per_s']:>10.1f}"
+              f"{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}{r['p99_ms']:>9.2f}")
+    before, after = result["rss_bytes_before"], result["rss_bytes_after"]
+    if after is not None:
+        print(f"backend RSS: {after / 2**20:.1f} MiB"
+              + (f" (was {before / 2**20:.1f} MiB)" if before is not None else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--url", default="http://localhost:8000", help="backend base URL")
+    target.add_argument("--in-process", action="store_true", help="run backend_update.app in-process over ASGI")
+    parser.add_argument("--pid", type=int, help="backend pid, to report its RSS (HTTP mode)")
+    parser.add_argument("--nodes", type=int, default=100, help="virtual ESP nodes")
+    parser.add_argument("--rate", type=float, default=0.2, help="readings per second per node")
+    parser.add_argument("--batch-size", type=int, default=1, help="readings per request (>1 uses /update/batch)")
+    parser.add_argument("--batch-delay", type=float, default=1.0, help="max seconds a partial batch waits")
+    parser.add_argument("--readers", type=int, default=4, help="concurrent /data and /history readers")
+    parser.add_argument("--reader-interval", type=float, default=0.0, help="pause between reads per reader (s)")
+    parser.add_argument("--duration", type=float, default=30.0, help="test length in seconds")
+    parser.add_argument("--concurrency", type=int, default=64, help="max in-flight write requests")
+    parser.add_argument("--writer-tasks", type=int, default=16, help="tasks sharing the node population")
+    parser.add_argument("--timeout", type=float, default=10.0, help="request timeout (s)")
+    parser.add_argument("--seed", type=int, default=1, help="random seed for reproducible runs")
+    parser.add_argument("--json", metavar="PATH", help="also write the report as JSON")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    print_report(result)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Compact fixed-layout binary readings for constrained nodes.
+
+One reading is 13 bytes, little-endian, no padding::
+
+    offset  type  field
+    0       u8    protocol version (PROTOCOL_VERSION)
+    1       u16   node id (numeric; the backend stores it as str(node id))
+    3       u16   sequence number, incremented per reading, wraps at 65536
+    5       u32   epoch seconds of the reading, 0 = "use the receive time"
+    9       i16   temperature in hundredths of a degree C
+    11      u16   relative humidity in hundredths of a percent (0..10000)
+
+A request body (``POST /update/binary``) or datagram is any number of
+readings back to back.  The same reading as JSON from the firmware is
+~60 bytes and needs a JSON parser on the server; here the server decodes
+with ``Struct.iter_unpack`` straight from the received buffer.
+
+``encode_reading`` is the reference encoder, used by tools and tests.
+"""
+
+from typing import Iterable, List, Tuple
+import struct
+
+PROTOCOL_VERSION = 1
+CONTENT_TYPE = "application/octet-stream"
+
+RECORD = struct.Struct("<BHHIhH")
+RECORD_SIZE = RECORD.size
+
+MAX_HUMIDITY = 10000  # centi-percent
+
+# (node_id, seq, ts, temperature, humidity); ts is 0.0 when the node has no clock
+Reading = Tuple[str, int, float, float, float]
+
+
+def encode_reading(node_id: int, temperature: float, humidity: float, ts: int = 0, seq: int = 0) -> bytes:
+    centi_temp = round(temperature * 100)
+    centi_hum = round(humidity * 100)
+    if not 0 <= node_id <= 0xFFFF:
+        raise ValueError("node_id must fit in 16 bits")
+    if not -0x8000 <= centi_temp <= 0x7FFF:
+        raise ValueError("temperature out of range")
+    if not 0 <= centi_hum <= MAX_HUMIDITY:
+        raise ValueError("humidity out of range")
+    return RECORD.pack(PROTOCOL_VERSION, node_id, seq & 0xFFFF, int(ts), centi_temp, centi_hum)
+
+
+def encode_readings(readings: Iterable[Tuple]) -> bytes:
+    """Concatenate readings given as encode_reading() argument tuples."""
+    return b"".join(encode_reading(*reading) for reading in readings)
+
+
+def decode_readings(data) -> Tuple[List[Reading], int]:
+    """Decode a buffer of readings; returns (readings, number rejected).
+
+    ``data`` can be ``bytes``, ``bytearray`` or a ``memoryview``; its length
+    must be a multiple of RECORD_SIZE.  Readings with an unknown version or
+    an impossible humidity are rejected individually.
+    """
+    if len(data) % RECORD_SIZE:
+        raise ValueError(f"length must be a multiple of {RECORD_SIZE} bytes")
+    readings = []
+    rejected = 0
+    for version, node, seq, ts, centi_temp, centi_hum in RECORD.iter_unpack(memoryview(data)):
+        if version != PROTOCOL_VERSION or centi_hum > MAX_HUMIDITY:
+            rejected += 1
+            continue
+        readings.append((str(node), seq, float(ts), centi_temp / 100, centi_hum / 100))
+    return readings, rejected
+
+
+if __name__ == "__main__":
+    import json
+
+    packet = encode_reading(1, 26.5, 60.2, seq=42)
+    as_json = json.dumps({"node_id": "1", "temperature": 26.5, "humidity": 60.2}).encode()
+    print(f"binary: {len(packet)} bytes  {packet.hex()}")
+    print(f"json:   {len(as_json)} bytes  {as_json.decode()}")
+    print("decoded:", decode_readings(packet)[0])
@@ -0,0 +1,147 @@
+"""Bulk history export as CSV, Arrow IPC or Parquet.
+
+Input is a stream of column chunks ``(node_id, ts, temperature, humidity)``
+-- ``array.array`` columns, ts in integer epoch milliseconds -- straight
+from the history store or the persistence partitions.  Each writer turns a
+chunk into output bytes and yields them, so a response of any size is
+produced with memory bounded by one chunk (``CHUNK_ROWS`` rows):
+
+    csv      node_id,ts,temperature,humidity rows
+    arrow    Arrow IPC stream; one record batch per chunk, node_id
+             dictionary-encoded, ts a UTC millisecond timestamp
+    parquet  the same columns, one row group per chunk
+
+The Arrow and Parquet writers wrap the column buffers without copying them
+and need the optional ``pyarrow`` package.
+"""
+
+from array import array
+from itertools import repeat
+from typing import Iterable, Iterator, Optional, Tuple
+
+from timebase import format_ts
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional dependency
+    pa = None
+
+CHUNK_ROWS = 65536
+
+Chunk = Tuple[str, array, array, array]
+
+# name -> (media type, file extension)
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+def check_format(fmt: str) -> None:
+    """Raise ValueError for an unknown format or one whose dependency is missing."""
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    if fmt != "csv" and pa is None:
+        raise ValueError(f"{fmt} export needs pyarrow (pip install pyarrow)")
+
+
+def ms_column(seconds: Iterable[float]) -> array:
+    """Float epoch seconds -> integer epoch milliseconds column."""
+    return array("q", map(round, map((1000.0).__mul__, seconds)))
+
+
+def split_chunks(chunks: Iterable[Chunk], rows: int = CHUNK_ROWS) -> Iterator[Chunk]:
+    """Cut chunks longer than ``rows`` so writers see bounded pieces."""
+    for node_id, ts, temp, hum in chunks:
+        if len(ts) <= rows:
+            if len(ts):
+                yield node_id, ts, temp, hum
+            continue
+        for i in range(0, len(ts), rows):
+            yield node_id, ts[i:i + rows], temp[i:i + rows], hum[i:i + rows]
+
+
+def iter_csv(chunks: Iterable[Chunk], time_format: str = "epoch") -> Iterator[bytes]:
+    yield b"node_id,ts,temperature,humidity\n"
+    for node_id, ts, temp, hum in split_chunks(chunks):
+        if '"' in node_id or "," in node_id or "\n" in node_id:
+            node_id = '"' + node_id.replace('"', '""') + '"'
+        if time_format != "epoch":
+            ts = [format_ts(t, time_format) for t in ts]
+        yield "".join(map("{},{},{!r},{!r}\n".format, repeat(node_id), ts, temp, hum)).encode()
+
+
+class _Chunks:
+    """Write-only file object that hands out what has been written so far."""
+
+    closed = False
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data) -> int:
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self.parts)
+        self.parts.clear()
+        return data
+
+
+def _schema():
+    return pa.schema([
+        ("node_id", pa.dictionary(pa.int32(), pa.string())),
+        ("ts", pa.timestamp("ms", tz="UTC")),
+        ("temperature", pa.float64()),
+        ("humidity", pa.float64()),
+    ])
+
+
+def _batch(schema, chunk: Chunk):
+    node_id, ts, temp, hum = chunk
+    n = len(ts)
+    # Zero-copy views of the array.array buffers; node_id is one dictionary entry
+    indices = pa.Array.from_buffers(pa.int32(), n, [None, pa.py_buffer(bytes(4 * n))])
+    return pa.RecordBatch.from_arrays([
+        pa.DictionaryArray.from_arrays(indices, pa.array([node_id], pa.string())),
+        pa.Array.from_buffers(pa.timestamp("ms", tz="UTC"), n, [None, pa.py_buffer(ts)]),
+        pa.Array.from_buffers(pa.float64(), n, [None, pa.py_buffer(temp)]),
+        pa.Array.from_buffers(pa.float64(), n, [None, pa.py_buffer(hum)]),
+    ], schema=schema)
+
+
+def iter_arrow(chunks: Iterable[Chunk]) -> Iterator[bytes]:
+    check_format("arrow")
+    schema = _schema()
+    sink = _Chunks()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for chunk in split_chunks(chunks):
+            writer.write_batch(_batch(schema, chunk))
+            yield sink.take()
+    yield sink.take()
+
+
+def iter_parquet(chunks: Iterable[Chunk]) -> Iterator[bytes]:
+    check_format("parquet")
+    schema = _schema()
+    sink = _Chunks()
+    with pq.ParquetWriter(sink, schema, compression="zstd") as writer:
+        for chunk in split_chunks(chunks):
+            writer.write_batch(_batch(schema, chunk))
+            yield sink.take()
+    yield sink.take()
+
+
+def iter_export(chunks: Iterable[Chunk], fmt: str, time_format: Optional[str] = None) -> Iterator[bytes]:
+    check_format(fmt)
+    if fmt == "csv":
+        return iter_csv(chunks, time_format or "epoch")
+    if fmt == "arrow":
+        return iter_arrow(chunks)
+    return iter_parquet(chunks)
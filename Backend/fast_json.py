@@ -0,0 +1,28 @@
+"""JSON encoding/decoding for the hot read and ingest paths.
+
+Uses ``orjson`` when it is installed (several times faster than the
+standard library and produces ``bytes`` directly), otherwise falls back
+to compact ``json``.  Responses built from these bytes skip FastAPI's
+``jsonable_encoder`` walk entirely.
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+MEDIA_TYPE = "application/json"
+
+
+if orjson is not None:
+    def dumps(obj) -> bytes:
+        return orjson.dumps(obj)
+
+    loads = orjson.loads
+else:
+    def dumps(obj) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode()
+
+    loads = json.loads
@@ -1,16 +1,50 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
+import sys
+
+from stream_hub import parse_events
 
 # URL of your FastAPI backend
 url = "http://localhost:8000/data"
+stream_url = "http://localhost:8000/stream"
+
+# Retry connection errors and 429/5xx with backoff instead of failing on the first
+# blip; the same policy as Frontend/http_client.py, kept here because Backend/
+# runs on its own without the frontend directory
+session = requests.Session()
+adapter = HTTPAdapter(max_retries=Retry(
+    total=3, backoff_factor=0.3, status_forcelist=(429, 500, 502, 503, 504),
+    allowed_methods=frozenset({"GET", "HEAD"}), raise_on_status=False))
+session.mount("http://", adapter)
+session.mount("https://", adapter)
+
+
+def follow():
+    # Print node updates as the backend pushes them (python get_data.py --follow)
+    with session.get(stream_url, stream=True, timeout=(5, None)) as response:
+        response.raise_for_status()
+        for event, data in parse_events(response.iter_lines()):
+            if event == "snapshot":
+                print("Current data:\n")
+                print(json.dumps(json.loads(data), indent=4))
+            elif event == "update":
+                print(json.dumps(json.loads(data)))
+
 
 try:
-    response = requests.get(url)
-    if response.status_code == 200:
-        data = response.json()
-        print("Data received from backend:\n")
-        print(json.dumps(data, indent=4))
+    if "--follow" in sys.argv[1:]:
+        follow()
     else:
-        print(f"Error {response.status_code}: {response.text}")
+        response = session.get(url, timeout=(3.05, 10))
+        if response.status_code == 200:
+            data = response.json()
+            print("Data received from backend:\n")
+            print(json.dumps(data, indent=4))
+        else:
+            print(f"Error {response.status_code}: {response.text}")
 except requests.exceptions.RequestException as e:
     print("Failed to connect to server:", e)
+except KeyboardInterrupt:
+    pass
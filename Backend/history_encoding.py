@@ -0,0 +1,93 @@
+"""Chunked, cached JSON encoding of raw history samples.
+
+A raw ``/history/{node_id}`` response is produced as a stream: the
+columns are copied out of the ring under the store lock (24 bytes per
+sample), then encoded outside it one time segment at a time, so peak
+memory is one segment of dicts rather than the whole response.
+
+Samples in a segment that is no longer being written to rarely change,
+so the encoded bytes of each segment are cached.  An entry is reused only
+while the segment still holds the same number of samples with the same
+first and last timestamps; a late insert or head expiry changes one of
+those and the segment is re-encoded.
+"""
+
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Iterator, Optional, Tuple
+import threading
+
+from fast_json import dumps
+from timebase import format_ts
+
+SEGMENT_MS = 60 * 60 * 1000  # samples are grouped by hour
+MAX_SEGMENT_SAMPLES = 2048   # and hours with more samples are split further
+CACHE_ENTRIES = 4096
+
+
+class SegmentCache:
+    """LRU of encoded segments keyed by (node, format, segment start)."""
+
+    def __init__(self, max_entries: int = CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple, Tuple[Tuple, bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple, check: Tuple) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != check:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def forget(self, node_id: str) -> None:
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == node_id]:
+                del self._entries[key]
+
+    def put(self, key: Tuple, check: Tuple, body: bytes) -> None:
+        with self._lock:
+            self._entries[key] = (check, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def encode_rows(ts: array, temp: array, hum: array, first: int, last: int, time_format: str) -> bytes:
+    """Rows [first, last) as comma-separated JSON objects (no brackets)."""
+    rows = [
+        {"time": format_ts(ts[i], time_format), "temperature": temp[i], "humidity": hum[i]}
+        for i in range(first, last)
+    ]
+    return dumps(rows)[1:-1]
+
+
+def iter_history_json(node_id: str, ts: array, temp: array, hum: array, time_format: str,
+                      cache: Optional[SegmentCache] = None) -> Iterator[bytes]:
+    """Yield a JSON array of history records in segment-sized chunks."""
+    yield b"["
+    n = len(ts)
+    i = 0
+    while i < n:
+        segment = ts[i] // SEGMENT_MS
+        j = min(bisect_left(ts, (segment + 1) * SEGMENT_MS, i), i + MAX_SEGMENT_SAMPLES)
+        body = None
+        # The segment holding the newest sample is still filling up: don't cache it
+        cacheable = cache is not None and j < n
+        if cacheable:
+            key = (node_id, time_format, ts[i])
+            check = (j - i, ts[j - 1])
+            body = cache.get(key, check)
+        if body is None:
+            body = encode_rows(ts, temp, hum, i, j, time_format)
+            if cacheable:
+                cache.put(key, check, body)
+        yield body if i == 0 else b"," + body
+        i = j
+    yield b"]"
@@ -0,0 +1,90 @@
+"""Range selection and bucketed aggregation over ``NodeHistory`` columns.
+
+Timestamps and steps are epoch milliseconds.  Buckets are aligned to
+multiples of ``step`` since the epoch, so series from different nodes line
+up without any extra resampling.  Each bucket is
+reduced with a C-level ``min``/``max``/``sum`` over an array slice, so the
+Python work is per bucket, not per sample.
+"""
+
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import math
+
+from history_store import NodeHistory
+
+# Upper bound on buckets per query, so a tiny step can't blow up a response
+MAX_BUCKETS = 10000
+
+METRICS = ("temperature", "humidity")
+
+
+def _mean(values: array) -> float:
+    return sum(values) / len(values)
+
+
+AGGREGATES = {
+    "min": min,
+    "max": max,
+    "mean": _mean,
+    "last": lambda values: values[-1],
+}
+
+
+def select_range(history: NodeHistory, start: Optional[float] = None,
+                 end: Optional[float] = None) -> Tuple[array, array, array]:
+    """Return the (ts, temperature, humidity) columns with start <= ts < end."""
+    first = 0 if start is None else history.bisect(start)
+    last = history.size if end is None else history.bisect(end)
+    return history.columns(first, last)
+
+
+def bucket_start(ts: float, step: float) -> float:
+    return (ts // step) * step
+
+
+def aggregate(ts: array, columns: Sequence[array], step: float, agg: str):
+    """Yield (bucket_start, count, [aggregated value per column]) for non-empty buckets."""
+    reduce = AGGREGATES[agg]
+    i = 0
+    n = len(ts)
+    while i < n:
+        bucket = bucket_start(ts[i], step)
+        j = bisect_left(ts, bucket + step, i)
+        yield bucket, j - i, [reduce(column[i:j]) for column in columns]
+        i = j
+
+
+def bucket_axis(start: float, end: float, step: float) -> List[float]:
+    """Epoch-aligned bucket starts covering [start, end)."""
+    if step <= 0:
+        raise ValueError("step must be positive")
+    if end <= start:
+        raise ValueError("'to' must be after 'from'")
+    first = bucket_start(start, step)
+    count = math.ceil((end - first) / step)
+    if count > MAX_BUCKETS:
+        raise ValueError(f"query spans more than {MAX_BUCKETS} buckets")
+    return [first + k * step for k in range(count)]
+
+
+def aligned_series(series: Dict[str, Optional[Iterable]], buckets: List[float], step: float) -> Dict:
+    """Place many nodes' aggregated buckets onto one shared bucket axis.
+
+    ``series`` maps node id to an iterable of ``(bucket_start, count, values)``
+    as produced by ``aggregate`` (or None for an unknown node).  Empty buckets
+    are ``None`` so every series has the same length as ``buckets``.
+    """
+    first = buckets[0] if buckets else 0.0
+    count = len(buckets)
+    nodes = {}
+    for node_id, aggregated in series.items():
+        out: Dict[str, List[Optional[float]]] = {m: [None] * count for m in METRICS}
+        for bucket, _, values in aggregated or ():
+            k = int(round((bucket - first) / step))
+            if 0 <= k < count:
+                out["temperature"][k] = values[0]
+                out["humidity"][k] = values[1]
+        nodes[node_id] = out
+    return nodes
@@ -0,0 +1,213 @@
+"""Fixed-capacity, array-backed ring buffers for per-node sensor history.
+
+Each node keeps three preallocated columns (timestamp in integer epoch
+milliseconds, temperature, humidity) in ``array.array`` storage, so an
+append is O(1) and a sample costs ``BYTES_PER_SAMPLE`` bytes instead of a
+~300 byte dict.  Timestamps are turned into text only when records are
+returned (see timebase.format_ts).
+
+Run ``python history_store.py`` to print the current memory-per-sample
+figure next to the old list-of-dicts layout.
+"""
+
+from array import array
+from typing import Dict, Optional
+import time
+
+from timebase import now_ms
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Column layout: (name, array typecode); ts is epoch milliseconds
+COLUMNS = (("ts", "q"), ("temperature", "d"), ("humidity", "d"))
+
+# Bytes used by one stored sample across all columns
+BYTES_PER_SAMPLE = sum(array(code).itemsize for _, code in COLUMNS)
+
+
+def _zeros(typecode: str, n: int) -> array:
+    return array(typecode, bytes(array(typecode).itemsize * n))
+
+
+class NodeHistory:
+    """Ring buffer of the most recent ``capacity`` samples of one node.
+
+    With ``max_age`` set, samples older than ``max_age`` milliseconds before
+    the newest one are dropped from the head as new samples arrive.
+    """
+
+    __slots__ = ("capacity", "max_age", "ts", "temperature", "humidity", "start", "size")
+
+    def __init__(self, capacity: int, max_age: Optional[int] = None):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self.max_age = max_age
+        self.ts = _zeros("q", capacity)
+        self.temperature = _zeros("d", capacity)
+        self.humidity = _zeros("d", capacity)
+        self.start = 0
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def append(self, ts: int, temperature: float, humidity: float) -> None:
+        idx = self.start + self.size
+        if idx >= self.capacity:
+            idx -= self.capacity
+        self.ts[idx] = ts
+        self.temperature[idx] = temperature
+        self.humidity[idx] = humidity
+        if self.size < self.capacity:
+            self.size += 1
+        else:
+            # Full: overwrite the oldest slot and move the head forward
+            self.start = idx + 1 if idx + 1 < self.capacity else 0
+        if self.max_age is not None:
+            self.expire(ts - self.max_age)
+
+    def expire(self, before: int) -> None:
+        """Drop samples with timestamp < ``before`` from the head."""
+        while self.size and self.ts[self.start] < before:
+            self.start = self.start + 1 if self.start + 1 < self.capacity else 0
+            self.size -= 1
+
+    def _slot(self, pos: int) -> int:
+        # Physical index of logical position ``pos`` (0 = oldest)
+        idx = self.start + pos
+        return idx - self.capacity if idx >= self.capacity else idx
+
+    def latest_ts(self) -> Optional[int]:
+        return self.ts[self._slot(self.size - 1)] if self.size else None
+
+    def bisect(self, ts: int) -> int:
+        """Logical position of the first sample with timestamp >= ``ts``."""
+        lo, hi = 0, self.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.ts[self._slot(mid)] < ts:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def insert(self, ts: int, temperature: float, humidity: float) -> None:
+        """Insert a late sample at its chronological position.
+
+        Costs O(k) for k newer samples already stored, so it suits readings
+        that arrive slightly out of order (buffered batches, retries).
+        """
+        if self.size == self.capacity and ts < self.ts[self._slot(0)]:
+            return  # older than everything kept
+        self.append(ts, temperature, humidity)
+        pos = self.size - 1
+        columns = (self.ts, self.temperature, self.humidity)
+        while pos > 0:
+            cur, prev = self._slot(pos), self._slot(pos - 1)
+            if self.ts[prev] <= ts:
+                break
+            for column in columns:
+                column[cur], column[prev] = column[prev], column[cur]
+            pos -= 1
+
+    def _ordered(self, column: array, first: int = 0, last: Optional[int] = None) -> array:
+        # Slice [first, last) in logical (oldest -> newest) order
+        if last is None or last > self.size:
+            last = self.size
+        if first >= last:
+            return array(column.typecode)
+        lo = self.start + first
+        hi = self.start + last
+        if hi <= self.capacity:
+            return column[lo:hi]
+        if lo >= self.capacity:
+            return column[lo - self.capacity:hi - self.capacity]
+        return column[lo:] + column[:hi - self.capacity]
+
+    def columns(self, first: int = 0, last: Optional[int] = None):
+        """Return (ts, temperature, humidity) arrays in chronological order."""
+        return (
+            self._ordered(self.ts, first, last),
+            self._ordered(self.temperature, first, last),
+            self._ordered(self.humidity, first, last),
+        )
+
+    def resize(self, capacity: int) -> "NodeHistory":
+        """Return a new buffer of ``capacity`` holding the newest samples."""
+        resized = NodeHistory(capacity, self.max_age)
+        for t, tv, hv in zip(*self.columns(max(0, self.size - capacity))):
+            resized.append(t, tv, hv)
+        return resized
+
+    def memory_bytes(self) -> int:
+        return self.capacity * BYTES_PER_SAMPLE
+
+
+class HistoryStore:
+    """Per-node ``NodeHistory`` buffers with a default and per-node capacity."""
+
+    def __init__(self, default_capacity: int = 100, max_age: Optional[int] = None):
+        self.default_capacity = default_capacity
+        self.max_age = max_age
+        self.capacities: Dict[str, int] = {}
+        self.nodes: Dict[str, NodeHistory] = {}
+
+    def __contains__(self, node_id: str) -> bool:
+        return node_id in self.nodes
+
+    def get(self, node_id: str) -> Optional[NodeHistory]:
+        return self.nodes.get(node_id)
+
+    def append(self, node_id: str, ts: int, temperature: float, humidity: float) -> None:
+        history = self.nodes.get(node_id)
+        if history is None:
+            history = self.nodes[node_id] = NodeHistory(self.capacity(node_id), self.max_age)
+        if history.size and ts < history.latest_ts():
+            history.insert(ts, temperature, humidity)
+        else:
+            history.append(ts, temperature, humidity)
+
+    def remove(self, node_id: str) -> None:
+        self.nodes.pop(node_id, None)
+
+    def capacity(self, node_id: str) -> int:
+        return self.capacities.get(node_id, self.default_capacity)
+
+    def set_capacity(self, node_id: str, capacity: int) -> None:
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacities[node_id] = capacity
+        history = self.nodes.get(node_id)
+        if history is not None and history.capacity != capacity:
+            self.nodes[node_id] = history.resize(capacity)
+
+    def sample_count(self) -> int:
+        return sum(len(h) for h in self.nodes.values())
+
+    def memory_bytes(self) -> int:
+        return sum(h.memory_bytes() for h in self.nodes.values())
+
+
+if __name__ == "__main__":
+    import tracemalloc
+
+    n = 10_000
+    tracemalloc.start()
+    legacy = [
+        {"time": time.strftime(TIME_FORMAT), "temperature": 20.0 + i * 0.01, "humidity": 50.0 + i * 0.01}
+        for i in range(n)
+    ]
+    legacy_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del legacy
+
+    tracemalloc.start()
+    ring = NodeHistory(n)
+    for i in range(n):
+        ring.append(now_ms(), 20.0 + i * 0.01, 50.0 + i * 0.01)
+    ring_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    print(f"ring buffer : {ring_bytes / n:7.1f} bytes/sample (nominal {BYTES_PER_SAMPLE})")
+    print(f"list of dict: {legacy_bytes / n:7.1f} bytes/sample")
@@ -0,0 +1,207 @@
+"""Bulk import of past readings, and replay of recorded traffic.
+
+Input files hold (node_id, ts, temperature, humidity) rows, ts in epoch
+seconds or milliseconds, as CSV (header optional), NDJSON, Parquet or an
+Arrow IPC stream -- including files written by export_data.py.  Parquet and
+Arrow need the optional ``pyarrow`` package.
+
+``import`` streams the rows to ``POST /import`` in one request, reading the
+file a block at a time, so files of any size import in bounded memory; the
+backend sorts each chunk by (node, ts) and feeds it to history and rollups
+in one pass (and to persistence when enabled) without touching the live view.
+
+``replay`` re-sends the rows to ``POST /update`` as live readings, spaced as
+they were recorded and sped up ``--speed`` times (0 = as fast as possible),
+for realistic load tests.
+
+Examples::
+
+    python import_data.py import readings.csv
+    python import_data.py import history.parquet --url http://backend:8000
+    python import_data.py replay readings.ndjson --speed 60 --concurrency 8
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional, Tuple
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+import time
+
+import requests
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional dependency
+    pa = None
+
+Row = Tuple[str, float, float, float]
+
+COLUMNS = ("node_id", "ts", "temperature", "humidity")
+FORMATS = {".csv": "csv", ".ndjson": "ndjson", ".jsonl": "ndjson", ".parquet": "parquet",
+           ".arrow": "arrow", ".arrows": "arrow"}
+SEND_BLOCK_ROWS = 10000  # rows read and encoded per chunk of the /import request body
+MS_THRESHOLD = 100_000_000_000  # as in timebase: larger ts values are milliseconds
+
+
+def read_csv(path: str) -> Iterator[Row]:
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        order = (0, 1, 2, 3)
+        for number, fields in enumerate(reader):
+            if not fields:
+                continue
+            if number == 0 and "node_id" in fields:
+                # Header row: columns may come in any order
+                order = tuple(fields.index(name) for name in COLUMNS)
+                continue
+            yield fields[order[0]], float(fields[order[1]]), float(fields[order[2]]), float(fields[order[3]])
+
+
+def read_ndjson(path: str) -> Iterator[Row]:
+    with open(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                yield (str(record["node_id"]), float(record["ts"]),
+                       float(record["temperature"]), float(record["humidity"]))
+
+
+def _read_batches(batches) -> Iterator[Row]:
+    for batch in batches:
+        ts = batch.column("ts")
+        if pa.types.is_timestamp(ts.type):
+            ts = ts.cast(pa.timestamp("ms", tz=ts.type.tz)).cast(pa.int64())
+        yield from zip((str(n) for n in batch.column("node_id").to_pylist()), ts.to_pylist(),
+                       batch.column("temperature").to_pylist(), batch.column("humidity").to_pylist())
+
+
+def read_rows(path: str, fmt: Optional[str] = None) -> Iterator[Row]:
+    fmt = fmt or FORMATS.get(os.path.splitext(path)[1].lower())
+    if fmt == "csv":
+        return read_csv(path)
+    if fmt == "ndjson":
+        return read_ndjson(path)
+    if fmt in ("parquet", "arrow"):
+        if pa is None:
+            raise SystemExit(f"Reading {fmt} files needs pyarrow (pip install pyarrow)")
+        if fmt == "parquet":
+            return _read_batches(pq.ParquetFile(path).iter_batches(columns=list(COLUMNS)))
+        return _read_batches(pa.ipc.open_stream(pa.OSFile(path)))
+    raise SystemExit(f"Unknown input format for {path}; pass --format csv|ndjson|parquet|arrow")
+
+
+def seconds(ts: float) -> float:
+    return ts / 1000 if ts >= MS_THRESHOLD else ts
+
+
+def csv_field(text: str) -> str:
+    return '"' + text.replace('"', '""') + '"' if "," in text or '"' in text else text
+
+
+def csv_body(rows: Iterable[Row], counter: List[int]) -> Iterator[bytes]:
+    # counter[0] counts the rows sent so far
+    yield b"node_id,ts,temperature,humidity\n"
+    rows = iter(rows)
+    while True:
+        block = list(islice(rows, SEND_BLOCK_ROWS))
+        if not block:
+            return
+        counter[0] += len(block)
+        yield "".join(f"{csv_field(n)},{ts!r},{t!r},{h!r}\n" for n, ts, t, h in block).encode()
+
+
+def run_import(args) -> None:
+    started = time.perf_counter()
+    sent = [0]
+    response = requests.post(f"{args.url}/import", data=csv_body(read_rows(args.file, args.format), sent),
+                             headers={"Content-Type": "text/csv"}, timeout=(5, None))
+    if response.status_code != 200:
+        raise SystemExit(f"Error {response.status_code}: {response.text}")
+    result = response.json()
+    print(f"Sent {sent[0]} rows, imported {result['imported']}, rejected {result['rejected']} "
+          f"in {time.perf_counter() - started:.2f}s", file=sys.stderr)
+    for error in result.get("errors", []):
+        print(f"  {error}", file=sys.stderr)
+
+
+def run_replay(args) -> None:
+    rows = sorted(read_rows(args.file, args.format), key=lambda row: seconds(row[1]))
+    if not rows:
+        return
+    local = threading.local()
+    lock = threading.Lock()
+    latencies: List[float] = []
+    errors = [0]
+    # Bound requests in flight, so a slow backend shows up as lag, not memory
+    in_flight = threading.BoundedSemaphore(args.concurrency * 4)
+
+    def send(node_id: str, temp: float, hum: float) -> None:
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            ok = session.post(f"{args.url}/update", json={"node_id": node_id, "temperature": temp, "humidity": hum},
+                              timeout=(3.05, 10)).status_code == 200
+        except requests.exceptions.RequestException:
+            ok = False
+        with lock:
+            latencies.append(time.perf_counter() - start)
+            if not ok:
+                errors[0] += 1
+        in_flight.release()
+
+    first = seconds(rows[0][1])
+    started = time.perf_counter()
+    max_lag = 0.0
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for node_id, ts, temp, hum in rows:
+            if args.speed > 0:
+                target = started + (seconds(ts) - first) / args.speed
+                delay = target - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    max_lag = max(max_lag, -delay)
+            in_flight.acquire()
+            pool.submit(send, node_id, temp, hum)
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    print(f"Replayed {len(rows)} readings in {elapsed:.1f}s ({len(rows) / elapsed:.0f}/s), "
+          f"{errors[0]} errors, latency p50 {p50:.1f} ms p99 {p99:.1f} ms, max lag {max_lag:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import or replay sensor readings")
+    parser.add_argument("mode", choices=("import", "replay"))
+    parser.add_argument("file", help="CSV, NDJSON, Parquet or Arrow file of node_id,ts,temperature,humidity")
+    parser.add_argument("--format", choices=sorted(set(FORMATS.values())), help="input format (default: by extension)")
+    parser.add_argument("--url", default="http://localhost:8000", help="backend base URL")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed multiplier (0 = no delays)")
+    parser.add_argument("--concurrency", type=int, default=4, help="parallel requests during replay")
+    args = parser.parse_args()
+
+    try:
+        if args.mode == "import":
+            run_import(args)
+        else:
+            run_replay(args)
+    except requests.exceptions.RequestException as e:
+        raise SystemExit(f"Failed to connect to server: {e}")
+    except (KeyError, ValueError) as e:
+        raise SystemExit(f"Bad input: {e}")
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""Cheap in-process metrics rendered in the Prometheus text format.
+
+Counters and histograms are sharded per thread: every thread that records
+gets its own preallocated list of bucket counts (registered once under a
+lock), so the hot path is a ``bisect`` and two list increments with no lock
+and no allocation.  A scrape sums the shards.
+"""
+
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Tuple
+import asyncio
+import math
+import threading
+import time
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+LOOP_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+LabelValues = Tuple[str, ...]
+
+
+class Histogram:
+    """Histogram with one label set; counts live in per-thread shards."""
+
+    def __init__(self, bounds: Iterable[float]):
+        self.bounds = tuple(bounds)
+        self._local = threading.local()
+        self._shards: List[List[float]] = []
+        self._lock = threading.Lock()
+
+    def _shard(self) -> List[float]:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            # bucket counts, then +Inf count, then the running sum
+            shard = [0] * (len(self.bounds) + 1) + [0.0]
+            with self._lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+        return shard
+
+    def observe(self, value: float) -> None:
+        shard = self._shard()
+        shard[bisect_left(self.bounds, value)] += 1
+        shard[-1] += value
+
+    def snapshot(self) -> Tuple[List[int], float]:
+        """Return (cumulative bucket counts incl. +Inf, sum)."""
+        n = len(self.bounds) + 1
+        counts = [0] * n
+        total = 0.0
+        with self._lock:
+            shards = list(self._shards)
+        for shard in shards:
+            for i in range(n):
+                counts[i] += shard[i]
+            total += shard[-1]
+        for i in range(1, n):
+            counts[i] += counts[i - 1]
+        return counts, total
+
+
+class Family:
+    """A labelled metric family; children are created once per label set."""
+
+    def __init__(self, factory):
+        self._factory = factory
+        self.children: Dict[LabelValues, object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: str):
+        child = self.children.get(values)
+        if child is None:
+            with self._lock:
+                child = self.children.setdefault(values, self._factory())
+        return child
+
+
+class Counter:
+    """Monotonic counter with per-thread shards."""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards: List[List[float]] = []
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = [0]
+            with self._lock:
+                self._shards.append(shard)
+        shard[0] += amount
+
+    @property
+    def value(self) -> float:
+        with self._lock:
+            return sum(shard[0] for shard in self._shards)
+
+
+def _labels(names: Tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    def __init__(self):
+        self.request_latency = Family(lambda: Histogram(LATENCY_BUCKETS))
+        self.responses = Family(Counter)
+        self.loop_lag = Histogram(LOOP_LAG_BUCKETS)
+        self.loop_lag_last = 0.0
+        # Per-node sample count and wall-clock time of the last sample;
+        # written by the ingest path under the store lock
+        self.node_samples: Dict[str, int] = {}
+        self.node_last_seen: Dict[str, float] = {}
+
+    def node_seen(self, node_id: str, now: float) -> None:
+        self.node_samples[node_id] = self.node_samples.get(node_id, 0) + 1
+        self.node_last_seen[node_id] = now
+
+    def forget_node(self, node_id: str) -> None:
+        self.node_samples.pop(node_id, None)
+        self.node_last_seen.pop(node_id, None)
+
+    def render(self, gauges: Dict[str, Tuple[str, float]], node_samples: Dict[str, int],
+               node_last_seen: Dict[str, float]) -> str:
+        """Prometheus text exposition.
+
+        ``gauges`` maps name -> (help, value); the node dicts are copies of
+        ``node_samples``/``node_last_seen`` taken under the store lock.
+        """
+        out: List[str] = []
+
+        out.append("# HELP weather_http_request_duration_seconds Request latency by route.")
+        out.append("# TYPE weather_http_request_duration_seconds histogram")
+        for (method, route), hist in sorted(self.request_latency.children.items()):
+            self._histogram(out, "weather_http_request_duration_seconds", ("method", "route"),
+                            (method, route), hist)
+
+        out.append("# HELP weather_http_responses_total Responses by route and status code.")
+        out.append("# TYPE weather_http_responses_total counter")
+        for values, counter in sorted(self.responses.children.items()):
+            out.append(f"weather_http_responses_total{_labels(('method', 'route', 'code'), values)} "
+                       f"{_number(counter.value)}")
+
+        out.append("# HELP weather_event_loop_lag_seconds Delay of a periodic event loop timer.")
+        out.append("# TYPE weather_event_loop_lag_seconds histogram")
+        self._histogram(out, "weather_event_loop_lag_seconds", (), (), self.loop_lag)
+        out.append("# HELP weather_event_loop_lag_last_seconds Most recent event loop lag.")
+        out.append("# TYPE weather_event_loop_lag_last_seconds gauge")
+        out.append(f"weather_event_loop_lag_last_seconds {_number(self.loop_lag_last)}")
+
+        now = time.time()
+        out.append("# HELP weather_node_samples_total Samples received per node.")
+        out.append("# TYPE weather_node_samples_total counter")
+        for node_id, count in sorted(node_samples.items()):
+            out.append(f"weather_node_samples_total{_labels(('node',), (node_id,))} {count}")
+        out.append("# HELP weather_node_last_seen_age_seconds Seconds since the node's last sample.")
+        out.append("# TYPE weather_node_last_seen_age_seconds gauge")
+        for node_id, seen in sorted(node_last_seen.items()):
+            out.append(f"weather_node_last_seen_age_seconds{_labels(('node',), (node_id,))} "
+                       f"{_number(round(now - seen, 3))}")
+
+        for name, (help_text, value) in gauges.items():
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} gauge")
+            out.append(f"{name} {_number(value)}")
+        return "\n".join(out) + "\n"
+
+    @staticmethod
+    def _histogram(out: List[str], name: str, names, values, hist: Histogram) -> None:
+        counts, total = hist.snapshot()
+        for bound, count in zip(hist.bounds + (math.inf,), counts):
+            le = 'le="%s"' % _number(bound)
+            out.append(f"{name}_bucket{_labels(names, values, le)} {count}")
+        out.append(f"{name}_sum{_labels(names, values)} {_number(total)}")
+        out.append(f"{name}_count{_labels(names, values)} {counts[-1]}")
+
+    async def monitor_loop_lag(self, interval: float = 0.5) -> None:
+        """Measure how late a periodic sleep wakes up; run as a background task."""
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            lag = max(0.0, time.perf_counter() - start - interval)
+            self.loop_lag_last = lag
+            self.loop_lag.observe(lag)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency and status per route template.
+
+    The route template (``/history/{node_id}``) is looked up from the
+    endpoint the router stored in the scope, so per-node paths don't create
+    a label set each.  Server-sent event streams stay open for as long as the
+    client listens, so for those the latency is the time to the response
+    headers rather than to the end of the response.
+    """
+
+    def __init__(self, app, registry: Registry):
+        self.app = app
+        self.registry = registry
+        self._templates: Dict[object, str] = {}
+
+    def _template(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        template = self._templates.get(endpoint)
+        if template is None:
+            template = scope.get("path", "unknown")
+            for route in getattr(scope.get("app"), "routes", ()):
+                if getattr(route, "endpoint", None) is endpoint:
+                    template = route.path
+                    break
+            self._templates[endpoint] = template
+        return template
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        start = time.perf_counter()
+        elapsed = None
+
+        async def send_wrapper(message):
+            nonlocal status, elapsed
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                for name, value in message.get("headers", ()):
+                    if name.lower() == b"content-type" and value.startswith(b"text/event-stream"):
+                        elapsed = time.perf_counter() - start
+                        break
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = self._template(scope)
+            method = scope.get("method", "")
+            if elapsed is None:
+                elapsed = time.perf_counter() - start
+            self.registry.request_latency.labels(method, route).observe(elapsed)
+            self.registry.responses.labels(method, route, str(status)).inc()
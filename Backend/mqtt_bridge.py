@@ -0,0 +1,184 @@
+"""Bridge between an MQTT-style broker and the sensor store.
+
+Nodes publish readings to ``sensors/<node_id>/reading`` (JSON like the
+``/update`` body, ``node_id`` optional, or binary_protocol readings) over
+one persistent connection instead of one HTTP request per reading.  The
+bridge feeds them to ``record_samples`` and republishes every changed
+node record, retained, to ``weather/nodes/<node_id>`` so dashboards can
+subscribe once and let the broker do the fan-out.
+
+Two brokers share the same small interface (``subscribe``, ``publish``,
+``close``):
+
+* ``LocalBroker`` -- an in-process stand-in with MQTT topic matching and
+  retained messages, for development and tests.
+* ``PahoBroker`` -- a client for a real broker (Mosquitto, EMQX, ...);
+  needs the optional ``paho-mqtt`` package.
+"""
+
+from typing import Callable, Dict, List, Tuple
+import logging
+import threading
+
+from binary_protocol import RECORD_SIZE, decode_readings
+from fast_json import dumps, loads
+from timebase import now_ms
+
+try:
+    import paho.mqtt.client as mqtt
+except ImportError:  # optional dependency
+    mqtt = None
+
+logger = logging.getLogger(__name__)
+
+INPUT_TOPIC = "sensors/+/reading"
+OUTPUT_PREFIX = "weather/nodes"
+
+Handler = Callable[[str, bytes], None]
+
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    """MQTT matching: ``+`` is one level, a trailing ``#`` is any number of levels."""
+    filter_levels = topic_filter.split("/")
+    levels = topic.split("/")
+    for i, part in enumerate(filter_levels):
+        if part == "#":
+            return True
+        if i >= len(levels) or (part != "+" and part != levels[i]):
+            return False
+    return len(levels) == len(filter_levels)
+
+
+class LocalBroker:
+    """In-process broker: synchronous delivery in the publisher's thread."""
+
+    def __init__(self):
+        self._subscriptions: List[Tuple[str, Handler]] = []
+        self._retained: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, topic_filter: str, handler: Handler) -> None:
+        with self._lock:
+            self._subscriptions.append((topic_filter, handler))
+            retained = [(t, p) for t, p in self._retained.items() if topic_matches(topic_filter, t)]
+        for topic, payload in retained:
+            handler(topic, payload)
+
+    def unsubscribe(self, handler: Handler) -> None:
+        with self._lock:
+            self._subscriptions = [s for s in self._subscriptions if s[1] is not handler]
+
+    def publish(self, topic: str, payload: bytes, retain: bool = False) -> None:
+        with self._lock:
+            if retain:
+                # As in MQTT, an empty retained payload clears the retained message
+                if payload:
+                    self._retained[topic] = payload
+                else:
+                    self._retained.pop(topic, None)
+            handlers = [h for f, h in self._subscriptions if topic_matches(f, topic)]
+        for handler in handlers:
+            handler(topic, payload)
+
+    def close(self) -> None:
+        pass
+
+
+class PahoBroker:
+    """Connection to an external MQTT broker through paho-mqtt (1.x or 2.x)."""
+
+    def __init__(self, host: str, port: int = 1883, client_id: str = ""):
+        if mqtt is None:
+            raise RuntimeError("paho-mqtt is not installed (pip install paho-mqtt)")
+        try:
+            self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id)
+        except AttributeError:
+            self.client = mqtt.Client(client_id=client_id)
+        self._subscriptions: List[Tuple[str, Handler]] = []
+        self.client.on_connect = self._on_connect
+        self.client.on_message = self._on_message
+        self.client.reconnect_delay_set(min_delay=1, max_delay=30)
+        self.client.connect_async(host, port, keepalive=30)
+        self.client.loop_start()
+
+    def _on_connect(self, client, userdata, *args):
+        # (Re)subscribe after every connect; the session is not persistent
+        for topic_filter, _ in self._subscriptions:
+            client.subscribe(topic_filter, qos=1)
+
+    def _on_message(self, client, userdata, message):
+        for topic_filter, handler in self._subscriptions:
+            if topic_matches(topic_filter, message.topic):
+                handler(message.topic, message.payload)
+
+    def subscribe(self, topic_filter: str, handler: Handler) -> None:
+        self._subscriptions.append((topic_filter, handler))
+        self.client.subscribe(topic_filter, qos=1)
+
+    def publish(self, topic: str, payload: bytes, retain: bool = False) -> None:
+        self.client.publish(topic, payload, qos=0, retain=retain)
+
+    def close(self) -> None:
+        self.client.loop_stop()
+        self.client.disconnect()
+
+
+class MqttBridge:
+    def __init__(self, broker, sink, parse, stamp, input_topic: str = INPUT_TOPIC,
+                 output_prefix: str = OUTPUT_PREFIX):
+        """``sink`` is record_samples; ``parse(record)`` validates one JSON reading and
+        ``stamp(readings, received_ms)`` timestamps the readings of one message."""
+        self.broker = broker
+        self.sink = sink
+        self.parse = parse
+        self.stamp = stamp
+        self.input_topic = input_topic
+        self.output_prefix = output_prefix
+        # Topic level that carries the node id (the first '+' of the filter)
+        levels = input_topic.split("/")
+        self._node_level = levels.index("+") if "+" in levels else None
+        self.received = 0
+        self.rejected = 0
+
+    def start(self) -> None:
+        self.broker.subscribe(self.input_topic, self.on_message)
+
+    def close(self) -> None:
+        self.broker.close()
+
+    def on_message(self, topic: str, payload: bytes) -> None:
+        self.received += 1
+        received_ms = now_ms()
+        try:
+            if payload[:1] in (b"{", b"["):
+                records = loads(payload)
+                if not isinstance(records, list):
+                    records = [records]
+                topic_node = topic.split("/")[self._node_level] if self._node_level is not None else None
+                readings = []
+                for record in records:
+                    if isinstance(record, dict) and topic_node is not None:
+                        record.setdefault("node_id", topic_node)
+                    readings.append(self.parse(record))
+            elif payload and len(payload) % RECORD_SIZE == 0:
+                decoded, _ = decode_readings(payload)
+                readings = [(node_id, ts, temp, hum) for node_id, _, ts, temp, hum in decoded]
+            else:
+                raise ValueError("payload is neither JSON nor binary readings")
+        except ValueError as e:
+            self.rejected += 1
+            logger.warning("MQTT bridge: dropped message on %s: %s", topic, e)
+            return
+        self.sink(self.stamp(readings, received_ms))
+
+    def publish_updates(self, changed: Dict[str, Dict]) -> None:
+        # Retained, so a dashboard that subscribes later gets every node's latest value
+        for node_id, record in changed.items():
+            self.broker.publish(f"{self.output_prefix}/{node_id}", dumps(record), retain=True)
+
+    def forget_node(self, node_id: str) -> None:
+        # An empty retained payload clears the node's retained record on the broker
+        self.broker.publish(f"{self.output_prefix}/{node_id}", b"", retain=True)
+
+    def stats(self) -> Dict:
+        return {"received": self.received, "rejected": self.rejected}
@@ -0,0 +1,190 @@
+"""Node liveness: first/last seen, expected report interval and state.
+
+A node is ``online`` while it reports within ``stale_factor`` expected
+intervals, ``stale`` until ``offline_factor`` intervals, then ``offline``;
+after ``reclaim_s`` seconds of silence it is dropped from the registry and
+the backend frees everything it holds for it.
+
+Deadlines live in a hashed timer wheel instead of being found by scanning
+every node.  Each node has exactly one wheel entry, for its next possible
+transition.  A sample only moves ``last_seen``; when the entry comes due,
+the node's state is recomputed from ``last_seen`` and the entry is
+rescheduled, so a healthy node costs one wheel operation per stale period,
+not one per sample.
+"""
+
+from typing import Dict, Hashable, List, Optional, Tuple
+
+ONLINE = "online"
+STALE = "stale"
+OFFLINE = "offline"
+STATES = (ONLINE, STALE, OFFLINE)
+
+DEFAULT_INTERVAL = 5.0      # seconds between reports (the firmware default)
+STALE_FACTOR = 3            # missed intervals before a node is stale
+OFFLINE_FACTOR = 12         # ... and offline
+RECLAIM_AFTER = 24 * 3600   # seconds of silence before a node is forgotten
+
+
+class TimerWheel:
+    """Hashed timer wheel of ``slots`` buckets, ``tick_ms`` wide.
+
+    A key is in at most one bucket; scheduling it again moves it.  Entries
+    more than one rotation away stay in their bucket until their round.
+    """
+
+    def __init__(self, tick_ms: int = 1000, slots: int = 512):
+        self.tick_ms = tick_ms
+        self.buckets: List[Dict[Hashable, int]] = [{} for _ in range(slots)]
+        self._where: Dict[Hashable, int] = {}  # key -> bucket index
+        self.current: Optional[int] = None     # last processed tick
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+    def schedule(self, key: Hashable, due_ms: int) -> None:
+        tick = -(-due_ms // self.tick_ms)  # round up: never fire early
+        if self.current is not None and tick <= self.current:
+            tick = self.current + 1
+        self.cancel(key)
+        index = tick % len(self.buckets)
+        self.buckets[index][key] = tick
+        self._where[key] = index
+
+    def cancel(self, key: Hashable) -> None:
+        index = self._where.pop(key, None)
+        if index is not None:
+            del self.buckets[index][key]
+
+    def advance(self, now_ms: int) -> List[Hashable]:
+        """Remove and return the keys due at or before ``now_ms``."""
+        target = now_ms // self.tick_ms
+        slots = len(self.buckets)
+        if self.current is None:
+            # First call: entries scheduled so far may be overdue, look at all of them
+            self.current = target - slots
+        if target <= self.current:
+            return []
+        if target - self.current >= slots:
+            indexes = range(slots)  # a full rotation or more: visit every bucket once
+        else:
+            indexes = [t % slots for t in range(self.current + 1, target + 1)]
+        self.current = target
+        expired = []
+        for index in indexes:
+            bucket = self.buckets[index]
+            due = [key for key, tick in bucket.items() if tick <= target]
+            for key in due:
+                del bucket[key]
+                del self._where[key]
+            expired.extend(due)
+        return expired
+
+
+class NodeInfo:
+    __slots__ = ("first_seen", "last_seen", "state")
+
+    def __init__(self, ts: int):
+        self.first_seen = ts
+        self.last_seen = ts
+        self.state = ONLINE
+
+
+class NodeRegistry:
+    """Liveness of every known node; not thread-safe (used under the store lock)."""
+
+    def __init__(self, interval_s: float = DEFAULT_INTERVAL, stale_factor: float = STALE_FACTOR,
+                 offline_factor: float = OFFLINE_FACTOR, reclaim_s: float = RECLAIM_AFTER,
+                 tick_ms: int = 1000):
+        self.interval_s = interval_s
+        self.stale_factor = stale_factor
+        self.offline_factor = offline_factor
+        self.reclaim_ms = int(reclaim_s * 1000)
+        self.nodes: Dict[str, NodeInfo] = {}
+        # Configured report intervals; kept when a node is reclaimed
+        self.intervals: Dict[str, float] = {}
+        self.wheel = TimerWheel(tick_ms)
+        # Bumped by every state change (new, revived, transition, reclaim)
+        self.changes = 0
+
+    def __contains__(self, node_id: str) -> bool:
+        return node_id in self.nodes
+
+    def interval(self, node_id: str) -> float:
+        return self.intervals.get(node_id, self.interval_s)
+
+    def _limits(self, node_id: str) -> Tuple[int, int, int]:
+        interval_ms = self.interval(node_id) * 1000
+        return (int(interval_ms * self.stale_factor), int(interval_ms * self.offline_factor),
+                max(self.reclaim_ms, int(interval_ms * self.offline_factor)))
+
+    def _state_for(self, node_id: str, age: int) -> Optional[str]:
+        stale, offline, reclaim = self._limits(node_id)
+        if age < stale:
+            return ONLINE
+        if age < offline:
+            return STALE
+        if age < reclaim:
+            return OFFLINE
+        return None
+
+    def _schedule(self, node_id: str, info: NodeInfo) -> None:
+        # Next possible transition of the node's current state
+        limit = self._limits(node_id)[STATES.index(info.state)]
+        self.wheel.schedule(node_id, info.last_seen + limit)
+
+    def seen(self, node_id: str, ts: int) -> Optional[str]:
+        """Record a report at ``ts`` (ms); returns the previous state if the
+        node was stale/offline, ``"new"`` for a new node, else None."""
+        info = self.nodes.get(node_id)
+        if info is None:
+            info = self.nodes[node_id] = NodeInfo(ts)
+            self._schedule(node_id, info)
+            self.changes += 1
+            return "new"
+        if ts > info.last_seen:
+            info.last_seen = ts
+        if info.state == ONLINE:
+            return None  # the pending entry is re-evaluated when it comes due
+        previous, info.state = info.state, ONLINE
+        self._schedule(node_id, info)
+        self.changes += 1
+        return previous
+
+    def advance(self, now: int) -> Tuple[List[Tuple[str, str]], List[str]]:
+        """Apply due transitions; returns ([(node_id, new state)], [reclaimed node_id])."""
+        transitions = []
+        reclaimed = []
+        for node_id in self.wheel.advance(now):
+            info = self.nodes.get(node_id)
+            if info is None:
+                continue
+            state = self._state_for(node_id, now - info.last_seen)
+            if state is None:
+                del self.nodes[node_id]
+                reclaimed.append(node_id)
+                continue
+            if state != info.state:
+                info.state = state
+                transitions.append((node_id, state))
+            self._schedule(node_id, info)
+        self.changes += len(transitions) + len(reclaimed)
+        return transitions, reclaimed
+
+    def set_interval(self, node_id: str, interval_s: float) -> None:
+        if not interval_s > 0:
+            raise ValueError("interval_s must be positive")
+        self.intervals[node_id] = interval_s
+        info = self.nodes.get(node_id)
+        if info is not None:
+            self._schedule(node_id, info)
+
+    def state(self, node_id: str) -> Optional[str]:
+        info = self.nodes.get(node_id)
+        return info.state if info is not None else None
+
+    def counts(self) -> Dict[str, int]:
+        counts = dict.fromkeys(STATES, 0)
+        for info in self.nodes.values():
+            counts[info.state] += 1
+        return counts
@@ -0,0 +1,456 @@
+"""Optional on-disk persistence for sensor samples.
+
+Layout under ``data_dir``::
+
+    wal/000001.log        append-only segments, group-committed with one fsync
+    nodes/<node>/<day>.dat  compacted per-node, per-UTC-day partitions
+    nodes/<node>/<day>.import.dat  bulk-imported samples, written directly
+    compact.json          intent record of an in-progress compaction
+
+WAL record: ``<II`` (body length, crc32) followed by the body
+``<dddH`` (ts, temperature, humidity, node id length) + node id bytes.
+A torn or corrupt tail (crash mid-write) ends replay of that segment.
+Partition record: fixed ``<ddd`` (ts, temperature, humidity).
+
+Closed segments are compacted in the background: partitions are appended,
+fsynced, then the segment is deleted.  The intent file records partition
+sizes before the append, so a crash mid-compaction is rolled back and redone
+on the next start instead of duplicating samples.
+
+Imported samples skip the WAL and go to their own partitions, fsynced
+before ``write_imported`` returns, so recovery can replay them apart from
+live readings.
+"""
+
+from array import array
+from itertools import compress
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from urllib.parse import quote, unquote
+import calendar
+import json
+import logging
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+
+log = logging.getLogger("persistence")
+
+HEADER = struct.Struct("<II")
+BODY = struct.Struct("<dddH")
+SAMPLE = struct.Struct("<ddd")
+
+IMPORTED_SUFFIX = ".import.dat"
+
+SEGMENT_BYTES = 8 * 1024 * 1024
+FLUSH_INTERVAL = 0.05  # seconds between group commits
+FLUSH_BYTES = 256 * 1024  # commit early when this much is buffered
+
+Sample = Tuple[float, float, float]
+ReplayCallback = Callable[[str, float, float, float], None]
+Columns = Tuple[array, array, array]
+
+
+def _fsync_dir(path: str) -> None:
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _in_range(ts: float, start: Optional[float], end: Optional[float]) -> bool:
+    return (start is None or ts >= start) and (end is None or ts < end)
+
+
+def encode_record(node_id: str, ts: float, temperature: float, humidity: float) -> bytes:
+    node = node_id.encode("utf-8")
+    body = BODY.pack(ts, temperature, humidity, len(node)) + node
+    return HEADER.pack(len(body), zlib.crc32(body)) + body
+
+
+def iter_segment(data: bytes):
+    """Yield (end_offset, node_id, ts, temperature, humidity) for valid records."""
+    view = memoryview(data)
+    pos = 0
+    end = len(view)
+    while pos + HEADER.size <= end:
+        length, crc = HEADER.unpack_from(view, pos)
+        body_start = pos + HEADER.size
+        body_end = body_start + length
+        if length < BODY.size or body_end > end:
+            return
+        body = view[body_start:body_end]
+        if zlib.crc32(body) != crc:
+            return
+        ts, temp, hum, node_len = BODY.unpack_from(body)
+        if BODY.size + node_len != length:
+            return
+        node_id = bytes(body[BODY.size:]).decode("utf-8")
+        pos = body_end
+        yield pos, node_id, ts, temp, hum
+
+
+class Persistence:
+    def __init__(self, data_dir: str, segment_bytes: int = SEGMENT_BYTES,
+                 flush_interval: float = FLUSH_INTERVAL, flush_bytes: int = FLUSH_BYTES):
+        self.data_dir = data_dir
+        self.wal_dir = os.path.join(data_dir, "wal")
+        self.nodes_dir = os.path.join(data_dir, "nodes")
+        self.intent_path = os.path.join(data_dir, "compact.json")
+        self.segment_bytes = segment_bytes
+        self.flush_interval = flush_interval
+        self.flush_bytes = flush_bytes
+
+        os.makedirs(self.wal_dir, exist_ok=True)
+        os.makedirs(self.nodes_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._commit_lock = threading.Lock()
+        # Held while a segment moves into the partitions, so readers see it in one place
+        self._compact_lock = threading.Lock()
+        self._buffer = bytearray()
+        self._closed_segments: List[int] = []
+        self._segment_no = 0
+        self._segment = None
+        self._segment_size = 0
+        self._writer: Optional[threading.Thread] = None
+        self._stopping = False
+
+    # ---------- paths ----------
+    def _segment_path(self, number: int) -> str:
+        return os.path.join(self.wal_dir, f"{number:06d}.log")
+
+    def _partition_path(self, node_id: str, ts: float, imported: bool = False) -> str:
+        day = time.strftime("%Y%m%d", time.gmtime(ts))
+        suffix = IMPORTED_SUFFIX if imported else ".dat"
+        return os.path.join(self.nodes_dir, quote(node_id, safe=""), day + suffix)
+
+    def _partition_names(self, node_dir: str, imported: bool = False) -> List[str]:
+        names = os.listdir(os.path.join(self.nodes_dir, node_dir))
+        return sorted(name for name in names if name.endswith(IMPORTED_SUFFIX) == imported)
+
+    def _segment_numbers(self) -> List[int]:
+        numbers = []
+        for name in os.listdir(self.wal_dir):
+            if name.endswith(".log") and name[:-4].isdigit():
+                numbers.append(int(name[:-4]))
+        return sorted(numbers)
+
+    # ---------- startup ----------
+    def recover(self, callback: ReplayCallback, history_limit: int,
+                backfill: Optional[ReplayCallback] = None, backfill_since: Optional[float] = None,
+                imported: Optional[ReplayCallback] = None) -> int:
+        """Replay stored samples through ``callback`` in chronological order.
+
+        Only the newest ``history_limit`` samples per node are read from the
+        compacted partitions; every sample still in the WAL is replayed.
+        With ``backfill``, the older partition samples from ``backfill_since``
+        on go through it first (to rebuild aggregates that outlive the raw
+        history).  Imported samples are replayed the same way, but through
+        ``imported`` instead of ``callback`` (and not at all without it).
+        Returns the number of samples replayed.
+        """
+        self._finish_interrupted_compaction()
+        count = 0
+
+        wal_counts: Dict[str, int] = {}
+        segments = self._segment_numbers()
+        segment_data = []
+        for number in segments:
+            with open(self._segment_path(number), "rb") as f:
+                data = f.read()
+            segment_data.append(data)
+            for _, node_id, _, _, _ in iter_segment(data):
+                wal_counts[node_id] = wal_counts.get(node_id, 0) + 1
+
+        if os.path.isdir(self.nodes_dir):
+            for entry in sorted(os.listdir(self.nodes_dir)):
+                node_id = unquote(entry)
+                wanted = history_limit - wal_counts.get(node_id, 0)
+                recent = self._read_recent(entry, max(wanted, 1))
+                if backfill is not None:
+                    count += self._backfill(entry, node_id, backfill, backfill_since, len(recent))
+                for ts, temp, hum in recent:
+                    callback(node_id, ts, temp, hum)
+                    count += 1
+                if imported is not None:
+                    recent = self._read_recent(entry, history_limit, imported=True)
+                    if backfill is not None:
+                        count += self._backfill(entry, node_id, backfill, backfill_since, len(recent), imported=True)
+                    for ts, temp, hum in recent:
+                        imported(node_id, ts, temp, hum)
+                        count += 1
+
+        for data in segment_data:
+            for _, node_id, ts, temp, hum in iter_segment(data):
+                callback(node_id, ts, temp, hum)
+                count += 1
+
+        self._closed_segments = segments
+        self._segment_no = (segments[-1] if segments else 0) + 1
+        return count
+
+    def _read_recent(self, node_dir: str, limit: int, imported: bool = False) -> List[Sample]:
+        path = os.path.join(self.nodes_dir, node_dir)
+        chunks: List[List[Sample]] = []
+        remaining = limit
+        for name in reversed(self._partition_names(node_dir, imported)):
+            if remaining <= 0:
+                break
+            with open(os.path.join(path, name), "rb") as f:
+                f.seek(0, os.SEEK_END)
+                size = f.tell() - f.tell() % SAMPLE.size
+                take = min(remaining, size // SAMPLE.size)
+                f.seek(size - take * SAMPLE.size)
+                data = f.read(take * SAMPLE.size)
+            chunks.append(list(SAMPLE.iter_unpack(data)))
+            remaining -= take
+        samples: List[Sample] = []
+        for chunk in reversed(chunks):
+            samples.extend(chunk)
+        return samples
+
+    def _backfill(self, node_dir: str, node_id: str, callback: ReplayCallback,
+                  since: Optional[float], skip_last: int, imported: bool = False) -> int:
+        # Every partition sample from the day of ``since`` on, except the newest
+        # ``skip_last`` (replayed by recover itself); read a file at a time
+        path = os.path.join(self.nodes_dir, node_dir)
+        files = []
+        for name in self._partition_names(node_dir, imported):
+            day = calendar.timegm(time.strptime(name[:8], "%Y%m%d"))
+            if since is not None and day + 86400 <= since:
+                continue
+            size = os.path.getsize(os.path.join(path, name))
+            files.append((os.path.join(path, name), size // SAMPLE.size))
+        remaining = sum(n for _, n in files) - skip_last
+        count = 0
+        for file_path, n in files:
+            if remaining <= 0:
+                break
+            take = min(remaining, n)
+            values = array("d")
+            with open(file_path, "rb") as f:
+                values.frombytes(f.read(take * SAMPLE.size))
+            if sys.byteorder == "big":
+                values.byteswap()
+            for ts, temp, hum in zip(values[0::3], values[1::3], values[2::3]):
+                callback(node_id, ts, temp, hum)
+            remaining -= take
+            count += take
+        return count
+
+    def start(self) -> None:
+        if self._writer is not None:
+            return
+        if self._segment_no == 0:
+            self._closed_segments = self._segment_numbers()
+            self._segment_no = (self._closed_segments[-1] if self._closed_segments else 0) + 1
+        self._open_segment()
+        self._writer = threading.Thread(target=self._run, name="wal-writer", daemon=True)
+        self._writer.start()
+
+    def close(self) -> None:
+        with self._lock:
+            self._stopping = True
+            self._wake.notify()
+        if self._writer is not None:
+            self._writer.join()
+            self._writer = None
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+
+    # ---------- ingest ----------
+    def append(self, node_id: str, ts: float, temperature: float, humidity: float) -> None:
+        record = encode_record(node_id, ts, temperature, humidity)
+        with self._lock:
+            self._buffer += record
+            if len(self._buffer) >= self.flush_bytes:
+                self._wake.notify()
+
+    def write_imported(self, node_id: str, samples: Iterable[Sample]) -> None:
+        """Store bulk-imported (ts, temperature, humidity) samples of one node."""
+        partitions: Dict[str, bytearray] = {}
+        for ts, temp, hum in samples:
+            target = self._partition_path(node_id, ts, imported=True)
+            partitions.setdefault(target, bytearray()).extend(SAMPLE.pack(ts, temp, hum))
+        with self._compact_lock:
+            for target, payload in partitions.items():
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with open(target, "ab") as f:
+                    # A crash mid-import can leave a partial record: cut it off first
+                    f.truncate(f.tell() - f.tell() % SAMPLE.size)
+                    f.write(payload)
+                    f.flush()
+                    os.fsync(f.fileno())
+                _fsync_dir(os.path.dirname(target))
+
+    def flush(self) -> None:
+        """Write and fsync everything buffered so far."""
+        with self._lock:
+            data = bytes(self._buffer)
+            self._buffer.clear()
+        if data:
+            with self._commit_lock:
+                self._commit(data)
+
+    # ---------- writer thread ----------
+    def _open_segment(self) -> None:
+        path = self._segment_path(self._segment_no)
+        self._segment = open(path, "ab")
+        self._segment_size = self._segment.tell()
+        _fsync_dir(self.wal_dir)
+
+    def _commit(self, data: bytes) -> None:
+        self._segment.write(data)
+        self._segment.flush()
+        os.fsync(self._segment.fileno())
+        self._segment_size += len(data)
+        if self._segment_size >= self.segment_bytes:
+            self._segment.close()
+            self._closed_segments.append(self._segment_no)
+            self._segment_no += 1
+            self._open_segment()
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                if not self._buffer and not self._stopping:
+                    self._wake.wait(self.flush_interval)
+                stopping = self._stopping
+                data = bytes(self._buffer)
+                self._buffer.clear()
+            if data:
+                with self._commit_lock:
+                    self._commit(data)
+            if stopping:
+                return
+            if self._closed_segments:
+                try:
+                    self._compact(self._closed_segments[0])
+                    self._closed_segments.pop(0)
+                except OSError:
+                    log.exception("compaction of segment %d failed", self._closed_segments[0])
+
+    # ---------- export ----------
+    def read_range(self, node_ids: Optional[Set[str]] = None, start: Optional[float] = None,
+                   end: Optional[float] = None) -> Iterator[Tuple[str, array, array, array]]:
+        """Yield (node_id, ts, temperature, humidity) columns with start <= ts < end.
+
+        One chunk per node and day partition, read as a block straight into
+        ``array('d')`` columns, then one per node for samples still in the
+        WAL.  Rows within a chunk are in storage order (chronological except
+        for late readings).  Samples buffered but not yet committed are not
+        included.
+        """
+        # Snapshot under the compaction lock: the WAL bytes, and each partition's
+        # size, so a segment compacted meanwhile is neither missed nor read twice
+        with self._compact_lock:
+            wal = []
+            for number in self._segment_numbers():
+                try:
+                    with open(self._segment_path(number), "rb") as f:
+                        wal.append(f.read())
+                except FileNotFoundError:
+                    pass
+            partitions: Dict[str, List[Tuple[str, float, int]]] = {}
+            for entry in sorted(os.listdir(self.nodes_dir)):
+                node_id = unquote(entry)
+                if node_ids is not None and node_id not in node_ids:
+                    continue
+                node_dir = os.path.join(self.nodes_dir, entry)
+                for name in sorted(os.listdir(node_dir)):
+                    day = calendar.timegm(time.strptime(name[:8], "%Y%m%d"))
+                    if (start is not None and day + 86400 <= start) or (end is not None and day >= end):
+                        continue
+                    path = os.path.join(node_dir, name)
+                    partitions.setdefault(node_id, []).append((path, day, os.path.getsize(path)))
+
+        recent: Dict[str, Columns] = {}
+        for data in wal:
+            for _, node_id, ts, temp, hum in iter_segment(data):
+                if (node_ids is not None and node_id not in node_ids) or not _in_range(ts, start, end):
+                    continue
+                columns = recent.get(node_id)
+                if columns is None:
+                    columns = recent[node_id] = (array("d"), array("d"), array("d"))
+                columns[0].append(ts)
+                columns[1].append(temp)
+                columns[2].append(hum)
+
+        for node_id in sorted(partitions.keys() | recent.keys()):
+            for path, day, size in partitions.get(node_id, ()):
+                values = array("d")
+                with open(path, "rb") as f:
+                    values.frombytes(f.read(size - size % SAMPLE.size))
+                if sys.byteorder == "big":
+                    values.byteswap()
+                ts, temp, hum = values[0::3], values[1::3], values[2::3]
+                if (start is not None and day < start) or (end is not None and day + 86400 > end):
+                    # Only the first and last day need a per-sample range check
+                    keep = [_in_range(t, start, end) for t in ts]
+                    ts, temp, hum = (array("d", compress(c, keep)) for c in (ts, temp, hum))
+                yield node_id, ts, temp, hum
+            if node_id in recent:
+                yield (node_id,) + recent[node_id]
+
+    # ---------- compaction ----------
+    def _compact(self, number: int) -> None:
+        with self._compact_lock:
+            self._compact_segment(number)
+
+    def _compact_segment(self, number: int) -> None:
+        path = self._segment_path(number)
+        with open(path, "rb") as f:
+            data = f.read()
+
+        partitions: Dict[str, bytearray] = {}
+        for _, node_id, ts, temp, hum in iter_segment(data):
+            target = self._partition_path(node_id, ts)
+            partitions.setdefault(target, bytearray()).extend(SAMPLE.pack(ts, temp, hum))
+
+        sizes = {p: (os.path.getsize(p) if os.path.exists(p) else 0) for p in partitions}
+        self._write_intent({"segment": number, "sizes": sizes})
+
+        for target, payload in partitions.items():
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, "ab") as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+
+        os.remove(path)
+        _fsync_dir(self.wal_dir)
+        os.remove(self.intent_path)
+
+    def _write_intent(self, intent: Dict) -> None:
+        tmp = self.intent_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(intent, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.intent_path)
+        _fsync_dir(self.data_dir)
+
+    def _finish_interrupted_compaction(self) -> None:
+        if not os.path.exists(self.intent_path):
+            return
+        with open(self.intent_path) as f:
+            intent = json.load(f)
+        segment = self._segment_path(intent["segment"])
+        if os.path.exists(segment):
+            # Segment still present: roll partitions back, it will be compacted again
+            for target, size in intent["sizes"].items():
+                if os.path.exists(target):
+                    with open(target, "r+b") as f:
+                        f.truncate(size)
+        os.remove(self.intent_path)
@@ -0,0 +1,198 @@
+"""Pre-aggregated rollup tiers maintained incrementally on ingest.
+
+Every tier keeps, per node, a ring of fixed-width buckets with
+count/min/max/sum/last columns for temperature and humidity.  ``last`` is
+the reading with the newest timestamp, not the one added most recently, so
+late or backfilled samples don't replace it.  Adding a sample
+touches one bucket (or advances the ring by the number of buckets that
+elapsed), so ingest cost is O(1) and memory is bounded by
+``retention`` buckets per tier per node no matter how long a node runs.
+
+Timestamps and steps are epoch milliseconds, like the raw history.
+Readings with a non-finite value (a sensor dropout) are left out, so one
+NaN doesn't poison a bucket's sum.
+"""
+
+from array import array
+from typing import Dict, List, Optional, Tuple
+import math
+
+# (name, bucket width in seconds, buckets retained)
+DEFAULT_TIERS = (
+    ("1m", 60, 24 * 60),        # one day of minutes
+    ("1h", 3600, 30 * 24),      # thirty days of hours
+    ("1d", 86400, 365),         # one year of days
+)
+
+INF = float("inf")
+
+
+class RollupRing:
+    """count/min/max/sum/last buckets for one node at one resolution."""
+
+    __slots__ = ("width", "retention", "latest", "count", "last_ts",
+                 "t_min", "t_max", "t_sum", "t_last", "h_min", "h_max", "h_sum", "h_last")
+
+    def __init__(self, width: int, retention: int):
+        self.width = width  # milliseconds
+        self.retention = retention
+        self.latest: Optional[int] = None  # bucket number (ts // width) of the newest bucket
+        self.count = array("l", bytes(array("l").itemsize * retention))
+        self.last_ts = array("q", bytes(8 * retention))  # ms timestamp of t_last/h_last
+        self.t_min = array("d", [INF]) * retention
+        self.t_max = array("d", [-INF]) * retention
+        self.t_sum = array("d", bytes(8 * retention))
+        self.t_last = array("d", bytes(8 * retention))
+        self.h_min = array("d", [INF]) * retention
+        self.h_max = array("d", [-INF]) * retention
+        self.h_sum = array("d", bytes(8 * retention))
+        self.h_last = array("d", bytes(8 * retention))
+
+    def _clear(self, idx: int) -> None:
+        self.count[idx] = 0
+        self.last_ts[idx] = 0
+        self.t_min[idx] = INF
+        self.t_max[idx] = -INF
+        self.t_sum[idx] = 0.0
+        self.h_min[idx] = INF
+        self.h_max[idx] = -INF
+        self.h_sum[idx] = 0.0
+        self.t_last[idx] = 0.0
+        self.h_last[idx] = 0.0
+
+    def add(self, ts: int, temperature: float, humidity: float) -> None:
+        bucket = int(ts // self.width)
+        if self.latest is None:
+            self.latest = bucket
+        elif bucket > self.latest:
+            # Recycle the buckets that fell out of the retention window
+            for b in range(max(self.latest + 1, bucket - self.retention + 1), bucket + 1):
+                self._clear(b % self.retention)
+            self.latest = bucket
+        elif bucket <= self.latest - self.retention:
+            return  # older than the retained window
+
+        idx = bucket % self.retention
+        if not self.count[idx] or ts >= self.last_ts[idx]:
+            self.last_ts[idx] = ts
+            self.t_last[idx] = temperature
+            self.h_last[idx] = humidity
+        self.count[idx] += 1
+        self.t_sum[idx] += temperature
+        self.h_sum[idx] += humidity
+        if temperature < self.t_min[idx]:
+            self.t_min[idx] = temperature
+        if temperature > self.t_max[idx]:
+            self.t_max[idx] = temperature
+        if humidity < self.h_min[idx]:
+            self.h_min[idx] = humidity
+        if humidity > self.h_max[idx]:
+            self.h_max[idx] = humidity
+
+    def buckets(self, start: Optional[float] = None, end: Optional[float] = None):
+        """Yield (bucket_start, count, (t_min, t_max, t_sum, t_last),
+        (h_min, h_max, h_sum, h_last)) for non-empty buckets with
+        start <= bucket_start < end, oldest first."""
+        if self.latest is None:
+            return
+        first = self.latest - self.retention + 1
+        if start is not None:
+            first = max(first, -int(-start // self.width))
+        last = self.latest
+        if end is not None:
+            last = min(last, -int(-end // self.width) - 1)
+        for b in range(first, last + 1):
+            idx = b % self.retention
+            n = self.count[idx]
+            if n:
+                yield (b * self.width, n,
+                       (self.t_min[idx], self.t_max[idx], self.t_sum[idx], self.t_last[idx]),
+                       (self.h_min[idx], self.h_max[idx], self.h_sum[idx], self.h_last[idx]))
+
+    def memory_bytes(self) -> int:
+        return self.retention * (self.count.itemsize + self.last_ts.itemsize + 8 * 8)
+
+
+class RollupStore:
+    """Per-node rollup rings for every configured tier."""
+
+    def __init__(self, tiers: Tuple[Tuple[str, int, int], ...] = DEFAULT_TIERS):
+        self.tiers = tiers
+        self.nodes: Dict[str, List[RollupRing]] = {}
+
+    def add(self, node_id: str, ts: int, temperature: float, humidity: float) -> None:
+        if not (math.isfinite(temperature) and math.isfinite(humidity)):
+            return
+        rings = self.nodes.get(node_id)
+        if rings is None:
+            rings = self.nodes[node_id] = [RollupRing(width * 1000, retention)
+                                           for _, width, retention in self.tiers]
+        for ring in rings:
+            ring.add(ts, temperature, humidity)
+
+    def horizon(self) -> int:
+        """Seconds covered by the longest-retained tier."""
+        return max(width * retention for _, width, retention in self.tiers)
+
+    def tier_for(self, step: int, start: Optional[int] = None, now: Optional[int] = None) -> Optional[int]:
+        """Index of the coarsest tier whose width divides ``step`` and whose
+        retention still covers ``start`` (all in ms); None if raw data must be used."""
+        best = None
+        for i, (_, width_s, retention) in enumerate(self.tiers):
+            width = width_s * 1000
+            if step < width or step % width:
+                continue
+            if start is not None and now is not None and start < now - width * retention:
+                continue
+            best = i
+        return best
+
+    def ring(self, node_id: str, tier: int) -> Optional[RollupRing]:
+        rings = self.nodes.get(node_id)
+        return rings[tier] if rings is not None else None
+
+    def remove(self, node_id: str) -> None:
+        self.nodes.pop(node_id, None)
+
+    def memory_bytes(self) -> int:
+        return sum(r.memory_bytes() for rings in self.nodes.values() for r in rings)
+
+
+def merge_buckets(ring: RollupRing, step: float, agg: str,
+                  start: Optional[float] = None, end: Optional[float] = None):
+    """Combine tier buckets into ``step``-wide buckets.
+
+    Yields (bucket_start, count, [temperature, humidity]) like
+    ``history_query.aggregate``.
+    """
+    current = None
+    for bucket_ts, n, t, h in ring.buckets(start, end):
+        key = (bucket_ts // step) * step
+        if current is None or key != current[0]:
+            if current is not None:
+                yield _finish(current, agg)
+            current = [key, 0, INF, -INF, 0.0, INF, -INF, 0.0, 0.0, 0.0]
+        current[1] += n
+        current[2] = min(current[2], t[0])
+        current[3] = max(current[3], t[1])
+        current[4] += t[2]
+        current[5] = min(current[5], h[0])
+        current[6] = max(current[6], h[1])
+        current[7] += h[2]
+        current[8] = t[3]
+        current[9] = h[3]
+    if current is not None:
+        yield _finish(current, agg)
+
+
+def _finish(c, agg: str):
+    key, n = c[0], c[1]
+    if agg == "min":
+        values = [c[2], c[5]]
+    elif agg == "max":
+        values = [c[3], c[6]]
+    elif agg == "last":
+        values = [c[8], c[9]]
+    else:
+        values = [c[4] / n, c[7] / n]
+    return key, n, values
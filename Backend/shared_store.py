@@ -0,0 +1,213 @@
+"""Latest-value sensor table shared by several worker processes.
+
+The table lives in one mmap'd file (``/dev/shm`` by default), so every
+uvicorn worker sees the same ``/data``.  Layout::
+
+    header  <IIQ   magic, slot count, global write version
+    slot    <IIQqddH46s  seq, anomaly flags, version, ts (epoch ms), temperature,
+                         humidity, node id length, node id bytes
+
+A node is placed by ``crc32(node_id) % slots`` with linear probing and never
+moves, so each process caches its node -> slot index (checked against the
+slot's node id on every write).  ``remove`` marks a node's slot as removed
+(``REMOVED`` in the length field) with a new version, so readers see the
+removal, and the slot is reused by the next new node that probes past it.
+Writers serialize on
+an ``flock`` of the file; readers take no lock and use a seqlock: the slot
+``seq`` is odd while a write is in progress, and a read is retried if
+``seq`` was odd or changed underneath it.
+"""
+
+from typing import Dict, Optional, Tuple
+import fcntl
+import mmap
+import os
+import struct
+import zlib
+
+MAGIC = 0x57545343  # "WTSC" (ts in epoch ms; "WTSB" stored seconds)
+HEADER = struct.Struct("<IIQ")
+SLOT = struct.Struct("<IIQqddH46s")
+SEQ = struct.Struct("<I")
+VERSION = struct.Struct("<Q")
+MAX_NODE_ID = 46
+READ_RETRIES = 10000
+
+DEFAULT_PATH = "/dev/shm/weather-sensors.tbl"
+DEFAULT_SLOTS = 4096
+REMOVED = 0x8000  # length field flag: the slot's node was removed, the slot is free
+
+# Byte offsets of the flags and version fields inside a slot
+_FLAGS_OFF = 4
+_VERSION_OFF = 8
+
+
+class SharedStoreFull(RuntimeError):
+    pass
+
+
+class SharedStore:
+    def __init__(self, path: str = DEFAULT_PATH, slots: int = DEFAULT_SLOTS):
+        self.path = path
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        size = HEADER.size + slots * SLOT.size
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self.fd).st_size == 0:
+                os.ftruncate(self.fd, size)
+                self.mm = mmap.mmap(self.fd, size)
+                HEADER.pack_into(self.mm, 0, MAGIC, slots, 0)
+            else:
+                self.mm = mmap.mmap(self.fd, os.fstat(self.fd).st_size)
+                magic, slots, _ = HEADER.unpack_from(self.mm, 0)
+                if magic != MAGIC:
+                    raise ValueError(f"{path} is not a sensor table of this version (delete it to recreate)")
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        self.slots = slots
+        self._index: Dict[str, int] = {}
+
+    def close(self) -> None:
+        self.mm.close()
+        os.close(self.fd)
+
+    @property
+    def version(self) -> int:
+        return VERSION.unpack_from(self.mm, 8)[0]
+
+    def _offset(self, slot: int) -> int:
+        return HEADER.size + slot * SLOT.size
+
+    def _node_at(self, slot: int) -> Tuple[int, bytes]:
+        off = self._offset(slot)
+        length = struct.unpack_from("<H", self.mm, off + 40)[0]
+        size = length & ~REMOVED
+        return length, bytes(self.mm[off + 42:off + 42 + size])
+
+    def _find(self, node: bytes, create: bool) -> Optional[int]:
+        # Linear probe from the node's home slot; create only under the write lock.
+        # Removed slots don't end the probe (the node may sit further on) but the
+        # first one is where a new node goes
+        start = zlib.crc32(node) % self.slots
+        free = None
+        for i in range(self.slots):
+            slot = (start + i) % self.slots
+            length, name = self._node_at(slot)
+            if length == 0:
+                break
+            if length & REMOVED:
+                if free is None:
+                    free = slot
+            elif name == node:
+                return slot
+        else:
+            slot = None
+        if not create:
+            return None
+        if free is not None:
+            slot = free
+        if slot is None:
+            raise SharedStoreFull(f"all {self.slots} slots are in use")
+        off = self._offset(slot)
+        seq = SEQ.unpack_from(self.mm, off)[0]
+        if seq:
+            # A reused slot: version 0 hides the previous node's values until written
+            SEQ.pack_into(self.mm, off, seq + 1)
+            VERSION.pack_into(self.mm, off + _VERSION_OFF, 0)
+        struct.pack_into("<H46s", self.mm, off + 40, len(node), node)
+        if seq:
+            SEQ.pack_into(self.mm, off, seq + 2)
+        return slot
+
+    def _slot_for(self, node_id: str) -> int:
+        # Cached slot, unless another process removed the node and reused the slot
+        slot = self._index.get(node_id)
+        node = node_id.encode("utf-8")
+        if slot is None or self._node_at(slot) != (len(node), node):
+            slot = self._index[node_id] = self._find(node, create=True)
+        return slot
+
+    def _write(self, slot: int, values) -> None:
+        off = self._offset(slot)
+        seq = SEQ.unpack_from(self.mm, off)[0]
+        SEQ.pack_into(self.mm, off, seq + 1)  # odd: write in progress
+        struct.pack_into("<IQqdd", self.mm, off + _FLAGS_OFF, *values)
+        SEQ.pack_into(self.mm, off, seq + 2)
+
+    def write_many(self, samples) -> None:
+        """Store the latest (node_id, ts, temperature, humidity, flags) for each node.
+
+        Every node gets its slot before anything is written, so a bad node id
+        or a full table raises with the table unchanged (apart from slots
+        reserved for the valid ids).
+        """
+        samples = list(samples)
+        for sample in samples:
+            if len(sample[0].encode("utf-8")) > MAX_NODE_ID:
+                raise ValueError(f"node id longer than {MAX_NODE_ID} bytes")
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            slots = [self._slot_for(sample[0]) for sample in samples]
+            version = self.version
+            for slot, (_, ts, temperature, humidity, flags) in zip(slots, samples):
+                version += 1
+                self._write(slot, (flags, version, ts, temperature, humidity))
+            VERSION.pack_into(self.mm, 8, version)
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def remove(self, node_ids) -> None:
+        """Free the slots of these nodes; readers see each removal as a new version."""
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            version = self.version
+            for node_id in node_ids:
+                self._index.pop(node_id, None)
+                node = node_id.encode("utf-8")
+                slot = self._find(node, create=False) if len(node) <= MAX_NODE_ID else None
+                if slot is None:
+                    continue
+                version += 1
+                off = self._offset(slot)
+                seq = SEQ.unpack_from(self.mm, off)[0]
+                SEQ.pack_into(self.mm, off, seq + 1)
+                VERSION.pack_into(self.mm, off + _VERSION_OFF, version)
+                struct.pack_into("<H", self.mm, off + 40, len(node) | REMOVED)
+                SEQ.pack_into(self.mm, off, seq + 2)
+            VERSION.pack_into(self.mm, 8, version)
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def _read_slot(self, slot: int) -> Optional[Tuple[str, int, Optional[Tuple[int, float, float, int]]]]:
+        off = self._offset(slot)
+        for _ in range(READ_RETRIES):
+            seq = SEQ.unpack_from(self.mm, off)[0]
+            if seq & 1:
+                continue
+            _, flags, version, ts, temp, hum, length, node = SLOT.unpack_from(self.mm, off)
+            if SEQ.unpack_from(self.mm, off)[0] == seq:
+                break
+        else:
+            return None  # writer died mid-update or is starving us; skip this slot
+        if length == 0 or seq == 0:
+            return None
+        name = node[:length & ~REMOVED].decode("utf-8")
+        return name, version, None if length & REMOVED else (ts, temp, hum, flags)
+
+    def read_since(self, since: int = 0) -> Tuple[int, Dict[str, Optional[Tuple[int, int, float, float, int]]]]:
+        """Return (table version, {node_id: (version, ts, temperature, humidity, flags)})
+        for nodes written after ``since``; nodes removed after it map to None."""
+        table_version = self.version
+        nodes = {}
+        for slot in range(self.slots):
+            off = self._offset(slot)
+            if VERSION.unpack_from(self.mm, off + _VERSION_OFF)[0] <= since:
+                continue  # cheap pre-check before the consistent read
+            entry = self._read_slot(slot)
+            if entry is not None and entry[1] > since:
+                node_id, version, row = entry
+                if row is not None:
+                    nodes[node_id] = (version,) + row
+                elif node_id not in nodes:
+                    nodes[node_id] = None  # removed (and not written again in another slot)
+        return table_version, nodes
@@ -0,0 +1,110 @@
+"""Fan-out hub behind the ``/stream`` server-sent events endpoint.
+
+Each update is encoded into an SSE frame exactly once; every subscriber's
+queue receives a reference to the same ``bytes`` object, so the cost per
+client is one queue put, not one serialization.  Publishing is thread-safe
+(sync routes run in the threadpool) and hands the frames to the event
+loop in one ``call_soon_threadsafe`` per batch.
+
+Slow clients don't hold up the others: a full queue drops its oldest
+frame and counts the drop.
+"""
+
+from typing import Dict, Iterable, Iterator, Optional, Set, Tuple
+import asyncio
+
+from fast_json import dumps
+
+QUEUE_SIZE = 256
+KEEPALIVE_INTERVAL = 5.0  # seconds between ": keep-alive" comments
+
+KEEPALIVE_FRAME = b": keep-alive\n\n"
+
+
+def encode_event(event: str, data) -> bytes:
+    return b"event: " + event.encode() + b"\ndata: " + dumps(data) + b"\n\n"
+
+
+def parse_events(lines: Iterable) -> Iterator[Tuple[str, Optional[str]]]:
+    """Turn SSE lines into (event, data) pairs; comments yield ("keepalive", None).
+
+    The client side of ``encode_event``; Frontend/live_stream.py and the Tkinter
+    app carry the same parser because each directory runs on its own.
+    """
+    event, data = "message", []
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        if not line:
+            if data:
+                yield event, "\n".join(data)
+            event, data = "message", []
+        elif line.startswith(":"):
+            yield "keepalive", None
+        elif line.startswith("event:"):
+            event = line[6:].strip()
+        elif line.startswith("data:"):
+            data.append(line[5:].lstrip())
+
+
+class Subscriber:
+    __slots__ = ("nodes", "queue", "dropped")
+
+    def __init__(self, nodes: Optional[Set[str]], queue_size: int):
+        self.nodes = nodes
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+
+    def offer(self, frame: bytes) -> None:
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(frame)
+
+
+class StreamHub:
+    def __init__(self, queue_size: int = QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.subscribers: Set[Subscriber] = set()
+        # Subscribers without a node filter, and filtered ones indexed by node id
+        self._all: Set[Subscriber] = set()
+        self._by_node: Dict[str, Set[Subscriber]] = {}
+
+    def bind(self, loop: asyncio.AbstractEventLoop) -> None:
+        self.loop = loop
+
+    def subscribe(self, nodes: Optional[Set[str]] = None) -> Subscriber:
+        sub = Subscriber(nodes, self.queue_size)
+        self.subscribers.add(sub)
+        if nodes is None:
+            self._all.add(sub)
+        else:
+            for node_id in nodes:
+                self._by_node.setdefault(node_id, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscriber) -> None:
+        self.subscribers.discard(sub)
+        self._all.discard(sub)
+        for node_id in sub.nodes or ():
+            subs = self._by_node.get(node_id)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._by_node[node_id]
+
+    def publish(self, updates: Dict[str, Dict], event: str = "update") -> None:
+        """Queue ``{node_id: record}`` updates for delivery; callable from any thread."""
+        if self.loop is None or not self.subscribers or not updates:
+            return
+        frames = [(node_id, encode_event(event, {"node_id": node_id, **record}))
+                  for node_id, record in updates.items()]
+        self.loop.call_soon_threadsafe(self._fanout, frames)
+
+    def _fanout(self, frames) -> None:
+        for node_id, frame in frames:
+            for sub in self._all:
+                sub.offer(frame)
+            for sub in self._by_node.get(node_id, ()):
+                sub.offer(frame)
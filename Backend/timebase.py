@@ -0,0 +1,142 @@
+"""Epoch-millisecond timestamps, node clock correction and edge formatting.
+
+Samples are stamped with integer epoch milliseconds on ingest and kept
+that way in every store, so they sort, compare and range-filter as plain
+integers.  Text is produced only when a response is built, in the format
+the client asked for (``?time_format=``):
+
+    local   "2025-11-11 14:03:07" in the server's time zone (default, as before)
+    iso     "2025-11-11T08:33:07.250Z", ISO 8601 in UTC
+    epoch   1762849987250, integer epoch milliseconds
+
+Nodes may send their own timestamp (seconds or milliseconds since the
+epoch).  Node clocks drift, and nodes without NTP may count from boot, so
+``ClockSkew`` estimates each node's offset from the server clock and
+shifts node timestamps onto the server timeline.  This keeps the spacing
+of buffered readings while anchoring them to server time.
+"""
+
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+import time
+
+TIME_FORMATS = ("local", "iso", "epoch")
+DEFAULT_TIME_FORMAT = "local"
+LOCAL_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Numbers at least this large are taken as milliseconds (1e11 s is the year 5138)
+MS_THRESHOLD = 100_000_000_000
+
+# Node timestamps before this (2001-09-09) count from boot, not from the epoch
+MIN_WALL_MS = 1_000_000_000_000
+
+
+def now_ms() -> int:
+    return time.time_ns() // 1_000_000
+
+
+def to_epoch_ms(value: float) -> int:
+    """Epoch seconds or milliseconds -> integer epoch milliseconds."""
+    if value >= MS_THRESHOLD:
+        return int(value)
+    return int(round(value * 1000))
+
+
+@lru_cache(maxsize=4096)
+def _local_second(seconds: int) -> str:
+    # Readings cluster on few distinct seconds, so most calls are cache hits
+    return time.strftime(LOCAL_FORMAT, time.localtime(seconds))
+
+
+def format_ts(ms: int, fmt: str = DEFAULT_TIME_FORMAT):
+    if fmt == "epoch":
+        return ms
+    if fmt == "iso":
+        seconds, millis = divmod(ms, 1000)
+        return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(seconds)) + f".{millis:03d}Z"
+    return _local_second(ms // 1000)
+
+
+def parse_time_format(fmt: Optional[str]) -> str:
+    """Validate a ``time_format`` query value; raises ValueError."""
+    if fmt is None:
+        return DEFAULT_TIME_FORMAT
+    if fmt not in TIME_FORMATS:
+        raise ValueError(f"time_format must be one of {', '.join(TIME_FORMATS)}")
+    return fmt
+
+
+class ClockSkew:
+    """Per-node estimate of (server clock - node clock).
+
+    ``received - node_ts`` is the node's clock offset plus the network and
+    queueing delay.  The delay is never negative, so the smallest offset
+    seen is the best estimate; it is allowed to creep up slowly
+    (``drift_ms_per_s``) to follow a node clock that runs slow.  Nodes whose
+    offset stays within ``tolerance_ms`` are trusted as-is.
+
+    Readings that arrive together (a batch, a datagram burst) were buffered
+    by the node, so only the newest one says anything about its clock; the
+    others are older by the time they sat in the buffer.  And a single
+    arrival can't tell a wrong clock from a long buffering delay, so the
+    correction applies only once the estimate has held across ``confirm``
+    separate arrivals.  Until then wall-clock node timestamps are kept as
+    sent and boot-relative ones (before ``MIN_WALL_MS``) get the arrival
+    time.
+    """
+
+    def __init__(self, tolerance_ms: int = 2000, drift_ms_per_s: float = 0.05, confirm: int = 3):
+        self.tolerance_ms = tolerance_ms
+        self.drift_ms_per_s = drift_ms_per_s
+        self.confirm = confirm
+        # node_id -> [offset_ms, received_ms, arrivals the offset has held for]
+        self.offsets: Dict[str, list] = {}
+
+    def observe(self, node_id: str, node_ms: int, received_ms: int) -> None:
+        """Update the offset estimate from the newest reading of one arrival."""
+        offset = received_ms - node_ms
+        state = self.offsets.get(node_id)
+        if state is None:
+            self.offsets[node_id] = [offset, received_ms, 1]
+            return
+        allowed = state[0] + (received_ms - state[1]) * self.drift_ms_per_s / 1000
+        if offset < allowed - self.tolerance_ms:
+            state[2] = 1  # the clock moved (or the old estimate was a buffering delay)
+        elif offset - allowed <= self.tolerance_ms:
+            state[2] += 1
+        state[0] = offset if offset < allowed else allowed
+        state[1] = received_ms
+
+    def correct(self, node_id: str, node_ms: int, received_ms: int) -> int:
+        """Node time -> server time, with the current estimate for the node."""
+        state = self.offsets.get(node_id)
+        if state is None or state[2] < self.confirm or abs(state[0]) <= self.tolerance_ms:
+            if node_ms < MIN_WALL_MS:
+                return received_ms
+            return min(node_ms, received_ms)
+        # Never stamp a reading later than its arrival
+        return min(node_ms + int(state[0]), received_ms)
+
+    def stamp(self, node_id: str, ts: Optional[float], received_ms: int) -> int:
+        """Timestamp for a reading: the corrected node time, or the receive time if ts is empty/0."""
+        if not ts:
+            return received_ms
+        node_ms = to_epoch_ms(ts)
+        self.observe(node_id, node_ms, received_ms)
+        return self.correct(node_id, node_ms, received_ms)
+
+    def stamp_many(self, readings: Iterable[Tuple[str, Optional[float], float, float]],
+                   received_ms: int) -> List[Tuple[str, int, float, float]]:
+        """Stamp (node_id, ts, temperature, humidity) readings received together."""
+        readings = [(node_id, to_epoch_ms(ts) if ts else 0, temp, hum) for node_id, ts, temp, hum in readings]
+        newest: Dict[str, int] = {}
+        for node_id, node_ms, _, _ in readings:
+            if node_ms > newest.get(node_id, 0):
+                newest[node_id] = node_ms
+        for node_id, node_ms in newest.items():
+            self.observe(node_id, node_ms, received_ms)
+        return [(node_id, self.correct(node_id, node_ms, received_ms) if node_ms else received_ms, temp, hum)
+                for node_id, node_ms, temp, hum in readings]
+
+    def forget(self, node_id: str) -> None:
+        self.offsets.pop(node_id, None)
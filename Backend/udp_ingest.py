@@ -0,0 +1,181 @@
+"""Optional UDP listener for binary readings (see binary_protocol.py).
+
+A datagram carries one or more 13-byte readings.  Datagrams that arrive
+in the same event loop iteration are decoded and handed to the sink
+(``record_samples``) as one batch, so a burst costs one store lock
+acquisition instead of one per reading.  The sink runs in a worker thread
+(it takes the store lock and may write the WAL); batches that arrive while
+it is busy are queued and stored together by the next call, and readings
+beyond MAX_QUEUED are dropped rather than buffered without bound.
+
+UDP may duplicate, reorder or lose datagrams.  Each node's sequence
+numbers go through a sliding window (like IPsec/DTLS replay windows):
+readings already seen are dropped as duplicates, late readings inside
+the window are still accepted, and gaps are counted as missing until the
+reading shows up.  A node whose sequence jumps back further than the
+window is assumed to have rebooted and starts a new window.  A 0 inside
+the window is treated like any other number: after a wrap it is usually
+a duplicate, and counting it as a reboot would re-admit the readings that
+follow it.
+"""
+
+from typing import Callable, Dict, List, Optional, Tuple
+import asyncio
+import logging
+
+from binary_protocol import RECORD_SIZE, decode_readings
+from timebase import now_ms
+
+logger = logging.getLogger(__name__)
+
+WINDOW = 64              # sequence numbers remembered per node
+WINDOW_MASK = (1 << WINDOW) - 1
+MAX_PENDING = 4096       # flush early once this many readings are queued
+MAX_QUEUED = 16 * MAX_PENDING  # readings waiting for the sink before new ones are dropped
+SEQ_MOD = 0x10000
+
+
+class SequenceWindow:
+    __slots__ = ("highest", "seen", "received", "duplicates", "missing")
+
+    def __init__(self, seq: int):
+        self.highest = seq
+        self.seen = 1            # bit i set: highest - i was received
+        self.received = 1
+        self.duplicates = 0
+        self.missing = 0
+
+    def accept(self, seq: int) -> bool:
+        ahead = (seq - self.highest) % SEQ_MOD
+        if 0 < ahead < SEQ_MOD // 2:
+            # Newer than anything so far; readings skipped over count as missing
+            self.missing += ahead - 1
+            self.seen = ((self.seen << ahead) | 1) & WINDOW_MASK if ahead < WINDOW else 1
+            self.highest = seq
+            self.received += 1
+            return True
+        behind = (self.highest - seq) % SEQ_MOD
+        if behind >= WINDOW:
+            # Far behind the window: the node restarted its counter
+            self.highest, self.seen = seq, 1
+            self.received += 1
+            return True
+        bit = 1 << behind
+        if self.seen & bit:
+            self.duplicates += 1
+            return False
+        # Late but new: fills a gap counted as missing earlier
+        self.seen |= bit
+        self.missing = max(0, self.missing - 1)
+        self.received += 1
+        return True
+
+
+class UdpIngest(asyncio.DatagramProtocol):
+    def __init__(self, sink: Callable[[List[Tuple[str, int, float, float]]], None],
+                 stamp: Callable[[List[Tuple[str, float, float, float]], int], List[Tuple[str, int, float, float]]]):
+        # stamp(readings with node ts or 0, received ms) -> samples with ts in epoch ms
+        self.sink = sink
+        self.stamp = stamp
+        self.windows: Dict[str, SequenceWindow] = {}
+        self.datagrams = 0
+        self.malformed = 0
+        self.rejected = 0
+        self.dropped = 0
+        self.transport: Optional[asyncio.DatagramTransport] = None
+        self._pending: List[bytes] = []
+        self._pending_records = 0
+        self._flush_scheduled = False
+        self._ready: List[List[Tuple[str, int, float, float]]] = []
+        self._ready_records = 0
+        self._writer: Optional[asyncio.Task] = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr):
+        self.datagrams += 1
+        if not data or len(data) % RECORD_SIZE:
+            self.malformed += 1
+            return
+        self._pending.append(data)
+        self._pending_records += len(data) // RECORD_SIZE
+        if self._pending_records >= MAX_PENDING:
+            self.flush()
+        elif not self._flush_scheduled:
+            # Everything received in this loop iteration goes out as one batch
+            self._flush_scheduled = True
+            asyncio.get_running_loop().call_soon(self.flush)
+
+    def error_received(self, exc):
+        logger.warning("UDP ingest socket error: %s", exc)
+
+    def flush(self):
+        self._flush_scheduled = False
+        if not self._pending:
+            return
+        pending, self._pending, self._pending_records = self._pending, [], 0
+        readings, rejected = decode_readings(b"".join(pending))
+        self.rejected += rejected
+
+        accepted = []
+        for node_id, seq, ts, temp, hum in readings:
+            window = self.windows.get(node_id)
+            if window is None:
+                self.windows[node_id] = SequenceWindow(seq)
+            elif not window.accept(seq):
+                continue
+            accepted.append((node_id, ts, temp, hum))
+        samples = self.stamp(accepted, now_ms())
+        if not samples:
+            return
+        if self._ready_records + len(samples) > MAX_QUEUED:
+            self.dropped += len(samples)
+            return
+        self._ready.append(samples)
+        self._ready_records += len(samples)
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.get_running_loop().create_task(self._drain())
+
+    async def _drain(self):
+        # One sink call at a time keeps the batches in arrival order
+        while self._ready:
+            batch = [sample for samples in self._ready for sample in samples]
+            self._ready, self._ready_records = [], 0
+            try:
+                await asyncio.to_thread(self.sink, batch)
+            except Exception:
+                logger.exception("UDP ingest: failed to store %d readings", len(batch))
+
+    async def close(self):
+        # Stop receiving, then store whatever is still queued
+        if self.transport is not None:
+            self.transport.close()
+        self.flush()
+        if self._writer is not None:
+            await self._writer
+
+    def forget(self, node_id: str) -> None:
+        self.windows.pop(node_id, None)
+
+    def stats(self) -> Dict:
+        # May be called from other threads: copy the windows in one step
+        windows = list(self.windows.items())
+        return {
+            "datagrams": self.datagrams,
+            "malformed": self.malformed,
+            "rejected": self.rejected,
+            "dropped": self.dropped,
+            "nodes": {
+                node_id: {"received": w.received, "duplicates": w.duplicates, "missing": w.missing}
+                for node_id, w in windows
+            },
+        }
+
+
+async def start_udp_ingest(sink, stamp, host: str, port: int, reuse_port: bool = False) -> UdpIngest:
+    loop = asyncio.get_running_loop()
+    _, protocol = await loop.create_datagram_endpoint(
+        lambda: UdpIngest(sink, stamp), local_addr=(host, port), reuse_port=reuse_port or None,
+    )
+    return protocol
@@ -9,9 +9,34 @@ DHT dht(DHTPIN, DHTTYPE);
 const char* ssid = "ESS";
 const char* password = "12345678";
 const char* serverName = "http://192.168.131.95:8000/update";
+const char* binaryServerName = "http://192.168.131.95:8000/update/binary";
+
+// 1 = send the 13-byte binary reading (see Backend/binary_protocol.py)
+// instead of JSON: fewer bytes on air and no string building
+#define USE_BINARY_PROTOCOL 0
 
 const char* node_id = "1"; // Change for each ESP node (e.g., "2", "3")
 
+#if USE_BINARY_PROTOCOL
+uint16_t seq = 0;
+
+// Little-endian: version, node, seq, ts (0 = server time), centi-°C, centi-%
+size_t packReading(uint8_t* buf, float temp, float hum) {
+  uint16_t node = (uint16_t) atoi(node_id);
+  int16_t t = (int16_t) lroundf(temp * 100);
+  uint16_t h = (uint16_t) lroundf(hum * 100);
+  uint32_t ts = 0;
+  buf[0] = 1;
+  buf[1] = node & 0xFF;  buf[2] = node >> 8;
+  buf[3] = seq & 0xFF;   buf[4] = seq >> 8;
+  buf[5] = ts & 0xFF;    buf[6] = (ts >> 8) & 0xFF;  buf[7] = (ts >> 16) & 0xFF;  buf[8] = ts >> 24;
+  buf[9] = t & 0xFF;     buf[10] = (uint16_t) t >> 8;
+  buf[11] = h & 0xFF;    buf[12] = h >> 8;
+  seq++;
+  return 13;
+}
+#endif
+
 void setup() {
   Serial.begin(9600);
   WiFi.begin(ssid, password);
@@ -38,12 +63,22 @@ void loop() {
     WiFiClient client;
     HTTPClient http;
 
+#if USE_BINARY_PROTOCOL
+    uint8_t packet[13];
+    size_t packetSize = packReading(packet, temp, hum);
+
+    http.begin(client, binaryServerName);
+    http.addHeader("Content-Type", "application/octet-stream");
+
+    int httpResponseCode = http.POST(packet, packetSize);
+#else
     http.begin(client, serverName);
     http.addHeader("Content-Type", "application/json");
 
     String jsonData = "{\"node_id\": \"" + String(node_id) + "\", \"temperature\": " + String(temp) + ", \"humidity\": " + String(hum) + "}";
     
     int httpResponseCode = http.POST(jsonData);
+#endif
     Serial.print("HTTP Response code: ");
     Serial.println(httpResponseCode);
 
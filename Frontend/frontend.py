@@ -17,6 +17,11 @@
 import streamlit as st
 import requests
 import time
+from functools import lru_cache
+
+from http_client import get_session
+from live_stream import follow_nodes
+from node_delta import NodeTable
 
 # --------------------------
 # Backend configuration
@@ -25,6 +30,20 @@ import time
 ## @details The frontend fetches JSON data periodically from this URL.
 BACKEND_URL = "http://localhost:8000/data"
 
+## @brief URL of the backend's server-sent events stream of node updates.
+STREAM_URL = "http://localhost:8000/stream"
+
+## @brief How the dashboard refreshes.
+#  @details "fragment" (default) re-runs only the node card fragment every
+#  REFRESH_INTERVAL seconds, fetches just the nodes that changed and redraws only
+#  their cards, so no script thread is held between refreshes. "stream" keeps the script running on the
+#  `/stream` connection (one thread per viewer). Streamlit releases older than
+#  1.37 (no `st.fragment`) always use "stream".
+REFRESH_MODE = "fragment"
+
+## @brief Seconds between two checks for node changes in "fragment" mode.
+REFRESH_INTERVAL = 2
+
 
 # --------------------------
 # Page setup
@@ -88,7 +107,7 @@ def fetch_backend_data():
     @return dict: Parsed JSON data from the server if successful, otherwise empty dictionary.
     """
     try:
-        response = requests.get(BACKEND_URL)
+        response = get_session().get(BACKEND_URL)
         if response.status_code == 200:
             return response.json()
         return {}
@@ -121,47 +140,146 @@ def get_weather_emoji(temp, hum):
     return emoji
 
 
-def render_dashboard(data):
+@lru_cache(maxsize=4096)
+def card_html(node_id, temp, hum, timestamp):
+    """!
+    @brief Build the HTML of one node card.
+    @details Cached per record, so unchanged nodes reuse the markup of the last refresh.
+    @param node_id Node identifier.
+    @param temp Temperature in Celsius.
+    @param hum Humidity in percentage.
+    @param timestamp Time of the node's last update.
+    @return str: Card HTML.
+    """
+    emoji = get_weather_emoji(temp, hum)
+    return f"""
+        <div class="weather-box">
+            <span class="emoji">{emoji}</span>
+            <h3>Node {node_id}</h3>
+            <h4>{temp:.1f}°C</h4>
+            <p>💧 {hum:.1f}% Humidity</p>
+            <small>Last update:<br>{timestamp}</small>
+        </div>
+        """
+
+
+def render_cards(data):
     """!
     @brief Render weather cards for all connected ESP nodes.
     @param data Dictionary containing node data with temperature, humidity, and timestamp.
     """
+    st.subheader("Connected ESP Nodes")
+
+    if not data:
+        st.info("Waiting for ESP nodes to send data...")
+        return
+
+    # Sort node IDs numerically
+    sorted_nodes = sorted(data.items(), key=lambda x: int(x[0]))
+    cols = st.columns(len(sorted_nodes))
+
+    for i, (node_id, node_data) in enumerate(sorted_nodes):
+        with cols[i]:
+            st.markdown(
+                card_html(node_id, node_data["temperature"], node_data["humidity"], node_data["timestamp"]),
+                unsafe_allow_html=True
+            )
+
+
+def render_dashboard(data):
+    """!
+    @brief Replace the dashboard contents with cards for `data` ("stream" mode).
+    @param data Dictionary containing node data with temperature, humidity, and timestamp.
+    """
     with placeholder.container():
-        st.subheader("Connected ESP Nodes")
-
-        if not data:
-            st.info("Waiting for ESP nodes to send data...")
-            return
-
-        # Sort node IDs numerically
-        sorted_nodes = sorted(data.items(), key=lambda x: int(x[0]))
-        cols = st.columns(len(sorted_nodes))
-
-        for i, (node_id, node_data) in enumerate(sorted_nodes):
-            temp = node_data["temperature"]
-            hum = node_data["humidity"]
-            emoji = get_weather_emoji(temp, hum)
-
-            with cols[i]:
-                st.markdown(
-                    f"""
-                    <div class="weather-box">
-                        <span class="emoji">{emoji}</span>
-                        <h3>Node {node_id}</h3>
-                        <h4>{temp:.1f}°C</h4>
-                        <p>💧 {hum:.1f}% Humidity</p>
-                        <small>Last update:<br>{node_data['timestamp']}</small>
-                    </div>
-                    """,
-                    unsafe_allow_html=True
-                )
+        render_cards(data)
+
+
+def node_table():
+    """!
+    @brief This session's NodeTable, created on first use.
+    @return NodeTable: Local copy of the backend node map.
+    """
+    table = st.session_state.get("node_table")
+    if table is None:
+        table = st.session_state["node_table"] = NodeTable(BACKEND_URL)
+    return table
+
+
+def card_slots(nodes):
+    """!
+    @brief Lay out one card slot per node and fill it ("fragment" mode).
+    @details Drawn by the full script run, outside the fragment, so the fragment can
+    replace single cards in place and leave the others untouched.
+    @param nodes Node-wise dictionary of temperature, humidity and timestamps.
+    @return dict: Node id -> `st.empty` slot holding its card.
+    """
+    st.subheader("Connected ESP Nodes")
+    if not nodes:
+        st.info("Waiting for ESP nodes to send data...")
+        return {}
+    slots = {}
+    node_ids = sorted(nodes, key=int)
+    for col, node_id in zip(st.columns(len(node_ids)), node_ids):
+        with col:
+            slots[node_id] = st.empty()
+        draw_card(slots[node_id], node_id, nodes[node_id])
+    return slots
+
+
+def draw_card(slot, node_id, node_data):
+    """!
+    @brief Replace the contents of one card slot.
+    @param slot `st.empty` slot of the node.
+    @param node_id Node identifier.
+    @param node_data Temperature, humidity and timestamp of the node.
+    """
+    slot.markdown(
+        card_html(node_id, node_data["temperature"], node_data["humidity"], node_data.get("timestamp", "N/A")),
+        unsafe_allow_html=True
+    )
+
+
+def live_node_cards(slots):
+    """!
+    @brief Fragment body for "fragment" mode: redraw only the cards that changed.
+    @details A refresh asks the backend only for the nodes written since the last one
+    (a 304 when nothing changed) and rewrites just those cards' slots. A node joining
+    or leaving changes the grid, so the whole script reruns to lay it out again.
+    @param slots Node id -> card slot, from card_slots().
+    """
+    table = node_table()
+    try:
+        changed = table.refresh()
+    except requests.exceptions.RequestException as e:
+        st.error(f"Error fetching data: {e}")
+        return
+    if table.nodes.keys() != slots.keys():
+        st.rerun()
+    for node_id in changed:
+        draw_card(slots[node_id], node_id, table.nodes[node_id])
 
 
 # --------------------------
-# Main Execution Loop
+# Main Execution
 # --------------------------
-## @brief Continuously update the dashboard every 5 seconds with backend data.
-while True:
-    data = fetch_backend_data()
-    render_dashboard(data)
-    time.sleep(5)
+## @brief Run the node card fragment on a timer, or follow the stream.
+#  @details In "stream" mode the dashboard redraws whenever the backend pushes node
+#  updates and falls back to polling every 5 seconds while the stream is unavailable
+#  (e.g. an older backend without `/stream`), then tries the stream again.
+if REFRESH_MODE == "fragment" and hasattr(st, "fragment"):
+    try:
+        node_table().refresh()
+    except requests.exceptions.RequestException as e:
+        st.error(f"Error fetching data: {e}")
+    st.fragment(run_every=REFRESH_INTERVAL)(live_node_cards)(card_slots(node_table().nodes))
+else:
+    while True:
+        try:
+            for data, changed in follow_nodes(STREAM_URL):
+                if changed:
+                    render_dashboard(data)
+        except requests.exceptions.RequestException:
+            data = fetch_backend_data()
+            render_dashboard(data)
+            time.sleep(5)
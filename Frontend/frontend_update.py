@@ -9,7 +9,8 @@
 #   - Local date and time display
 #   - A GitHub footer link for project reference
 #
-#  The application automatically refreshes every 5 seconds to ensure real-time updates.
+#  Node cards refresh every few seconds with only the nodes that changed; the weather
+#  panel and clock refresh every 5 seconds.
 #
 #  @author
 #  Anuli Jenn T
@@ -20,8 +21,16 @@
 
 import streamlit as st
 import requests
+import threading
 import time
 from datetime import datetime
+from functools import lru_cache
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from http_client import get_session, run_parallel
+from live_stream import follow_nodes
+from node_delta import NodeTable
+from weather_cache import TTLCache, normalize_city
 
 # --------------------------
 # Configuration
@@ -30,6 +39,9 @@ from datetime import datetime
 ## @brief Backend API endpoint for ESP sensor data.
 BACKEND_URL = "http://localhost:8000/data"
 
+## @brief Backend server-sent events stream of node updates.
+STREAM_URL = "http://localhost:8000/stream"
+
 ## @brief Base URL for OpenWeather public API.
 OPENWEATHER_API = "https://openweathermap.org/data/2.5/weather"
 
@@ -37,6 +49,26 @@ OPENWEATHER_API = "https://openweathermap.org/data/2.5/weather"
 #  @note Replace with your own API key for full functionality.
 OPENWEATHER_KEY = "439d4b804bc8187953eb36d2a8c26a02"
 
+## @brief Seconds an OpenWeather response is reused before it is fetched again.
+OPENWEATHER_TTL = 300
+
+## @brief Maximum number of cities kept in the shared weather cache.
+OPENWEATHER_CACHE_SIZE = 256
+
+## @brief How the dashboard refreshes.
+#  @details "fragment" (default) re-runs the node cards and the weather/clock panel
+#  as separate fragments on timers, fetching only the nodes that changed and
+#  redrawing only their cards, so no script thread is held between refreshes. "stream" keeps the script running on
+#  the `/stream` connection (one thread per viewer). Streamlit releases older than
+#  1.37 (no `st.fragment`) always use "stream".
+REFRESH_MODE = "fragment"
+
+## @brief Seconds between two checks for node changes in "fragment" mode.
+REFRESH_INTERVAL = 2
+
+## @brief Seconds between two redraws of the weather panel and clock.
+WEATHER_REFRESH_INTERVAL = 5
+
 
 # --------------------------
 # Streamlit page setup
@@ -102,22 +134,41 @@ placeholder = st.empty()
 # Helper Functions
 # --------------------------
 
+@st.cache_resource
+def get_weather_cache():
+    """!
+    @brief Weather cache shared by every session of this Streamlit server.
+    @return TTLCache: Process-wide cache keyed by normalized city name.
+    """
+    return TTLCache(ttl=OPENWEATHER_TTL, max_entries=OPENWEATHER_CACHE_SIZE)
+
+
+def request_openweather_data(city):
+    """!
+    @brief Call the OpenWeather API for one city (uncached).
+    @param city City name as string.
+    @return dict: Parsed JSON response.
+    @exception RuntimeError If the API answers with a non-200 status.
+    """
+    params = {"q": city, "appid": OPENWEATHER_KEY, "units": "metric"}
+    response = get_session().get(OPENWEATHER_API, params=params)
+    if response.status_code != 200:
+        raise RuntimeError(f"OpenWeather returned HTTP {response.status_code}")
+    return response.json()
+
+
 def fetch_openweather_data(city):
     """!
     @brief Fetch current weather data from OpenWeather API.
+    @details Served from the shared cache; concurrent sessions asking for the same
+    city share one request, and stale data is shown if a refresh fails.
     @param city City name as string.
     @return dict: Parsed JSON response containing temperature, humidity, wind, and description.
     """
     try:
-        ow_url = f"{OPENWEATHER_API}?q={city}&appid={OPENWEATHER_KEY}&units=metric"
-        response = requests.get(ow_url)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            st.error("Failed to fetch OpenWeather data.")
-            return {}
+        return get_weather_cache().get(normalize_city(city), lambda: request_openweather_data(city))
     except Exception as e:
-        st.error(f"Error fetching weather: {e}")
+        st.error(f"Failed to fetch OpenWeather data: {e}")
         return {}
 
 
@@ -127,7 +178,7 @@ def fetch_esp_data():
     @return dict: Node-wise dictionary containing temperature, humidity, and timestamps.
     """
     try:
-        response = requests.get(BACKEND_URL)
+        response = get_session().get(BACKEND_URL)
         if response.status_code == 200:
             return response.json()
         return {}
@@ -136,6 +187,21 @@ def fetch_esp_data():
         return {}
 
 
+def with_script_context(fn):
+    """!
+    @brief Wrap a callable so Streamlit calls inside it work from a worker thread.
+    @param fn Zero-argument callable that may call `st.*` (e.g. `st.error`).
+    @return Callable that attaches this session's script context, then runs `fn`.
+    """
+    ctx = get_script_run_ctx()
+
+    def run():
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return fn()
+
+    return run
+
+
 def get_weather_emoji(temp, hum):
     """!
     @brief Determine weather emoji based on temperature and humidity.
@@ -203,81 +269,210 @@ def render_footer():
     )
 
 
-# --------------------------
-# Main Execution Loop
-# --------------------------
-## @brief Continuous dashboard update loop.
-#  @details Refreshes every 5 seconds to fetch and render updated weather and ESP data.
-while True:
-    with placeholder.container():
-        cols_top = st.columns([3, 2])
-
-        # ---- Left: OpenWeather Data ----
-        with cols_top[0]:
-            ow_data = fetch_openweather_data(city)
-            if ow_data:
-                temp = ow_data["main"]["temp"]
-                hum = ow_data["main"]["humidity"]
-                wind = ow_data["wind"]["speed"]
-                desc = ow_data["weather"][0]["description"].capitalize()
-                icon = ow_data["weather"][0]["icon"]
-
-                st.markdown(
-                    f"""
-                    <div class="ow-box">
-                        <h2>🌍 Weather in {city.title()}</h2>
-                        <img src="https://openweathermap.org/img/wn/{icon}@2x.png" width="80">
-                        <h1>{temp:.1f}°C</h1>
-                        <h3>{desc}</h3>
-                        <p>💧 Humidity: {hum}%</p>
-                        <p>🌬️ Wind: {wind} m/s</p>
-                    </div>
-                    """,
-                    unsafe_allow_html=True
-                )
-
-        # ---- Right: Date and Time ----
-        with cols_top[1]:
-            now = datetime.now()
+@lru_cache(maxsize=4096)
+def card_html(node_id, temp, hum, timestamp):
+    """!
+    @brief Build the HTML of one ESP node card.
+    @details Cached per record, so unchanged nodes reuse the markup of the last refresh.
+    @param node_id Node identifier.
+    @param temp Temperature in °C.
+    @param hum Humidity percentage.
+    @param timestamp Time of the node's last update.
+    @return str: Card HTML.
+    """
+    emoji = get_weather_emoji(temp, hum)
+    return f"""
+        <div class="weather-box">
+            <span class="emoji">{emoji}</span>
+            <h3>Node {node_id}</h3>
+            <h4>{temp:.1f}°C</h4>
+            <p>💧 {hum:.1f}% Humidity</p>
+            <small>Last update:<br>{timestamp}</small>
+        </div>
+        """
+
+
+def render_weather_panel(ow_data):
+    """!
+    @brief Render the OpenWeather panel and the local date and time.
+    @param ow_data OpenWeather response for the selected city (may be empty).
+    """
+    cols_top = st.columns([3, 2])
+
+    # ---- Left: OpenWeather Data ----
+    with cols_top[0]:
+        if ow_data:
+            temp = ow_data["main"]["temp"]
+            hum = ow_data["main"]["humidity"]
+            wind = ow_data["wind"]["speed"]
+            desc = ow_data["weather"][0]["description"].capitalize()
+            icon = ow_data["weather"][0]["icon"]
+
             st.markdown(
                 f"""
                 <div class="ow-box">
-                    <h2>🕒 {now.strftime("%I:%M %p")}</h2>
-                    <h3>{now.strftime("%A, %d %B %Y")}</h3>
+                    <h2>🌍 Weather in {city.title()}</h2>
+                    <img src="https://openweathermap.org/img/wn/{icon}@2x.png" width="80">
+                    <h1>{temp:.1f}°C</h1>
+                    <h3>{desc}</h3>
+                    <p>💧 Humidity: {hum}%</p>
+                    <p>🌬️ Wind: {wind} m/s</p>
                 </div>
                 """,
                 unsafe_allow_html=True
             )
 
-        # ---- ESP Node Data ----
-        st.subheader("Connected ESP Nodes")
-        esp_data = fetch_esp_data()
-        if not esp_data:
-            st.info("Waiting for ESP nodes to send data...")
-        else:
-            sorted_nodes = sorted(esp_data.items(), key=lambda x: int(x[0]))
-            cols = st.columns(len(sorted_nodes))
-            for i, (node_id, node_data) in enumerate(sorted_nodes):
-                temp = node_data["temperature"]
-                hum = node_data["humidity"]
-                timestamp = node_data.get("timestamp", "N/A")
-                emoji = get_weather_emoji(temp, hum)
-
-                with cols[i]:
-                    st.markdown(
-                        f"""
-                        <div class="weather-box">
-                            <span class="emoji">{emoji}</span>
-                            <h3>Node {node_id}</h3>
-                            <h4>{temp:.1f}°C</h4>
-                            <p>💧 {hum:.1f}% Humidity</p>
-                            <small>Last update:<br>{timestamp}</small>
-                        </div>
-                        """,
-                        unsafe_allow_html=True
-                    )
-
-        # ---- Footer ----
+    # ---- Right: Date and Time ----
+    with cols_top[1]:
+        now = datetime.now()
+        st.markdown(
+            f"""
+            <div class="ow-box">
+                <h2>🕒 {now.strftime("%I:%M %p")}</h2>
+                <h3>{now.strftime("%A, %d %B %Y")}</h3>
+            </div>
+            """,
+            unsafe_allow_html=True
+        )
+
+
+def render_cards(esp_data):
+    """!
+    @brief Render one card per ESP node.
+    @param esp_data Node-wise dictionary of temperature, humidity and timestamps.
+    """
+    st.subheader("Connected ESP Nodes")
+    if not esp_data:
+        st.info("Waiting for ESP nodes to send data...")
+        return
+
+    sorted_nodes = sorted(esp_data.items(), key=lambda x: int(x[0]))
+    cols = st.columns(len(sorted_nodes))
+    for i, (node_id, node_data) in enumerate(sorted_nodes):
+        with cols[i]:
+            st.markdown(
+                card_html(node_id, node_data["temperature"], node_data["humidity"],
+                          node_data.get("timestamp", "N/A")),
+                unsafe_allow_html=True
+            )
+
+
+def render_dashboard(esp_data, ow_data):
+    """!
+    @brief Render the weather panel, clock, ESP node cards and footer ("stream" mode).
+    @param esp_data Node-wise dictionary of temperature, humidity and timestamps.
+    @param ow_data OpenWeather response for the selected city (may be empty).
+    """
+    with placeholder.container():
+        render_weather_panel(ow_data)
+        render_cards(esp_data)
         render_footer()
 
-    time.sleep(5)
+
+def live_weather_panel():
+    """!
+    @brief Fragment body for "fragment" mode: redraw the weather panel and clock.
+    """
+    render_weather_panel(fetch_openweather_data(city))
+
+
+def node_table():
+    """!
+    @brief This session's NodeTable, created on first use.
+    @return NodeTable: Local copy of the backend node map.
+    """
+    table = st.session_state.get("node_table")
+    if table is None:
+        table = st.session_state["node_table"] = NodeTable(BACKEND_URL)
+    return table
+
+
+def card_slots(nodes):
+    """!
+    @brief Lay out one card slot per node and fill it ("fragment" mode).
+    @details Drawn by the full script run, outside the fragment, so the fragment can
+    replace single cards in place and leave the others untouched.
+    @param nodes Node-wise dictionary of temperature, humidity and timestamps.
+    @return dict: Node id -> `st.empty` slot holding its card.
+    """
+    st.subheader("Connected ESP Nodes")
+    if not nodes:
+        st.info("Waiting for ESP nodes to send data...")
+        return {}
+    slots = {}
+    node_ids = sorted(nodes, key=int)
+    for col, node_id in zip(st.columns(len(node_ids)), node_ids):
+        with col:
+            slots[node_id] = st.empty()
+        draw_card(slots[node_id], node_id, nodes[node_id])
+    return slots
+
+
+def draw_card(slot, node_id, node_data):
+    """!
+    @brief Replace the contents of one card slot.
+    @param slot `st.empty` slot of the node.
+    @param node_id Node identifier.
+    @param node_data Temperature, humidity and timestamp of the node.
+    """
+    slot.markdown(
+        card_html(node_id, node_data["temperature"], node_data["humidity"], node_data.get("timestamp", "N/A")),
+        unsafe_allow_html=True
+    )
+
+
+def live_node_cards(slots):
+    """!
+    @brief Fragment body for "fragment" mode: redraw only the cards that changed.
+    @details A refresh asks the backend only for the nodes written since the last one
+    (a 304 when nothing changed) and rewrites just those cards' slots. A node joining
+    or leaving changes the grid, so the whole script reruns to lay it out again.
+    @param slots Node id -> card slot, from card_slots().
+    """
+    table = node_table()
+    try:
+        changed = table.refresh()
+    except requests.exceptions.RequestException as e:
+        st.error(f"Error fetching ESP data: {e}")
+        return
+    if table.nodes.keys() != slots.keys():
+        st.rerun()
+    for node_id in changed:
+        draw_card(slots[node_id], node_id, table.nodes[node_id])
+
+
+# --------------------------
+# Main Execution
+# --------------------------
+## @brief Run the dashboard fragments on timers, or follow the stream.
+#  @details In "stream" mode the dashboard redraws whenever the backend pushes node
+#  updates over `/stream`, and at least every 5 seconds (stream keep-alives) to
+#  refresh the weather and clock. It falls back to polling `/data` every 5 seconds
+#  while the stream is unavailable.
+if REFRESH_MODE == "fragment" and hasattr(st, "fragment"):
+    st.fragment(run_every=WEATHER_REFRESH_INTERVAL)(live_weather_panel)()
+    try:
+        node_table().refresh()
+    except requests.exceptions.RequestException as e:
+        st.error(f"Error fetching ESP data: {e}")
+    st.fragment(run_every=REFRESH_INTERVAL)(live_node_cards)(card_slots(node_table().nodes))
+    render_footer()
+else:
+    ow_data = {}
+    ow_fetched_at = 0.0
+    while True:
+        try:
+            for esp_data, _ in follow_nodes(STREAM_URL):
+                if time.monotonic() - ow_fetched_at >= 5:
+                    ow_data = fetch_openweather_data(city)
+                    ow_fetched_at = time.monotonic()
+                render_dashboard(esp_data, ow_data)
+        except requests.exceptions.RequestException:
+            # Polling fallback: fetch weather and node data in parallel, so a refresh
+            # takes as long as the slower request rather than the sum of both
+            ow_data, esp_data = run_parallel(
+                lambda: fetch_openweather_data(city), fetch_esp_data, wrap=with_script_context
+            )
+            ow_fetched_at = time.monotonic()
+            render_dashboard(esp_data, ow_data)
+            time.sleep(5)
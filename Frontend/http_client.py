@@ -0,0 +1,96 @@
+## @file http_client.py
+#  @brief Shared HTTP client for the dashboards: pooled keep-alive sessions,
+#  default timeouts and retry with exponential backoff.
+#  @details
+#  Bare `requests.get()` opens a new TCP connection for every poll and waits forever
+#  on a hung server. The session returned by get_session() is shared by all
+#  Streamlit sessions of the process, keeps connections alive per host, applies a
+#  default (connect, read) timeout and retries idempotent requests on connection
+#  errors and 429/5xx responses.
+#
+#  @author
+#  Praveenraj R S
+#  @date
+#  2025-11-11
+#  @version
+#  1.0
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+## @brief Default (connect, read) timeout in seconds.
+DEFAULT_TIMEOUT = (3.05, 10)
+
+## @brief Retries for failed GETs, and the backoff factor between them (0.3s, 0.6s, ...).
+RETRIES = 3
+BACKOFF = 0.3
+
+## @brief Connections kept alive per host.
+POOL_SIZE = 32
+
+_session = None
+_executor = None
+_lock = threading.Lock()
+
+
+class TimeoutSession(requests.Session):
+    """!
+    @brief `requests.Session` that applies DEFAULT_TIMEOUT unless a timeout is given.
+    """
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+        return super().request(method, url, **kwargs)
+
+
+def create_session():
+    """!
+    @brief Build a pooled session with retry and backoff.
+    @return TimeoutSession: New session (prefer get_session() to share one).
+    """
+    retry = Retry(
+        total=RETRIES,
+        backoff_factor=BACKOFF,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({"GET", "HEAD"}),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=8, pool_maxsize=POOL_SIZE)
+    session = TimeoutSession()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_session():
+    """!
+    @brief Process-wide shared session.
+    @return TimeoutSession: The shared session, created on first use.
+    """
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = create_session()
+    return _session
+
+
+def run_parallel(*calls, wrap=None):
+    """!
+    @brief Run zero-argument callables concurrently on a shared thread pool.
+    @param calls Callables to run.
+    @param wrap Optional function applied to each callable before submitting
+           (e.g. to attach the Streamlit script context to worker threads).
+    @return list: Results in the order of `calls`; exceptions are re-raised.
+    """
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="dashboard-fetch")
+    futures = [_executor.submit(wrap(call) if wrap else call) for call in calls]
+    return [future.result() for future in futures]
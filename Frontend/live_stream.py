@@ -0,0 +1,86 @@
+## @file live_stream.py
+#  @brief Client for the backend's `/stream` server-sent events endpoint.
+#  @details
+#  Replaces the dashboards' 5-second polling of `GET /data`: the backend sends one
+#  snapshot of all nodes, then only the node records that changed. This module keeps
+#  the merged node map and hands it to the dashboard whenever it should be redrawn.
+#
+#  @author
+#  Praveenraj R S
+#  @date
+#  2025-11-11
+#  @version
+#  1.0
+
+import json
+import time
+
+from http_client import get_session
+
+## @brief Connect/read timeouts for the stream (seconds).
+#  @details The backend sends a keep-alive comment every 5 seconds, so a read
+#  that stays silent for 30 seconds means the connection is dead.
+STREAM_TIMEOUT = (5, 30)
+
+
+def iter_events(response):
+    """!
+    @brief Parse a server-sent events response into (event, data) pairs.
+    @details The one SSE parser of the Streamlit dashboards (both use it through
+    follow_nodes). Backend/stream_hub.py and the Tkinter app keep the same few lines,
+    since each directory runs on its own.
+    @param response Streaming `requests` response.
+    @return Generator of (event name, data string); keep-alive comments yield ("keepalive", None).
+    """
+    event, data = "message", []
+    for line in response.iter_lines(decode_unicode=True):
+        if not line:
+            if data:
+                yield event, "\n".join(data)
+            event, data = "message", []
+        elif line.startswith(":"):
+            yield "keepalive", None
+        elif line.startswith("event:"):
+            event = line[6:].strip()
+        elif line.startswith("data:"):
+            data.append(line[5:].lstrip())
+
+
+def follow_nodes(stream_url, nodes=None, min_interval=1.0):
+    """!
+    @brief Follow live node updates from the backend.
+    @param stream_url URL of the backend `/stream` endpoint.
+    @param nodes Optional list of node ids to subscribe to (default: all nodes).
+    @param min_interval Minimum seconds between two yields that carry changes, so
+           bursts of updates are coalesced into one redraw.
+    @return Generator of (node map, changed) tuples. `changed` is False when the
+            yield only marks a keep-alive (useful to refresh clocks or weather).
+    @exception requests.exceptions.RequestException When the stream cannot be opened
+               or the connection drops; callers fall back to polling.
+    """
+    params = {"nodes": ",".join(nodes)} if nodes else None
+    with get_session().get(stream_url, params=params, stream=True, timeout=STREAM_TIMEOUT) as response:
+        response.raise_for_status()
+        data = {}
+        pending = False
+        last_yield = 0.0
+        for event, payload in iter_events(response):
+            if event == "snapshot":
+                data = json.loads(payload)
+                pending = True
+            elif event == "update":
+                record = json.loads(payload)
+                data[record.pop("node_id")] = record
+                pending = True
+            elif event == "remove":
+                # The backend dropped a node that stayed silent too long
+                data.pop(json.loads(payload)["node_id"], None)
+                pending = True
+
+            now = time.monotonic()
+            if pending and now - last_yield >= min_interval:
+                pending = False
+                last_yield = now
+                yield data, True
+            elif event == "keepalive":
+                yield data, False
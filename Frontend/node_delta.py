@@ -0,0 +1,73 @@
+## @file node_delta.py
+#  @brief Incremental client for the backend's versioned `GET /data` endpoint.
+#  @details
+#  The backend tags `/data` with the store version (`ETag` / `X-Data-Version`),
+#  answers `If-None-Match` with 304 when nothing changed, and returns only the nodes
+#  written after a version for `?since=<version>` (nodes the backend dropped after
+#  going silent come back as null). NodeTable keeps one session's
+#  copy of the node map and applies those deltas, so a refresh costs a 304 when
+#  nothing changed and one small JSON object per changed node otherwise.
+#
+#  @author
+#  Praveenraj R S
+#  @date
+#  2025-11-11
+#  @version
+#  1.0
+
+from http_client import get_session
+
+
+class NodeTable:
+    """!
+    @brief Local copy of the backend node map, kept current with version deltas.
+    """
+
+    def __init__(self, data_url):
+        """!
+        @brief Create an empty table.
+        @param data_url URL of the backend `/data` endpoint.
+        """
+        self.data_url = data_url
+        self.version = None
+        self.nodes = {}
+
+    def refresh(self):
+        """!
+        @brief Fetch what changed since the last refresh and merge it in.
+        @return set: Ids of the nodes whose record changed (empty if nothing did).
+        @exception requests.exceptions.RequestException When the backend is unreachable.
+        """
+        if self.version is None:
+            response = get_session().get(self.data_url)
+        else:
+            response = get_session().get(
+                self.data_url,
+                params={"since": self.version},
+                headers={"If-None-Match": f'"{self.version}"'},
+            )
+        if response.status_code == 304:
+            return set()
+        response.raise_for_status()
+
+        version = response.headers.get("X-Data-Version")
+        version = int(version) if version is not None else None
+        if self.version is not None and version is not None and version < self.version:
+            # The backend restarted and its counter went backwards: resync
+            self.version = None
+            return self.refresh()
+
+        delta = response.json()
+        changed = {node_id for node_id, record in delta.items() if self.nodes.get(node_id) != record}
+        if self.version is None or version is None:
+            # Full snapshot (first fetch, or a backend without versions)
+            changed |= self.nodes.keys() - delta.keys()
+            self.nodes = delta
+        else:
+            for node_id, record in delta.items():
+                if record is None:
+                    self.nodes.pop(node_id, None)
+                else:
+                    self.nodes[node_id] = record
+        self.version = version
+        return changed
@@ -0,0 +1,118 @@
+## @file weather_cache.py
+#  @brief Process-wide TTL cache with request coalescing for OpenWeather lookups.
+#  @details
+#  Streamlit re-runs the dashboard script once per browser session, so without a
+#  shared cache every open session calls OpenWeather for its city every refresh.
+#  This cache is shared by all sessions of the server process:
+#   - entries are keyed by normalized city name and expire after a TTL
+#   - the least recently used city is evicted once the cache is full
+#   - concurrent lookups of the same city share one in-flight request
+#   - if a refresh fails, the last good (stale) value is served
+#
+#  Outbound calls then scale with the number of distinct cities, not viewers.
+#
+#  @author
+#  Anuli Jenn T
+#  @date
+#  2025-11-11
+#  @version
+#  1.0
+
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_city(city):
+    """!
+    @brief Normalize a city name into a cache key.
+    @param city City name as typed by the user.
+    @return str: Lower-cased name with collapsed whitespace.
+    """
+    return " ".join(city.split()).casefold()
+
+
+class _Entry:
+    """!
+    @brief Cached value for one key, plus the in-flight refresh (if any).
+    """
+
+    __slots__ = ("value", "fetched_at", "loading", "error")
+
+    def __init__(self):
+        self.value = None
+        self.fetched_at = None
+        self.loading = None
+        self.error = None
+
+
+class TTLCache:
+    """!
+    @brief Thread-safe TTL + LRU cache that coalesces concurrent loads.
+    """
+
+    def __init__(self, ttl=300.0, max_entries=256, retry_after=30.0):
+        """!
+        @brief Create an empty cache.
+        @param ttl Seconds a fetched value stays fresh.
+        @param max_entries Maximum number of keys kept (least recently used evicted).
+        @param retry_after Seconds to keep serving a stale value before retrying a failed refresh.
+        """
+        self.ttl = ttl
+        self.retry_after = retry_after
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, loader):
+        """!
+        @brief Return a fresh value for `key`, calling `loader()` at most once per TTL.
+        @param key Cache key (use normalize_city() for cities).
+        @param loader Zero-argument callable that fetches the value or raises.
+        @return The cached or freshly loaded value; a stale value if the refresh failed.
+        @exception Exception Re-raised from `loader` only when no value was ever cached.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry()
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            self._entries.move_to_end(key)
+
+            if entry.fetched_at is not None and time.monotonic() - entry.fetched_at < self.ttl:
+                return entry.value
+
+            # Another session is already fetching this key: wait for it
+            waiter = entry.loading
+            if waiter is None:
+                entry.loading = threading.Event()
+
+        if waiter is not None:
+            waiter.wait()
+            with self._lock:
+                if entry.value is None and entry.error is not None:
+                    raise entry.error
+                return entry.value
+
+        try:
+            value = loader()
+        except Exception as e:
+            with self._lock:
+                entry.error = e
+                if entry.value is not None:
+                    # Back off: keep the stale value "fresh" for retry_after seconds
+                    entry.fetched_at = time.monotonic() - self.ttl + self.retry_after
+                done, entry.loading = entry.loading, None
+            done.set()
+            if entry.value is not None:
+                return entry.value  # serve stale data while upstream is failing
+            raise
+
+        with self._lock:
+            entry.value = value
+            entry.error = None
+            entry.fetched_at = time.monotonic()
+            done, entry.loading = entry.loading, None
+        done.set()
+        return value
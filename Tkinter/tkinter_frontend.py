@@ -2,10 +2,52 @@ import tkinter as tk
 from tkinter import ttk
 import threading
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import json
 import time
+from bisect import bisect_left, insort
 
 BACKEND_URL = "http://10.11.129.142:8000/data"
-POLL_INTERVAL_MS = 5000  # 5 seconds
+STREAM_URL = "http://10.11.129.142:8000/stream"
+POLL_INTERVAL_MS = 5000  # 5 seconds; shortest poll interval
+MAX_POLL_INTERVAL_MS = 60000  # longest interval when the backend is slow or down
+LATENCY_FACTOR = 10  # poll no more often than every 10x the average fetch latency
+STREAM_RETRY_S = 10  # wait before reconnecting a dropped stream
+REQUEST_TIMEOUT = (3.05, 4)  # (connect, read) seconds
+CARD_COLUMNS = 3
+CARD_HEIGHT = 150  # px per grid row; fixed so rows are placed without measuring
+CARD_PAD = 8
+
+
+def create_session():
+    # Keep-alive connection pool shared by the poll and stream threads;
+    # GETs are retried with backoff on connection errors and 429/5xx.
+    # Same policy as Frontend/http_client.py: each directory is run on its
+    # own (often on different machines), so the few lines are kept here
+    # rather than imported across directories
+    retry = Retry(total=3, backoff_factor=0.3, status_forcelist=(429, 500, 502, 503, 504),
+                  allowed_methods=frozenset({"GET"}), raise_on_status=False)
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(max_retries=retry, pool_maxsize=4))
+    session.mount("https://", HTTPAdapter(max_retries=retry, pool_maxsize=4))
+    return session
+
+def iter_events(lines):
+    # Server-sent event lines -> (event, data) pairs; comments yield ("keepalive", None).
+    # The parser of Frontend/live_stream.py, copied for the same reason as above
+    event, data = "message", []
+    for line in lines:
+        if not line:
+            if data:
+                yield event, "\n".join(data)
+            event, data = "message", []
+        elif line.startswith(":"):
+            yield "keepalive", None
+        elif line.startswith("event:"):
+            event = line[6:].strip()
+        elif line.startswith("data:"):
+            data.append(line[5:].lstrip())
 
 class NodeCard(ttk.Frame):
     def __init__(self, parent, node_id):
@@ -36,7 +78,20 @@ class NodeCard(ttk.Frame):
         for i in range(2):
             self.columnconfigure(i, weight=1)
 
+        self._shown = None
+
+    def show_node(self, node_id):
+        # Re-bind a pooled card to another node
+        if node_id != self.node_id:
+            self.node_id = node_id
+            self.title.config(text=f"Node {node_id}")
+            self._shown = None
+
     def update_values(self, node_data: dict):
+        # Recycled cards are refreshed often; skip the widget calls when nothing changed
+        if node_data == self._shown:
+            return
+        self._shown = node_data
         try:
             t = node_data.get("temperature", None)
             h = node_data.get("humidity", None)
@@ -51,6 +106,109 @@ class NodeCard(ttk.Frame):
             self.hum_val.config(text="--")
             self.ts.config(text=f"Last update: error: {e}")
 
+class NodeGrid:
+    """Scrollable card grid that only materializes the cards in the viewport.
+
+    Node ids are kept sorted and a small pool of NodeCard widgets is re-bound
+    to whichever nodes are visible, so the widget count depends on the window
+    size, not on the number of nodes.  Value updates touch only the visible
+    cards of the nodes that changed.
+    """
+
+    def __init__(self, parent):
+        self.canvas = tk.Canvas(parent, highlightthickness=0)
+        self.scrollbar = ttk.Scrollbar(parent, orient="vertical", command=self.canvas.yview)
+        self.canvas.configure(yscrollcommand=self._on_yview)
+
+        self.data = {}      # node_id -> latest record
+        self.order = []     # sorted node ids
+        self.visible = {}   # node_id -> (card, canvas item) currently shown
+        self.free = []      # pooled (card, canvas item) not in view
+        self._scrollregion = None
+        self._layout_scheduled = False
+
+        self.canvas.bind("<Configure>", lambda e: self.schedule_layout())
+        # Wheel events land on the cards, so bind them application-wide
+        self.canvas.bind_all("<MouseWheel>", lambda e: self._scroll(-1 if e.delta > 0 else 1))
+        self.canvas.bind_all("<Button-4>", lambda e: self._scroll(-1))
+        self.canvas.bind_all("<Button-5>", lambda e: self._scroll(1))
+
+    def pack(self):
+        self.canvas.pack(side="left", fill="both", expand=True, padx=(16,0), pady=(0,16))
+        self.scrollbar.pack(side="right", fill="y", padx=(0,16), pady=(0,16))
+
+    def apply(self, changed: dict, removed=()):
+        # Merge changed records and drop removed nodes; only the visible
+        # cards of changed nodes are touched
+        structural = False
+        for node_id in removed:
+            if self.data.pop(node_id, None) is not None:
+                del self.order[bisect_left(self.order, node_id)]
+                structural = True
+        for node_id, record in changed.items():
+            if node_id not in self.data:
+                insort(self.order, node_id)
+                structural = True
+            self.data[node_id] = record
+            entry = self.visible.get(node_id)
+            if entry is not None and not structural:
+                entry[0].update_values(record)
+        if structural:
+            # Positions shifted: re-bind the cards in view (cost ~ visible cards)
+            self.schedule_layout()
+
+    def schedule_layout(self):
+        if not self._layout_scheduled:
+            self._layout_scheduled = True
+            self.canvas.after_idle(self.layout)
+
+    def layout(self):
+        self._layout_scheduled = False
+        width = max(self.canvas.winfo_width(), 1)
+        col_width = width // CARD_COLUMNS
+        rows = -(-len(self.order) // CARD_COLUMNS)
+        region = (0, 0, width, rows * CARD_HEIGHT)
+        if region != self._scrollregion:
+            self._scrollregion = region
+            self.canvas.configure(scrollregion=region)
+
+        top = self.canvas.canvasy(0)
+        bottom = top + self.canvas.winfo_height()
+        first = max(0, int(top // CARD_HEIGHT)) * CARD_COLUMNS
+        last = min(len(self.order), (int(bottom // CARD_HEIGHT) + 1) * CARD_COLUMNS)
+        wanted = {self.order[i]: i for i in range(first, last)}
+
+        # Return cards that scrolled out of view to the pool
+        for node_id in [n for n in self.visible if n not in wanted]:
+            card, item = self.visible.pop(node_id)
+            self.canvas.itemconfigure(item, state="hidden")
+            self.free.append((card, item))
+
+        for node_id, idx in wanted.items():
+            entry = self.visible.get(node_id)
+            if entry is None:
+                entry = self.free.pop() if self.free else self._new_card()
+                entry[0].show_node(node_id)
+                self.canvas.itemconfigure(entry[1], state="normal")
+                self.visible[node_id] = entry
+            row, col = divmod(idx, CARD_COLUMNS)
+            self.canvas.coords(entry[1], col * col_width + CARD_PAD, row * CARD_HEIGHT + CARD_PAD)
+            self.canvas.itemconfigure(entry[1], width=col_width - 2 * CARD_PAD,
+                                      height=CARD_HEIGHT - 2 * CARD_PAD)
+            entry[0].update_values(self.data[node_id])
+
+    def _new_card(self):
+        card = NodeCard(self.canvas, None)
+        item = self.canvas.create_window(0, 0, window=card, anchor="nw")
+        return card, item
+
+    def _on_yview(self, first, last):
+        self.scrollbar.set(first, last)
+        self.schedule_layout()
+
+    def _scroll(self, units):
+        self.canvas.yview_scroll(units, "units")
+
 class App(tk.Tk):
     def __init__(self):
         super().__init__()
@@ -75,114 +233,178 @@ class App(tk.Tk):
         self.info_label = ttk.Label(self, textvariable=self.info_var, foreground="#555")
         self.info_label.pack(anchor="w", padx=16, pady=(0, 8))
 
-        # Scrollable canvas for cards (in case there are many nodes)
-        self.canvas = tk.Canvas(self, highlightthickness=0)
-        self.cards_frame = ttk.Frame(self.canvas)
-        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.canvas.yview)
-        self.canvas.configure(yscrollcommand=self.scrollbar.set)
-
-        self.canvas.pack(side="left", fill="both", expand=True, padx=(16,0), pady=(0,16))
-        self.scrollbar.pack(side="right", fill="y", padx=(0,16), pady=(0,16))
-
-        # Create window inside canvas
-        self.canvas_window = self.canvas.create_window((0, 0), window=self.cards_frame, anchor="nw")
-
-        # Auto-resize the inner frame width to the canvas width
-        self.cards_frame.bind("<Configure>", self._on_frame_configure)
-        self.canvas.bind("<Configure>", self._on_canvas_configure)
+        # Scrollable, virtualized grid of cards (only visible nodes get widgets)
+        self.grid_view = NodeGrid(self)
 
         # Status bar
         self.status_var = tk.StringVar(value="Ready")
         status = ttk.Label(self, textvariable=self.status_var, anchor="w", relief="sunken")
         status.pack(side="bottom", fill="x")
-
-        # Node widgets cache
-        self.node_cards = {}
-
-        # Start polling
+        self.grid_view.pack()
+
+        # Stream updates waiting for the UI thread
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._flush_scheduled = False
+        self._streaming = False
+        self.session = create_session()
+
+        # Polling state: one fetch worker, woken by ticks; responses carry a
+        # sequence number so an older one never replaces newer data
+        self._poll_tick = threading.Event()
+        self._poll_seq = 0
+        self._applied_seq = 0
+        self._poll_interval_ms = POLL_INTERVAL_MS
+        self._latency = None
+
+        # Live updates from /stream; polling only runs while the stream is down
         self._stop = False
+        threading.Thread(target=self.stream_updates, daemon=True).start()
+        threading.Thread(target=self.poll_worker, daemon=True).start()
         self.after(0, self.schedule_poll)
 
         # Clean shutdown
         self.protocol("WM_DELETE_WINDOW", self.on_close)
 
-    # Keep inner frame width in sync with canvas width
-    def _on_canvas_configure(self, event):
-        self.canvas.itemconfig(self.canvas_window, width=event.width)
-
-    def _on_frame_configure(self, event):
-        self.canvas.configure(scrollregion=self.canvas.bbox("all"))
-
     def on_close(self):
         self._stop = True
+        self._poll_tick.set()
         self.destroy()
 
     def schedule_poll(self):
         if self._stop:
             return
-        # Run network request off the main thread
-        threading.Thread(target=self.fetch_and_update, daemon=True).start()
+        # Wake the fetch worker; ticks that arrive while a fetch is still in
+        # flight collapse into a single follow-up fetch
+        if not self._streaming:
+            self._poll_tick.set()
         # Schedule next poll
-        self.after(POLL_INTERVAL_MS, self.schedule_poll)
+        self.after(self._poll_interval_ms, self.schedule_poll)
+
+    def poll_worker(self):
+        # Single long-lived thread running the network requests off the main thread
+        while True:
+            self._poll_tick.wait()
+            if self._stop:
+                return
+            self._poll_tick.clear()
+            self.fetch_and_update()
 
     def fetch_and_update(self):
+        self._poll_seq += 1
+        seq = self._poll_seq
         start = time.time()
+        data = None
         try:
-            r = requests.get(BACKEND_URL, timeout=4)
+            r = self.session.get(BACKEND_URL, timeout=REQUEST_TIMEOUT)
             if r.status_code == 200:
                 data = r.json()
             else:
-                data = {}
                 self._set_status(f"Warning: HTTP {r.status_code}")
         except Exception as e:
-            data = {}
             self._set_status(f"Error fetching data: {e}")
+        self._adapt_interval(time.time() - start, data is not None)
+
+        # Push UI updates back to main thread; failed polls keep the last data
+        if data is not None:
+            self.after(0, lambda: self._apply_poll(seq, data, start))
+
+    def _adapt_interval(self, latency: float, ok: bool):
+        # Average fetch latency (EWMA); a slow backend is polled less often,
+        # a failing one backs off exponentially
+        self._latency = latency if self._latency is None else 0.8 * self._latency + 0.2 * latency
+        if ok:
+            interval = max(POLL_INTERVAL_MS, LATENCY_FACTOR * self._latency * 1000)
+        else:
+            interval = self._poll_interval_ms * 2
+        self._poll_interval_ms = int(min(MAX_POLL_INTERVAL_MS, interval))
 
-        # Push UI updates back to main thread
-        self.after(0, lambda: self.update_ui(data, start))
+    def _apply_poll(self, seq: int, data: dict, started_at: float):
+        # Drop responses older than what is already shown
+        if seq <= self._applied_seq:
+            return
+        self._applied_seq = seq
+        self.update_ui(data, started_at)
+
+    def stream_updates(self):
+        # Background thread: follow server-sent events, fall back to polling on errors
+        while not self._stop:
+            try:
+                with self.session.get(STREAM_URL, stream=True, timeout=(4, 30)) as r:
+                    r.raise_for_status()
+                    self._streaming = True
+                    self._set_status("Live stream connected")
+                    for event, data in iter_events(r.iter_lines(decode_unicode=True)):
+                        if self._stop:
+                            return
+                        if event == "snapshot":
+                            self._queue_updates(json.loads(data), replace=True)
+                        elif event == "update":
+                            payload = json.loads(data)
+                            self._queue_updates({payload.pop("node_id"): payload})
+                        elif event == "remove":
+                            # None marks a node the backend dropped
+                            self._queue_updates({json.loads(data)["node_id"]: None})
+            except Exception as e:
+                self._set_status(f"Stream unavailable ({e}); polling every {POLL_INTERVAL_MS // 1000}s")
+            self._streaming = False
+            time.sleep(STREAM_RETRY_S)
+
+    def _queue_updates(self, updates: dict, replace: bool = False):
+        # Coalesce bursts of stream events into a single UI refresh
+        with self._pending_lock:
+            if replace:
+                self._pending = {"__snapshot__": updates}
+            else:
+                self._pending.update(updates)
+            if self._flush_scheduled:
+                return
+            self._flush_scheduled = True
+        self.after(0, self._flush_updates)
+
+    def _flush_updates(self):
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+            self._flush_scheduled = False
+        started = time.time()
+        # Stream data is newer than any poll still in flight
+        self._applied_seq = self._poll_seq
+        snapshot = pending.pop("__snapshot__", None)
+        removed = [node_id for node_id, record in pending.items() if record is None]
+        changed = {node_id: record for node_id, record in pending.items() if record is not None}
+        if snapshot is not None:
+            snapshot.update(changed)
+            for node_id in removed:
+                snapshot.pop(node_id, None)
+            self.update_ui(snapshot, started)
+        else:
+            self.apply_changes(changed, removed, started)
+        self.status_var.set(f"Live • last update {time.strftime('%H:%M:%S')}")
 
     def _set_status(self, text):
         # Update status in main thread safely
         self.after(0, lambda: self.status_var.set(text))
 
     def update_ui(self, data: dict, started_at: float):
+        # Full node map (poll or stream snapshot): diff it against what is shown
+        current = self.grid_view.data
+        changed = {node_id: record for node_id, record in data.items() if current.get(node_id) != record}
+        removed = [node_id for node_id in current if node_id not in data]
+        self.apply_changes(changed, removed, started_at)
+
+    def apply_changes(self, changed: dict, removed, started_at: float):
+        self.grid_view.apply(changed, removed)
+
         # Info line
-        if not data:
+        count = len(self.grid_view.data)
+        if not count:
             self.info_var.set("Waiting for ESP nodes to send data...")
         else:
-            self.info_var.set(f"Connected: {len(data)} node(s)")
-
-        # Build / update cards
-        existing_ids = set(self.node_cards.keys())
-        current_ids = set(data.keys())
-
-        # Remove cards for nodes that disappeared
-        for removed_id in existing_ids - current_ids:
-            self.node_cards[removed_id].destroy()
-            del self.node_cards[removed_id]
-
-        # Create or update cards for current nodes
-        # Layout as a responsive grid (wrap every 3 columns)
-        max_cols = 3
-        for idx, node_id in enumerate(sorted(current_ids)):
-            row = idx // max_cols
-            col = idx % max_cols
-
-            if node_id not in self.node_cards:
-                card = NodeCard(self.cards_frame, node_id)
-                self.node_cards[node_id] = card
-                card.grid(row=row, column=col, padx=8, pady=8, sticky="nsew")
-
-            # Update values
-            self.node_cards[node_id].update_values(data.get(node_id, {}))
-
-        # Configure grid weights for responsiveness
-        for c in range(3):
-            self.cards_frame.columnconfigure(c, weight=1)
+            self.info_var.set(f"Connected: {count} node(s)")
 
         # Update status timing
         elapsed = (time.time() - started_at) * 1000.0
-        self.status_var.set(f"Last refresh OK • {elapsed:.0f} ms")
+        self.status_var.set(f"Last refresh OK • {len(changed)} changed • {elapsed:.0f} ms")
 
 def main():
     app = App()